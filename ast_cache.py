@@ -0,0 +1,230 @@
+import hashlib
+import os
+import pickle
+from ast_nodes import Node, walk
+
+# Bump when the AST layout changes in a way that source hashing can't see
+COMPILER_VERSION = "0.1.0"
+
+# Files whose contents decide what tree a given source parses to (and how it's stored)
+_COMPILER_SOURCES = ("lexer.py", "parser.py", "ast_nodes.py", "ast_cache.py")
+
+_MAGIC = b"MYCCAST2"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mycc")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+_SIZE_FILE = "size"  # running total of entry bytes, so a store needn't walk the cache
+_EVICT_TO = 0.75  # eviction frees down to this share of max_bytes, so it runs rarely
+
+_fingerprints = {}
+
+def compiler_fingerprint(sources=_COMPILER_SOURCES):
+    # hash of version + compiler sources, so any compiler upgrade invalidates old entries
+    if sources not in _fingerprints:
+        h = hashlib.sha256(COMPILER_VERSION.encode())
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in sources:
+            try:
+                with open(os.path.join(here, name), "rb") as f:
+                    h.update(f.read())
+            except OSError:
+                h.update(name.encode())
+        _fingerprints[sources] = h.hexdigest()
+    return _fingerprints[sources]
+
+# ---------------- Tree serialization ----------------
+# pickle recurses once per nesting level, which deep trees (a + b + c + ... is a
+# left spine of BinOps) overflow. Those are stored as a flat list of
+# (class, attributes) instead, with child nodes replaced by their list index;
+# everything else stays a plain pickle, which loads faster.
+_MAX_PICKLE_DEPTH = 200
+
+class _Ref(int):
+    pass
+
+def tree_depth(tree):
+    depth, stack = 0, [(tree, 1)]
+    while stack:
+        node, d = stack.pop()
+        depth = max(depth, d)
+        for value in vars(node).values():
+            if isinstance(value, Node):
+                stack.append((value, d + 1))
+            elif isinstance(value, list):
+                stack.extend((v, d + 1) for v in value if isinstance(v, Node))
+    return depth
+
+def dump_tree(tree):
+    if tree_depth(tree) <= _MAX_PICKLE_DEPTH:
+        return b"P" + pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL)
+    nodes = list(walk(tree))
+    index = {id(n): k for k, n in enumerate(nodes)}
+
+    def ref(value):
+        if isinstance(value, Node):
+            return _Ref(index[id(value)])
+        if isinstance(value, list):
+            return [_Ref(index[id(v)]) if isinstance(v, Node) else v for v in value]
+        return value
+    flat = [(type(n), {name: ref(value) for name, value in vars(n).items()}) for n in nodes]
+    return b"F" + pickle.dumps(flat, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_tree(data):
+    data = memoryview(data)
+    if data[:1] == b"P":
+        return pickle.loads(data[1:])  # unpickling doesn't recurse
+    flat = pickle.loads(data[1:])
+    nodes = [cls.__new__(cls) for cls, _ in flat]
+
+    def resolve(value):
+        if isinstance(value, _Ref):
+            return nodes[value]
+        if isinstance(value, list):
+            return [nodes[v] if isinstance(v, _Ref) else v for v in value]
+        return value
+    for node, (_, state) in zip(nodes, flat):
+        node.__dict__.update({name: resolve(value) for name, value in state.items()})
+    return nodes[0]
+
+class ASTCache:
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or os.environ.get("MYCC_CACHE_DIR") or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    # ---------------- Keys ----------------
+    def key(self, code, optimized=False):
+        h = hashlib.sha256(compiler_fingerprint().encode())
+        h.update(b"O1" if optimized else b"O0")
+        h.update(code.encode("utf8"))
+        return h.hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".ast")
+
+    # ---------------- Load / Store ----------------
+    def load(self, code, optimized=False):
+        path = self.path_for(self.key(code, optimized))
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        if not data.startswith(_MAGIC):
+            self._remove(path)
+            self.misses += 1
+            return None
+        try:
+            tree = load_tree(data[len(_MAGIC):])
+        except Exception:
+            # corrupt or written by an incompatible compiler: drop it
+            self._remove(path)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # keep recently used entries out of eviction
+        except OSError:
+            pass
+        self.hits += 1
+        return tree
+
+    def store(self, code, tree, optimized=False):
+        path = self.path_for(self.key(code, optimized))
+        try:
+            data = _MAGIC + dump_tree(tree)
+        except (RecursionError, pickle.PicklingError):
+            return False  # not worth failing the run over: just don't cache it
+        if len(data) > self.max_bytes:
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)  # atomic, so concurrent runs never see half a file
+        total = self.recorded_size() + len(data) - replaced
+        if total > self.max_bytes:
+            total = self.evict()
+        self.record_size(total)
+        return True
+
+    # ---------------- Size limit ----------------
+    def entries(self):
+        result = []
+        if not os.path.isdir(self.cache_dir):
+            return result
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".ast"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                result.append((st.st_mtime, st.st_size, path))
+        return result
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    # The total is kept in a file next to the entries and only re-measured when
+    # it is missing or eviction walks the cache anyway. Concurrent runs can lose
+    # each other's updates; that drift lasts until the next eviction.
+    def recorded_size(self):
+        try:
+            with open(os.path.join(self.cache_dir, _SIZE_FILE)) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return self.size()
+
+    def record_size(self, total):
+        path = os.path.join(self.cache_dir, _SIZE_FILE)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(str(total))
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def evict(self):
+        # least recently used entries go first; returns the bytes left
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return total
+        for _, size, path in entries:
+            if total <= self.max_bytes * _EVICT_TO:
+                break
+            self._remove(path)
+            total -= size
+        return total
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self._remove(path)
+        self.record_size(0)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# ---------------- Frontend with cache ----------------
+def parse_source(code, cache=None):
+    from lexer import lex
+    from parser import Parser
+    if cache is not None:
+        tree = cache.load(code)
+        if tree is not None:
+            return tree
+    tree = Parser(lex(code)).parse()
+    if cache is not None:
+        cache.store(code, tree)
+    return tree
@@ -1,5 +1,6 @@
 # =================== AST NODES ===================
-class Node: pass
+class Node:
+    line = None  # source line, set by the parser on statements and functions
 
 # ---------------- Expressions ----------------
 class Number(Node):
@@ -42,6 +43,9 @@ class WhileStmt(Node):
 class ForStmt(Node):
     def __init__(self, init, cond, update, body): self.init, self.cond, self.update, self.body = init, cond, update, body
 
+class ParallelForStmt(ForStmt):
+    pass  # iterations declared independent; see parallel.analyze for what the body may do
+
 class ReturnStmt(Node):
     def __init__(self, expr=None): self.expr = expr
 
@@ -53,7 +57,12 @@ class Block(Node):
     def __init__(self, statements=None): self.statements = statements or []
 
 class FuncDef(Node):
-    def __init__(self, name, body): self.name, self.body = name, body
+    def __init__(self, name, body, params=None):
+        self.name, self.body = name, body
+        self.params = params or []  # parameter names, bound to the call's arguments in order
+
+class ImportStmt(Node):
+    def __init__(self, path): self.path = path
 
 class Program(Node):
     def __init__(self, funcs): self.funcs = funcs
@@ -69,3 +78,16 @@ class Slice(Node):
 class String(Node):
     def __init__(self, value):
         self.value = value
+
+# ---------------- Traversal ----------------
+def walk(node):
+    # node and every node below it, parents first
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        yield n
+        for value in reversed(list(vars(n).values())):
+            if isinstance(value, Node):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(v for v in reversed(value) if isinstance(v, Node))
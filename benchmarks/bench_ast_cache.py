@@ -0,0 +1,44 @@
+# Load-time benchmark: AST cache vs. lex + Parser.parse on generated sources
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lexer import lex
+from parser import Parser
+from ast_cache import ASTCache
+
+def make_source(n):
+    lines = ["func main() {", f"    var a[{n}];", "    var sum = 0;"]
+    for i in range(n):
+        lines.append(f"    a[{i}] = {i} * 3 + {i % 7} - ({i} / 2);")
+    lines.append("    var i = 0;")
+    lines.append(f"    while (i < {n}) {{ sum = sum + a[i]; i = i + 1; }}")
+    lines.append("    print(sum);")
+    lines.append("}")
+    return "\n".join(lines)
+
+def best_of(fn, reps):
+    best = None
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None or dt < best else best
+    return best
+
+def main(sizes=(1000, 10000, 50000), reps=5):
+    with tempfile.TemporaryDirectory() as d:
+        cache = ASTCache(d)
+        print(f"{'stmts':>8} {'bytes':>10} {'lex+parse':>12} {'cache load':>12} {'speedup':>8}")
+        for n in sizes:
+            code = make_source(n)
+            parse_t = best_of(lambda: Parser(lex(code)).parse(), reps)
+            cache.store(code, Parser(lex(code)).parse())
+            load_t = best_of(lambda: cache.load(code), reps)
+            print(f"{n:>8} {len(code):>10} {parse_t * 1000:>10.1f}ms {load_t * 1000:>10.1f}ms {parse_t / load_t:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Overhead of execution budgets (limits.Budget) on loop-heavy programs.
+#
+# Measured on a 1-CPU VM with 15 alternating reps: the interpreter pays
+# +0-5%, mostly noise: each iteration makes one charge() call.
+# The JIT's check is now two instructions on a register (promote_locals keeps
+# the fuel counter out of memory), about 0.2ns per back-edge, the same
+# absolute cost as the old load/sub/store on a global. promote_locals also
+# made this loop about 20% faster without a budget, so the same cost is now
+# a larger share: execute +5-9% at 5e7 iterations. End to end, compiling
+# the checks and hooks adds about 2ms, so 1e6 iterations cost +23%. This
+# loop body is about as small as loop bodies get. The ~2% target is not met.
+#
+#   python benchmarks/bench_budget.py
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lexer import lex
+from parser import Parser
+from interpreter import Interpreter
+from limits import Budget
+from metrics import Metrics
+from harness import capture_native_stdout
+
+PROGRAM = """
+func main() {
+    var n = %d;
+    var a[n];
+    var i = 0;
+    var s = 0;
+    while (i < n) {
+        a[i] = i * 3 %% 11;
+        s = s + a[i];
+        i = i + 1;
+    }
+    print(s);
+}
+"""
+
+def generous():
+    return Budget(max_statements=10 ** 12, max_seconds=3600, max_array_elements=10 ** 9)
+
+def best_of_pair(base, governed, reps):
+    # alternate the two runs so both see the same machine conditions; a run may
+    # return the time of the part that matters, else the whole call is timed
+    base(), governed()  # warm-up: imports, allocator and caches
+    times = ([], [])
+    for _ in range(reps):
+        for fn, ts in ((base, times[0]), (governed, times[1])):
+            t0 = time.perf_counter()
+            t = fn()
+            ts.append(t if t is not None else time.perf_counter() - t0)
+    return min(times[0]), min(times[1])
+
+def bench_interpreter(n, reps):
+    tree = Parser(lex(PROGRAM % n)).parse()
+    return best_of_pair(lambda: Interpreter(tree, out=io.StringIO()).run(),
+                        lambda: Interpreter(tree, out=io.StringIO(), budget=generous()).run(), reps)
+
+def bench_jit(n, reps, execute_only=False):
+    # end-to-end, or only the execute phase: the checks also cost compile time
+    try:
+        from codegen import CodeGen
+    except ImportError:
+        return None
+    tree = Parser(lex(PROGRAM % n)).parse()
+
+    def run(budget):
+        cg = CodeGen(budget)
+        cg.generate(tree)
+        metrics = Metrics()
+        with capture_native_stdout():
+            cg.run_jit(metrics)
+        return metrics.phases["execute"]["wall"] if execute_only else None
+
+    return best_of_pair(lambda: run(None), lambda: run(generous()), reps)
+
+def report(name, n, result):
+    if result is None:
+        print(f"{name:<12} {n:>10}  skipped (llvmlite not installed)")
+        return
+    base, governed = result
+    print(f"{name:<12} {n:>10}  {base * 1000:>9.1f}ms  {governed * 1000:>9.1f}ms  {governed / base - 1:+.2%}")
+
+def main(reps=7):
+    print(f"{'engine':<12} {'iters':>10}  {'no budget':>11}  {'budget':>11}  overhead")
+    for n in (20000, 200000):
+        report("interpreter", n, bench_interpreter(n, reps))
+    for n in (10 ** 6, 5 * 10 ** 7):
+        report("jit", n, bench_jit(n, reps))
+        report("jit execute", n, bench_jit(n, reps, execute_only=True))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# Function calls in the interpreter (slot-array frames) and the JIT (native
+# calls), with and without memoizing pure functions.
+#
+#   python benchmarks/bench_calls.py [--reps N] [--memo N]
+import argparse
+import io
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from lexer import lex
+from parser import Parser
+from interpreter import Interpreter
+from metrics import Metrics
+from harness import capture_native_stdout
+from bench_mir import best_of
+
+try:
+    from codegen import CodeGen
+except ImportError:
+    CodeGen = None
+
+# close to the default depth limit; with the memo each round finds the
+# previous round's sum_to(n - 1) cached
+DEEP = """
+func sum_to(n) {
+    if (n == 0) { return 0; }
+    return n + sum_to(n - 1);
+}
+func main() {
+    var s = 0;
+    for (var r = 0; r < %d; r = r + 1) {
+        s = (s + sum_to(9000 - r)) %% 1000003;
+    }
+    print(s);
+}
+"""
+
+# exponential call tree over few distinct arguments: the memo's best case
+FIB = """
+func fib(n) {
+    if (n < 2) { return n; }
+    return fib(n - 1) + fib(n - 2);
+}
+func main() {
+    print(fib(%d));
+}
+"""
+
+# many small calls from a loop, arguments mostly distinct
+CALL_LOOP = """
+func gcd(a, b) {
+    while (b != 0) {
+        var t = b;
+        b = a %% b;
+        a = t;
+    }
+    return a;
+}
+func mix(x, y) {
+    return (x * 31 + y) %% 65521;
+}
+func main() {
+    var s = 0;
+    for (var i = 1; i < %d; i = i + 1) {
+        s = mix(s, gcd(i, 360) + gcd(i * 7, i + 11));
+    }
+    print(s);
+}
+"""
+
+PROGRAMS = [
+    # (name, source, interpreter size, JIT size)
+    ("deep_9000", DEEP, 3, 300),
+    ("fib", FIB, 22, 32),
+    ("call_loop", CALL_LOOP, 20000, 2000000),
+]
+
+def interpret(tree, memo):
+    out = io.StringIO()
+    Interpreter(tree, out=out, memo=memo).run()
+    return out.getvalue()
+
+def jit_execute(tree, memo, reps):
+    times, output = [], None
+    for _ in range(reps):
+        cg = CodeGen(memo=memo)
+        cg.generate(tree)
+        metrics = Metrics()
+        with capture_native_stdout() as captured:
+            cg.run_jit(metrics)
+        times.append(metrics.phases["execute"]["wall"])
+        output = captured.getvalue().decode("utf8")
+    return min(times), output
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="call overhead and memoization of pure functions")
+    ap.add_argument("--reps", type=int, default=3)
+    ap.add_argument("--memo", type=int, default=4096, help="memo entries per pure function")
+    args = ap.parse_args(argv)
+    columns = ("interp", "interp+memo", "jit", "jit+memo")
+    print(f"{'program':<12} {'size':>12}  " + " ".join(f"{c:>12}" for c in columns))
+    for name, source, interp_size, jit_size in PROGRAMS:
+        tree = Parser(lex(source % interp_size)).parse()
+        expected = interpret(tree, None)
+        if interpret(tree, args.memo) != expected:
+            raise SystemExit(f"{name}: memoized output differs")
+        row = {
+            "interp": best_of(lambda: interpret(tree, None), args.reps),
+            "interp+memo": best_of(lambda: interpret(tree, args.memo), args.reps),
+        }
+        cells = [f"{row[c] * 1000:>10.2f}ms" if c in row else f"{'-':>12}" for c in columns]
+        print(f"{name:<12} {interp_size:>12}  " + " ".join(cells))
+        if CodeGen is None:
+            continue
+        tree = Parser(lex(source % jit_size)).parse()
+        row, outputs = {}, set()
+        for column, memo in (("jit", None), ("jit+memo", args.memo)):
+            row[column], output = jit_execute(tree, memo, args.reps)
+            outputs.add(output)
+        if len(outputs) != 1:
+            raise SystemExit(f"{name}: memoized JIT output differs")
+        cells = [f"{row[c] * 1000:>10.2f}ms" if c in row else f"{'-':>12}" for c in columns]
+        print(f"{name:<12} {jit_size:>12}  " + " ".join(cells))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# Throughput of many small programs sharing one event loop via embed.Execution
+import asyncio
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lexer import lex
+from parser import Parser
+from interpreter import Interpreter
+from embed import run_many
+
+def small_program(seed, iters):
+    return f"""
+func main() {{
+    var i = 0;
+    var acc = {seed};
+    while (i < {iters}) {{
+        acc = (acc * 31 + i) % 1000003;
+        i = i + 1;
+    }}
+    print(acc);
+}}
+"""
+
+def main(counts=(100, 1000, 2000), iters=200, slice_sizes=(10, 100, 1000)):
+    for n in counts:
+        trees = [Parser(lex(small_program(k, iters))).parse() for k in range(n)]
+
+        t0 = time.perf_counter()
+        for tree in trees:
+            Interpreter(tree, out=io.StringIO()).run()
+        blocking = time.perf_counter() - t0
+        print(f"{n:>6} programs  blocking          {blocking * 1000:>9.1f}ms  {n / blocking:>9.0f} prog/s")
+
+        for slice_size in slice_sizes:
+            t0 = time.perf_counter()
+            runs = asyncio.run(run_many(trees, slice_size))
+            dt = time.perf_counter() - t0
+            assert all(r.done and r.error is None for r in runs)
+            slices = sum(r.slices for r in runs)
+            print(f"{n:>6} programs  async slice={slice_size:<5} {dt * 1000:>9.1f}ms  {n / dt:>9.0f} prog/s"
+                  f"  {slices} slices  overhead {dt / blocking - 1:+.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Tree-walking engines vs the SSA mid-level IR (mir), with and without the
+# optimization passes, on loop-heavy programs.
+#
+#   python benchmarks/bench_mir.py [--reps N]
+import argparse
+import io
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from lexer import lex
+from parser import Parser
+from interpreter import Interpreter
+from metrics import Metrics
+from mir import build_program
+from mir_opt import optimize, DEFAULT_PASSES
+from mir_interp import MirInterpreter
+from harness import capture_native_stdout
+
+try:
+    from codegen import CodeGen
+except ImportError:
+    CodeGen = None
+
+# invariant dimension reads and i * n row offsets in the inner loop: LICM and
+# strength reduction territory
+MATMUL = """
+func main() {
+    var n = %d;
+    var a[n][n];
+    var b[n][n];
+    var c[n][n];
+    for (var i = 0; i < n; i = i + 1) {
+        for (var j = 0; j < n; j = j + 1) {
+            a[i][j] = (i * 3 + j) %% 17;
+            b[i][j] = (i + j * 5) %% 13;
+        }
+    }
+    for (var i = 0; i < n; i = i + 1) {
+        for (var j = 0; j < n; j = j + 1) {
+            var s = 0;
+            for (var k = 0; k < n; k = k + 1) {
+                s = s + a[i][k] * b[k][j];
+            }
+            c[i][j] = s;
+        }
+    }
+    print(c[n - 1][n - 1] + c[0][n / 2]);
+}
+"""
+
+def programs():
+    with open(os.path.join(HERE, "programs", "nested_loops.my")) as f:
+        nested = f.read()
+    with open(os.path.join(HERE, "programs", "array_2d.my")) as f:
+        array_2d = f.read()
+    return [("matmul_40", MATMUL % 40), ("nested_loops", nested), ("array_2d", array_2d)]
+
+def best_of(fn, reps):
+    times = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+def mir_module(tree, passes):
+    module = build_program(tree)
+    optimize(module, passes)
+    return module
+
+def jit_execute(make_codegen, reps):
+    # execution phase only: compile time is not what the passes are about
+    times = []
+    for _ in range(reps):
+        metrics = Metrics()
+        with capture_native_stdout():
+            make_codegen().run_jit(metrics)
+        times.append(metrics.phases["execute"]["wall"])
+    return min(times)
+
+def bench(name, code, reps):
+    tree = Parser(lex(code)).parse()
+    plain, optimized = mir_module(tree, ()), mir_module(tree, DEFAULT_PASSES)
+    row = {
+        "mir_instrs": plain.instruction_count(),
+        "opt_instrs": optimized.instruction_count(),
+        "ast_interp": best_of(lambda: Interpreter(tree, out=io.StringIO()).run(), reps),
+        "mir_interp_O0": best_of(lambda: MirInterpreter(plain, out=io.StringIO()).run(), reps),
+        "mir_interp": best_of(lambda: MirInterpreter(optimized, out=io.StringIO()).run(), reps),
+    }
+    if CodeGen is not None:
+        def from_ast():
+            cg = CodeGen()
+            cg.generate(tree)
+            return cg
+
+        def from_mir(module):
+            cg = CodeGen()
+            cg.generate_mir(module, tree)
+            return cg
+        row["ast_jit"] = jit_execute(from_ast, reps)
+        row["mir_jit_O0"] = jit_execute(lambda: from_mir(plain), reps)
+        row["mir_jit"] = jit_execute(lambda: from_mir(optimized), reps)
+    return row
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="AST engines vs the mid-level IR, with and without passes")
+    ap.add_argument("--reps", type=int, default=3)
+    args = ap.parse_args(argv)
+    columns = ("ast_interp", "mir_interp_O0", "mir_interp", "ast_jit", "mir_jit_O0", "mir_jit")
+    print(f"{'program':<14} {'instrs':>9}  " + " ".join(f"{c:>13}" for c in columns))
+    for name, code in programs():
+        row = bench(name, code, args.reps)
+        cells = [f"{row[c] * 1000:>11.2f}ms" if c in row else f"{'-':>13}" for c in columns]
+        print(f"{name:<14} {row['mir_instrs']:>4}->{row['opt_instrs']:<4} " + " ".join(cells))
+
+if __name__ == "__main__":
+    main()
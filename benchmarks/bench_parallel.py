@@ -0,0 +1,97 @@
+# Scaling of `parallel for` with the worker count, for the interpreter (process
+# pool over shared-memory arrays) and the JIT (thread pool running the outlined
+# loop body).
+#
+#   python benchmarks/bench_parallel.py [--workers 1,2,4,8] [--reps N]
+import argparse
+import io
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from lexer import lex
+from parser import Parser
+from interpreter import Interpreter
+from metrics import Metrics
+from harness import capture_native_stdout
+from bench_mir import best_of
+
+try:
+    from codegen import CodeGen
+except ImportError:
+    CodeGen = None
+
+# independent rows with a sum reduction; the inner loop keeps each iteration
+# heavy enough that chunking overhead stays small
+ROWS = """
+func main() {
+    var n = %d;
+    var m = %d;
+    var out[n];
+    var total = 0;
+    parallel for (var i = 0; i < n; i = i + 1) {
+        var acc = 0;
+        for (var j = 0; j < m; j = j + 1) {
+            acc = (acc * 31 + i * j + 7) %% 1000003;
+        }
+        out[i] = acc;
+        total = total + acc;
+    }
+    print(total + out[n - 1]);
+}
+"""
+
+PROGRAMS = [
+    # (name, interpreter sizes, JIT sizes)
+    ("rows", (64, 2000), (512, 200000)),
+]
+
+def jit_execute(tree, workers, reps):
+    times = []
+    for _ in range(reps):
+        cg = CodeGen(workers=workers)
+        cg.generate(tree)
+        metrics = Metrics()
+        with capture_native_stdout():
+            cg.run_jit(metrics)
+        times.append(metrics.phases["execute"]["wall"])
+    return min(times)
+
+def interpret(tree, workers):
+    out = io.StringIO()
+    Interpreter(tree, out=out, workers=workers).run()
+    return out.getvalue()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="parallel for scaling with the worker count")
+    ap.add_argument("--workers", default="1,2,4,8", help="comma separated worker counts")
+    ap.add_argument("--reps", type=int, default=3)
+    args = ap.parse_args(argv)
+    counts = [int(w) for w in args.workers.split(",") if w]
+    print(f"cpus: {os.cpu_count()}")
+    print(f"{'program':<10} {'engine':<8} " + " ".join(f"{f'{w} worker(s)':>16}" for w in counts))
+    for name, interp_size, jit_size in PROGRAMS:
+        tree = Parser(lex(ROWS % interp_size)).parse()
+        expected = interpret(tree, 1)
+        cells, base = [], None
+        for w in counts:
+            if interpret(tree, w) != expected:  # also starts the pool outside the timing
+                raise SystemExit(f"{name}: output with {w} workers differs from the sequential run")
+            t = best_of(lambda: interpret(tree, w), args.reps)
+            base = base or t
+            cells.append(f"{t * 1000:>8.1f}ms x{base / t:<4.2f}")
+        print(f"{name:<10} {'interp':<8} " + " ".join(cells))
+        if CodeGen is None:
+            continue
+        tree = Parser(lex(ROWS % jit_size)).parse()
+        cells, base = [], None
+        for w in counts:
+            t = jit_execute(tree, w, args.reps)
+            base = base or t
+            cells.append(f"{t * 1000:>8.1f}ms x{base / t:<4.2f}")
+        print(f"{name:<10} {'jit':<8} " + " ".join(cells))
+
+if __name__ == "__main__":
+    main()
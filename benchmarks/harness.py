@@ -0,0 +1,270 @@
+# Benchmark harness: times every pipeline stage over the .my corpus, checks
+# that the engines agree, and compares against a stored baseline.
+#
+#   python benchmarks/harness.py --out results.json
+#   python benchmarks/harness.py --save-baseline benchmarks/baseline.json
+#   python benchmarks/harness.py --baseline benchmarks/baseline.json --threshold 0.15 --stage-threshold jit=0.3
+import argparse
+import contextlib
+import ctypes
+import hashlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from lexer import lex
+from parser import Parser
+from interpreter import Interpreter
+from mir import build_program
+from mir_opt import optimize
+from mir_interp import MirInterpreter
+
+try:
+    from codegen import CodeGen
+except ImportError:
+    CodeGen = None
+
+STAGES = ("lex", "parse", "interpret", "mir", "codegen", "jit")
+DEFAULT_PROGRAMS = os.path.join(HERE, "programs")
+
+# ---------------- Corpus ----------------
+def generate_large(n):
+    # long straight-line source: stresses lex + parse far more than execution
+    lines = ["func main() {", "    var acc = 0;"]
+    for i in range(n):
+        lines.append(f"    var v{i % 97} = ({i} * 7 + {i % 13}) % 1009;")
+        lines.append(f"    acc = (acc + v{i % 97} * 3 - {i % 5}) % 1000003;")
+    lines.append("    print(acc);")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+GENERATED = {
+    "generated_large": lambda: generate_large(800),
+}
+
+def load_corpus(directory=DEFAULT_PROGRAMS, generated=True):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".my"):
+            with open(os.path.join(directory, name)) as f:
+                corpus.append((name[:-3], f.read()))
+    if generated:
+        corpus.extend((name, make()) for name, make in GENERATED.items())
+    return corpus
+
+# ---------------- Timing ----------------
+def measure(fn, warmup, reps):
+    for _ in range(warmup):
+        fn()
+    wall, cpu = [], []
+    for _ in range(reps):
+        c0, t0 = time.process_time(), time.perf_counter()
+        fn()
+        wall.append(time.perf_counter() - t0)
+        cpu.append(time.process_time() - c0)
+    return {
+        "min": min(wall),
+        "median": statistics.median(wall),
+        "mean": statistics.fmean(wall),
+        "stdev": statistics.stdev(wall) if len(wall) > 1 else 0.0,
+        "cpu_median": statistics.median(cpu),
+        "reps": reps,
+    }
+
+@contextlib.contextmanager
+def capture_native_stdout():
+    # JIT code prints through libc, so redirect file descriptor 1 itself
+    libc = ctypes.CDLL(None)
+    sys.stdout.flush()
+    libc.fflush(None)
+    saved = os.dup(1)
+    with tempfile.TemporaryFile() as tmp:
+        os.dup2(tmp.fileno(), 1)
+        captured = io.BytesIO()
+        try:
+            yield captured
+        finally:
+            sys.stdout.flush()
+            libc.fflush(None)
+            os.dup2(saved, 1)
+            os.close(saved)
+            tmp.seek(0)
+            captured.write(tmp.read())
+
+def digest(text):
+    return hashlib.sha256(text.encode("utf8")).hexdigest()[:16]
+
+# ---------------- One program ----------------
+def bench_program(name, code, stages=STAGES, warmup=1, reps=5):
+    result = {"stages": {}, "outputs": {}}
+    tokens = list(lex(code))
+    tree = Parser(tokens).parse()
+    result["tokens"] = len(tokens)
+
+    if "lex" in stages:
+        result["stages"]["lex"] = measure(lambda: list(lex(code)), warmup, reps)
+    if "parse" in stages:
+        result["stages"]["parse"] = measure(lambda: Parser(tokens).parse(), warmup, reps)
+    if "interpret" in stages:
+        out = io.StringIO()
+        Interpreter(tree, out=out).run()
+        result["outputs"]["interpret"] = out.getvalue()
+        result["stages"]["interpret"] = measure(lambda: Interpreter(tree, out=io.StringIO()).run(), warmup, reps)
+    if "mir" in stages:
+        # execution of the optimized mid-level IR; building it is not timed
+        module = build_program(tree)
+        optimize(module)
+        out = io.StringIO()
+        MirInterpreter(module, out=out).run()
+        result["outputs"]["mir"] = out.getvalue()
+        result["stages"]["mir"] = measure(lambda: MirInterpreter(module, out=io.StringIO()).run(), warmup, reps)
+
+    if CodeGen is not None and ("codegen" in stages or "jit" in stages):
+        def codegen():
+            cg = CodeGen()
+            cg.generate(tree)
+            return cg
+        cg = codegen()
+        if "codegen" in stages:
+            result["stages"]["codegen"] = measure(codegen, warmup, reps)
+        if "jit" in stages:
+            with capture_native_stdout() as captured:
+                cg.run_jit()
+            result["outputs"]["jit"] = captured.getvalue().decode("utf8", "replace")
+            with capture_native_stdout():
+                result["stages"]["jit"] = measure(cg.run_jit, warmup, reps)
+
+    outputs = result.pop("outputs")
+    result["output_digest"] = {engine: digest(text) for engine, text in outputs.items()}
+    result["outputs_match"] = len(set(result["output_digest"].values())) <= 1
+    return result
+
+def run_suite(corpus, stages=STAGES, warmup=1, reps=5, log=sys.stderr):
+    results = {}
+    for name, code in corpus:
+        t0 = time.perf_counter()
+        results[name] = bench_program(name, code, stages, warmup, reps)
+        status = "ok" if results[name]["outputs_match"] else "OUTPUT MISMATCH"
+        print(f"{name:<20} {time.perf_counter() - t0:7.2f}s  {status}", file=log)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "jit": CodeGen is not None,
+            "warmup": warmup,
+            "reps": reps,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "programs": results,
+    }
+
+# ---------------- Baseline comparison ----------------
+def compare(current, baseline, threshold=0.10, stage_thresholds=None, min_delta=0.0005):
+    # a stage regresses when its median grows by more than the threshold
+    # and by more than min_delta seconds (to ignore noise on tiny stages)
+    stage_thresholds = stage_thresholds or {}
+    regressions, improvements = [], []
+    for name, prog in current["programs"].items():
+        base = baseline["programs"].get(name)
+        if base is None:
+            continue
+        for stage, stats in prog["stages"].items():
+            old = base["stages"].get(stage)
+            if old is None:
+                continue
+            limit = stage_thresholds.get(stage, threshold)
+            new_t, old_t = stats["median"], old["median"]
+            ratio = new_t / old_t if old_t else float("inf")
+            row = (name, stage, old_t, new_t, ratio - 1)
+            if ratio > 1 + limit and new_t - old_t > min_delta:
+                regressions.append(row)
+            elif ratio < 1 - limit and old_t - new_t > min_delta:
+                improvements.append(row)
+    return regressions, improvements
+
+def print_table(results, out=sys.stdout):
+    print(f"{'program':<20} " + " ".join(f"{s:>11}" for s in STAGES) + "  engines", file=out)
+    for name, prog in results["programs"].items():
+        cells = []
+        for stage in STAGES:
+            stats = prog["stages"].get(stage)
+            cells.append(f"{stats['median'] * 1000:9.2f}ms" if stats else f"{'-':>11}")
+        print(f"{name:<20} " + " ".join(cells) + ("  agree" if prog["outputs_match"] else "  DIFFER"), file=out)
+
+def print_rows(title, rows, out=sys.stdout):
+    if not rows:
+        return
+    print(title, file=out)
+    for name, stage, old_t, new_t, delta in rows:
+        print(f"  {name:<20} {stage:<10} {old_t * 1000:9.2f}ms -> {new_t * 1000:9.2f}ms  {delta:+.1%}", file=out)
+
+def parse_stage_thresholds(items):
+    thresholds = {}
+    for item in items or []:
+        stage, _, value = item.partition("=")
+        if stage not in STAGES or not value:
+            raise SystemExit(f"bad --stage-threshold {item!r}, expected STAGE=FRACTION with STAGE in {STAGES}")
+        thresholds[stage] = float(value)
+    return thresholds
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark lex/parse/interpret/mir/codegen/jit over the .my corpus")
+    ap.add_argument("--programs", default=DEFAULT_PROGRAMS, help="directory of .my programs")
+    ap.add_argument("--only", nargs="*", help="benchmark only these programs")
+    ap.add_argument("--no-generated", action="store_true", help="skip generated large sources")
+    ap.add_argument("--stages", default=",".join(STAGES), help="comma separated subset of " + ",".join(STAGES))
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--reps", type=int, default=5)
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--save-baseline", help="write results JSON as the new baseline")
+    ap.add_argument("--baseline", help="compare against this baseline JSON")
+    ap.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown as a fraction (default 0.10)")
+    ap.add_argument("--stage-threshold", action="append", help="per-stage override, e.g. jit=0.25")
+    ap.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore changes smaller than this")
+    args = ap.parse_args(argv)
+
+    stages = tuple(s for s in args.stages.split(",") if s)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"unknown stages: {', '.join(sorted(unknown))}")
+    corpus = load_corpus(args.programs, not args.no_generated)
+    if args.only:
+        corpus = [(n, c) for n, c in corpus if n in args.only]
+
+    results = run_suite(corpus, stages, args.warmup, args.reps)
+    print_table(results)
+
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=1, sort_keys=True)
+
+    failed = [n for n, p in results["programs"].items() if not p["outputs_match"]]
+    if failed:
+        print("engines disagree on: " + ", ".join(failed))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, improvements = compare(results, baseline, args.threshold,
+                                            parse_stage_thresholds(args.stage_threshold),
+                                            args.min_delta_ms / 1000)
+        print_rows("regressions:", regressions)
+        print_rows("improvements:", improvements)
+        if not regressions:
+            print("no regressions against baseline")
+
+    return 1 if failed or regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,28 @@
 from llvmlite import ir, binding
-from ast_nodes import VarDecl, Number, PrintStmt, BinOp, Var
+from ast_nodes import *
+from limits import ResourceLimitExceeded, ProgramError
+from metrics import Metrics
+import concurrent.futures
+import dataio
+import mir
+import parallel
+import purity
+from interpreter import DEFAULT_MAX_DEPTH
+
+_CMP_OPS = {'LT': '<', 'GT': '>', 'LE': '<=', 'GE': '>=', 'EQ': '==', 'NE': '!='}
+_MIR_CMP_OPS = {mir.BINOPS[k]: v for k, v in _CMP_OPS.items()}
+
+# Native calls recurse on the thread's stack, so JIT code runs on a thread with
+# room for max_depth frames of up to _FRAME_BYTES each (measured frames are
+# 16-112 bytes), plus _STACK_BASE for main and the Python callbacks.
+_FRAME_BYTES = 512
+_STACK_BASE = 8 << 20
+_MAX_STACK = 1 << 30
+MAX_JIT_DEPTH = (_MAX_STACK - _STACK_BASE) // _FRAME_BYTES
+
+def native_stack_size(max_depth):
+    size = _STACK_BASE + max_depth * _FRAME_BYTES
+    return -(-size // (1 << 20)) << 20  # whole MiB
 
 # LLVM initialization (do once)
 binding.initialize()
@@ -7,52 +30,699 @@ binding.initialize_native_target()
 binding.initialize_native_asmprinter()
 
 class CodeGen:
-    def __init__(self):
+    def __init__(self, budget=None, perf=False, source_name=None, workers=None, memo=None, max_depth=None):
         self.module = ir.Module(name="my_module")
         self.builder = None
         self.func = None
         self.symbols = {}
+        self.arrays = {}  # name -> (data pointer slot, [dimension slots], runtime-owned flag slot)
         self.tree = None  # store AST for interpreter fallback
         self._fmt_counter = 0  # counter for unique printf format strings
+        self.budget = budget  # limits.Budget; checks are only emitted when set
+        self.fuel_slot = None  # i64* fuel slot of the thread running the function (budget checks)
+        self.fuel = None  # the function's local copy of the slot's fuel
+        # perf mode: DWARF line info plus an address table of statement starts
+        self.perf = perf
+        self.source_name = source_name or "<input>"
+        self.line_marks = []  # (function name, basic block, line) per statement
+        self.di_file = self.di_cu = self.di_scope = None
+        self.workers = workers  # threads for `parallel for`; None means parallel.default_workers()
+        self.in_parallel = False  # generating an outlined parallel loop body
+        self.private_flags = {}  # private scalar -> i1 slot set when the outlined body assigns it
+        self._parallel_count = 0
+        self.memo = memo  # entries in each pure function's memo table; None or 0 disables
+        self.max_depth = max_depth or DEFAULT_MAX_DEPTH
+        if self.max_depth > MAX_JIT_DEPTH:
+            raise ValueError(f"maximum call depth {self.max_depth} is more than JIT code can reach "
+                             f"on its stack (at most {MAX_JIT_DEPTH})")
+        self.funcdefs = {}  # name -> FuncDef being compiled
+        self.pure = set()  # purity.pure_functions(self.funcdefs)
+        self.memo_funcs = set()  # pure functions that get a memo table
+        self.extern_calls = False  # calls may name functions of other modules
 
-    # ---------------- Generate main function ----------------
+    # ---------------- Generate main and the functions it calls ----------------
     def generate(self, tree):
         self.tree = tree  # store AST for fallback
-        # define main function
-        func_type = ir.FunctionType(ir.IntType(32), ())
-        self.func = ir.Function(self.module, func_type, name="main")
-        block = self.func.append_basic_block(name="entry")
-        self.builder = ir.IRBuilder(block)
-        # compile main body
-        main_func = next(f for f in tree.funcs if f.name == 'main')
-        self.codegen_block(main_func.body)
-        self.builder.ret(ir.Constant(ir.IntType(32), 0))
+        funcs = {f.name: f for f in tree.funcs if isinstance(f, FuncDef)}
+        if 'main' not in funcs:
+            raise RuntimeError("No main function")
+        used = purity.reachable(funcs, ['main'])
+        self.codegen_functions(funcs, [name for name in funcs if name in used])
+        self.finish_line_table()
+
+    # ---------------- Generate every function of a module ----------------
+    def generate_module(self, tree, name=None):
+        self.tree = tree
+        if name:
+            self.module.name = name
+        self.extern_calls = True  # imported functions live in other objects
+        funcs = {f.name: f for f in tree.funcs if isinstance(f, FuncDef)}
+        self.codegen_functions(funcs, funcs)
+        self.finish_line_table()
+
+    def codegen_functions(self, funcs, names):
+        self.funcdefs = funcs
+        self.pure = purity.pure_functions(funcs)
+        if self.memo:
+            self.memo_funcs = self.pure & set(names)
+        # declared up front, so calls can come before definitions
+        for name in names:
+            self.declare_func(name, len(funcs[name].params))
+        for name in names:
+            self.codegen_func(funcs[name])
+
+    # ---------------- Functions ----------------
+    # Functions are i32(i32 ...). All but main take the caller's depth + 1 as a
+    # hidden first argument, which keeps the call depth limit in a register and
+    # correct across parallel loop worker threads. With budget checks they also
+    # take the caller's fuel slot (see codegen_back_edge) after it.
+    def declare_func(self, name, nparams):
+        i32 = ir.IntType(32)
+        fn = self.module.globals.get(name)
+        hidden = [] if name == 'main' else [i32] + ([self.fuel_type()] if self.budget is not None else [])
+        if fn is None:
+            fn = ir.Function(self.module, ir.FunctionType(i32, hidden + [i32] * nparams), name=name)
+        elif not isinstance(fn, ir.Function) or len(fn.args) != len(hidden) + nparams:
+            raise RuntimeError(f"{name}() called with {nparams} argument(s), "
+                               f"declared with {len(fn.args) - len(hidden)} in JIT")
+        return fn
+
+    def codegen_func(self, funcdef):
+        i32 = ir.IntType(32)
+        self.func = self.declare_func(funcdef.name, len(funcdef.params))
+        # allocas live in their own entry block so loops never grow the stack
+        entry = self.func.append_basic_block(name="entry")
+        body = self.func.append_basic_block(name="body")
+        self.entry_builder = ir.IRBuilder(entry)
+        self.builder = ir.IRBuilder(body)
+        self.symbols = {}
+        self.arrays = {}
+        self.retval = self.alloca(i32, "retval")
+        self.entry_builder.store(ir.Constant(i32, 0), self.retval)
+        self.return_block = self.func.append_basic_block(name="return")  # return statements
+        self.exit_block = self.func.append_basic_block(name="exit")  # runtime errors
+        done = self.func.append_basic_block(name="done")
+        self.memo_entry = None
+        if self.perf:
+            self.debug_subprogram(funcdef)
+        args = list(self.func.args)
+        self.depth = ir.Constant(i32, 0) if funcdef.name == 'main' else args.pop(0)
+        if self.budget is not None:
+            self.load_fuel(self.main_fuel() if funcdef.name == 'main' else args.pop(0))
+        for arg, name in zip(args, funcdef.params):
+            arg.name = f"{name}.arg"
+            self.symbols[name] = self.alloca(i32, name)
+            self.entry_builder.store(arg, self.symbols[name])
+        if funcdef.name != 'main':
+            self.call_prologue(funcdef, args)
+        self.codegen_block(funcdef.body)
+        if not self.builder.block.is_terminated:
+            self.builder.branch(self.return_block)
+        self.builder.position_at_end(self.return_block)
+        if self.memo_entry is not None:
+            self.memo_store(self.builder.load(self.retval))
+        self.builder.branch(done)
+        # callers check the flag after every call, so an error unwinds the whole stack
+        self.builder.position_at_end(self.exit_block)
+        self.builder.store(ir.Constant(i32, 1), self.hook_global("__mycc_abort", i32))
+        self.builder.branch(done)
+        # free every array still owned by the function on the way out
+        self.builder.position_at_end(done)
+        self.store_fuel()
+        for entry in self.arrays.values():
+            self.release_array(entry)
+        self.builder.ret(self.builder.load(self.retval))
+        self.entry_builder.branch(body)
+
+    def call_prologue(self, funcdef, args):
+        # depth limit, memo lookup, then the budget charge (a memo hit is free, as in the interpreter)
+        i32 = ir.IntType(32)
+        over_bb = self.func.append_basic_block("depth.over")
+        ok_bb = self.func.append_basic_block("depth.ok")
+        self.builder.cbranch(self.builder.icmp_signed('>', self.depth, ir.Constant(i32, self.max_depth)), over_bb, ok_bb)
+        self.builder.position_at_end(over_bb)
+        self.builder.call(self.builder.load(self.runtime_hook("depth")),
+                          [self.global_cstring(funcdef.name + "\0"), ir.Constant(i32, self.max_depth)])
+        self.builder.branch(self.exit_block)
+        self.builder.position_at_end(ok_bb)
+        if funcdef.name in self.memo_funcs:
+            self.memo_lookup(funcdef, args)
+        # a call is charged like a loop back-edge, so recursion can't run unmetered
+        self.codegen_back_edge(len(funcdef.body.statements) + 1)
+
+    # ---------------- Memo tables ----------------
+    # A pure function's results are cached in a direct-mapped table of
+    # {valid, arguments..., result} entries indexed by a hash of the arguments;
+    # a colliding call simply replaces the entry. The tables aren't thread-safe,
+    # so they are bypassed while the parallel runtime has worker threads going.
+    def memo_lookup(self, funcdef, args):
+        i32 = ir.IntType(32)
+        size = 1 << max(0, (self.memo - 1).bit_length())
+        entry_ty = ir.LiteralStructType([i32] * (len(args) + 2))
+        table_ty = ir.ArrayType(entry_ty, size)
+        table = ir.GlobalVariable(self.module, table_ty, name=f"__mycc_memo_{funcdef.name}")
+        table.linkage = 'internal'
+        table.initializer = ir.Constant(table_ty, None)
+        h = ir.Constant(i32, 0x811C9DC5 - (1 << 32))
+        for a in args:
+            h = self.builder.mul(self.builder.xor(h, a), ir.Constant(i32, 0x01000193))
+        h = self.builder.xor(h, self.builder.lshr(h, ir.Constant(i32, 16)))
+        entry = self.builder.gep(table, [ir.Constant(i32, 0), self.builder.and_(h, ir.Constant(i32, size - 1))])
+        field = lambda k: self.builder.gep(entry, [ir.Constant(i32, 0), ir.Constant(i32, k)])
+        lookup_bb = self.func.append_basic_block("memo.lookup")
+        hit_bb = self.func.append_basic_block("memo.hit")
+        miss_bb = self.func.append_basic_block("memo.miss")
+        self.builder.cbranch(self.parallel_active(), miss_bb, lookup_bb)
+        self.builder.position_at_end(lookup_bb)
+        match = self.truth(self.builder.load(field(0)))
+        for k, a in enumerate(args):
+            match = self.builder.and_(match, self.builder.icmp_signed('==', self.builder.load(field(k + 1)), a))
+        self.builder.cbranch(match, hit_bb, miss_bb)
+        self.builder.position_at_end(hit_bb)
+        self.builder.ret(self.builder.load(field(len(args) + 1)))
+        self.builder.position_at_end(miss_bb)
+        self.memo_entry = (entry, args)
+
+    def memo_store(self, result):
+        # the arguments as passed: the body may have reassigned the parameters
+        i32 = ir.IntType(32)
+        entry, args = self.memo_entry
+        field = lambda k: self.builder.gep(entry, [ir.Constant(i32, 0), ir.Constant(i32, k)])
+        store_bb = self.func.append_basic_block("memo.store")
+        done_bb = self.func.append_basic_block("memo.done")
+        self.builder.cbranch(self.parallel_active(), done_bb, store_bb)
+        self.builder.position_at_end(store_bb)
+        for k, a in enumerate(args):
+            self.builder.store(a, field(k + 1))
+        self.builder.store(result, field(len(args) + 1))
+        self.builder.store(ir.Constant(i32, 1), field(0))
+        self.builder.branch(done_bb)
+        self.builder.position_at_end(done_bb)
+
+    def parallel_active(self):
+        # set by _ParallelRuntime while chunks run on worker threads
+        i32 = ir.IntType(32)
+        flag = self.builder.load(self.hook_global("__mycc_parallel_active", i32))
+        return self.builder.icmp_signed('!=', flag, ir.Constant(i32, 0))
+
+    # ---------------- Calls ----------------
+    def codegen_user_call(self, call):
+        i32 = ir.IntType(32)
+        funcdef = self.funcdefs.get(call.name)
+        if funcdef is None and not self.extern_calls:
+            raise RuntimeError(f"Unknown function {call.name} in JIT")
+        if funcdef is not None and len(funcdef.params) != len(call.args):
+            raise RuntimeError(f"{call.name}() takes {len(funcdef.params)} argument(s), got {len(call.args)}")
+        args = []
+        for a in call.args:
+            if isinstance(a, Var) and not a.index_exprs and a.name in self.arrays and a.name not in self.symbols:
+                raise RuntimeError(f"Array arguments are not supported in JIT ({call.name})")
+            args.append(self.codegen_expr(a))
+        callee = self.declare_func(call.name, len(args))
+        if call.name != 'main':
+            hidden = [self.builder.add(self.depth, ir.Constant(i32, 1))]
+            args = hidden + ([self.fuel_slot] if self.budget is not None else []) + args
+        # the callee burns fuel from the same slot
+        self.store_fuel()
+        result = self.builder.call(callee, args)
+        if self.budget is not None:
+            self.builder.store(self.builder.load(self.fuel_slot), self.fuel)
+        self.check_abort()
+        return result
+
+    def check_abort(self):
+        i32 = ir.IntType(32)
+        flag = self.builder.load(self.hook_global("__mycc_abort", i32))
+        ok_bb = self.func.append_basic_block("call.ok")
+        self.builder.cbranch(self.builder.icmp_signed('!=', flag, ir.Constant(i32, 0)), self.exit_block, ok_bb)
+        self.builder.position_at_end(ok_bb)
+
+    def alloca(self, ty, name):
+        return self.entry_builder.alloca(ty, name=name)
 
     # ---------------- Generate block ----------------
     def codegen_block(self, block):
         for stmt in block.statements:
+            if self.perf:
+                self.mark_line(stmt)
             self.codegen_stmt(stmt)
 
+    # ---------------- Debug info (perf mode) ----------------
+    def debug_subprogram(self, funcdef):
+        m = self.module
+        if self.di_cu is None:
+            import os
+            path = os.path.abspath(self.source_name)
+            self.di_file = m.add_debug_info("DIFile", {"filename": os.path.basename(path),
+                                                       "directory": os.path.dirname(path)})
+            self.di_cu = m.add_debug_info("DICompileUnit", {
+                "language": ir.DIToken("DW_LANG_C"),
+                "file": self.di_file,
+                "producer": "mycc",
+                "runtimeVersion": 0,
+                "isOptimized": False,
+                "emissionKind": ir.DIToken("FullDebug"),
+            }, is_distinct=True)
+            m.add_named_metadata("llvm.dbg.cu", self.di_cu)
+            m.add_named_metadata("llvm.module.flags", [ir.Constant(ir.IntType(32), 2), "Debug Info Version",
+                                                       ir.Constant(ir.IntType(32), 3)])
+        line = funcdef.line or 0
+        self.di_scope = m.add_debug_info("DISubprogram", {
+            "name": funcdef.name,
+            "file": self.di_file,
+            "scope": self.di_file,
+            "line": line,
+            "scopeLine": line,
+            "type": m.add_debug_info("DISubroutineType", {"types": m.add_metadata([])}),
+            "spFlags": ir.DIToken("DISPFlagDefinition"),
+            "unit": self.di_cu,
+        }, is_distinct=True)
+        self.func.set_metadata("dbg", self.di_scope)
+        self.builder.debug_metadata = self.module.add_debug_info(
+            "DILocation", {"line": line, "column": 1, "scope": self.di_scope})
+
+    def mark_line(self, stmt):
+        if stmt.line is None or self.builder.block.is_terminated:
+            return
+        # each statement starts its own block, whose address lands in the line table
+        bb = self.func.append_basic_block(f"line{stmt.line}")
+        self.builder.branch(bb)
+        self.builder.position_at_end(bb)
+        self.line_marks.append((self.func.name, bb, stmt.line))
+        self.builder.debug_metadata = self.module.add_debug_info(
+            "DILocation", {"line": stmt.line, "column": 1, "scope": self.di_scope})
+
+    def finish_line_table(self):
+        if not self.perf or not self.line_marks:
+            return
+        voidptr_ty = ir.IntType(8).as_pointer()
+        funcs = {f.name: f for f in self.module.functions}
+        table_ty = ir.ArrayType(voidptr_ty, len(self.line_marks))
+        table = ir.GlobalVariable(self.module, table_ty, name="__mycc_line_addrs")
+        table.global_constant = True
+        table.initializer = ir.Constant(table_ty, [ir.BlockAddress(funcs[name], bb) for name, bb, _ in self.line_marks])
+
     # ---------------- Generate statement ----------------
     def codegen_stmt(self, stmt):
         if isinstance(stmt, VarDecl):
+            if stmt.dimensions:
+                self.codegen_array_decl(stmt)
+                return
+            if self.is_array_load(stmt.expr):
+                self.codegen_array_load(stmt.name, stmt.expr)
+                return
+            val = self.codegen_expr(stmt.expr) if stmt.expr is not None else ir.Constant(ir.IntType(32), 0)
+            self.store_scalar(stmt.name, val)
+
+        elif isinstance(stmt, AssignStmt):
+            if not stmt.index_exprs and self.is_array_load(stmt.expr):
+                self.codegen_array_load(stmt.name, stmt.expr)
+                return
             val = self.codegen_expr(stmt.expr)
-            ptr = self.builder.alloca(ir.IntType(32), name=stmt.name)
-            self.builder.store(val, ptr)
-            self.symbols[stmt.name] = ptr
+            if stmt.index_exprs:
+                self.builder.store(val, self.element_ptr(stmt.name, stmt.index_exprs))
+                return
+            self.store_scalar(stmt.name, val)
+
         elif isinstance(stmt, PrintStmt):
-            val = self.codegen_expr(stmt.expr)
-            self.printf_int(val)
+            if isinstance(stmt.expr, String):
+                self.printf_str(stmt.expr.value)
+            else:
+                val = self.codegen_expr(stmt.expr)
+                self.printf_int(val)
+
+        elif isinstance(stmt, IfStmt):
+            cond = self.truth(self.codegen_expr(stmt.cond))
+            then_bb = self.func.append_basic_block("if.then")
+            else_bb = self.func.append_basic_block("if.else") if stmt.else_block else None
+            end_bb = self.func.append_basic_block("if.end")
+            self.builder.cbranch(cond, then_bb, else_bb or end_bb)
+            self.builder.position_at_end(then_bb)
+            self.codegen_block(stmt.then_block)
+            self.builder.branch(end_bb)
+            if else_bb:
+                self.builder.position_at_end(else_bb)
+                self.codegen_block(stmt.else_block)
+                self.builder.branch(end_bb)
+            self.builder.position_at_end(end_bb)
+
+        elif isinstance(stmt, WhileStmt):
+            self.codegen_loop(stmt.cond, stmt.body)
+
+        elif isinstance(stmt, ParallelForStmt):
+            self.codegen_parallel_for(stmt)
+
+        elif isinstance(stmt, ForStmt):
+            self.codegen_stmt(stmt.init)
+            self.codegen_loop(stmt.cond, stmt.body, stmt.update)
+
+        elif isinstance(stmt, Block):
+            self.codegen_block(stmt)
+
+        elif isinstance(stmt, ReturnStmt):
+            val = self.codegen_expr(stmt.expr) if stmt.expr is not None else ir.Constant(ir.IntType(32), 0)
+            self.builder.store(val, self.retval)
+            self.builder.branch(self.return_block)
+            # anything after the return is unreachable, but still needs a block
+            self.builder.position_at_end(self.func.append_basic_block("after.return"))
+
+        elif isinstance(stmt, FuncCall):
+            self.codegen_expr(stmt)
+
+        elif isinstance(stmt, (Var, ArrayAccess)):
+            pass  # bare expression statement, nothing to do
+
+        else:
+            raise RuntimeError(f"Unsupported statement {type(stmt).__name__} in JIT")
+
+    def store_scalar(self, name, val):
+        ptr = self.symbols.get(name)
+        if ptr is None:
+            ptr = self.alloca(ir.IntType(32), name)
+            self.symbols[name] = ptr
+        self.builder.store(val, ptr)
+        flag = self.private_flags.get(name)
+        if flag is not None:
+            self.builder.store(ir.Constant(ir.IntType(1), 1), flag)
+
+    def codegen_loop(self, cond, body, update=None):
+        cond_bb = self.func.append_basic_block("loop.cond")
+        body_bb = self.func.append_basic_block("loop.body")
+        end_bb = self.func.append_basic_block("loop.end")
+        self.builder.branch(cond_bb)
+        self.builder.position_at_end(cond_bb)
+        self.builder.cbranch(self.truth(self.codegen_expr(cond)), body_bb, end_bb)
+        self.builder.position_at_end(body_bb)
+        self.codegen_block(body)
+        if update is not None:
+            self.codegen_stmt(update)
+        self.codegen_back_edge(len(body.statements) + 1)
+        self.builder.branch(cond_bb)
+        self.builder.position_at_end(end_bb)
+
+    # ---------------- Parallel loops ----------------
+    # The body of a `parallel for` is outlined into
+    #   void <func>.parallel<k>(i64 k0, i64 k1, i8** ctx, i32 chunk, i64* fuel)
+    # running iterations [k0, k1); the runtime hook splits the range into chunks
+    # for a thread pool and gives each chunk its own fuel slot, so budget checks
+    # in the body stay per thread. ctx points at the enclosing function's variables:
+    #   start value, call depth, shared scalars, arrays (data slot, dimension slots),
+    #   reduction targets, then per private a [MAX_CHUNKS x i32] value array
+    #   and a [MAX_CHUNKS x i8] "assigned" array indexed by chunk.
+    # Reductions are accumulated locally and combined atomically; privates are
+    # copied out in chunk order once every chunk is done, so the enclosing
+    # function sees the values of the last iteration that assigned them.
+    def codegen_parallel_for(self, stmt):
+        plan = parallel.analyze(stmt, self.pure)
+        if self.in_parallel:
+            # nested in an outlined body, which already runs on a worker
+            self.codegen_stmt(stmt.init)
+            self.codegen_loop(stmt.cond, stmt.body, stmt.update)
+            return
+        i8, i32, i64 = ir.IntType(8), ir.IntType(32), ir.IntType(64)
+        voidptr = i8.as_pointer()
+        self.codegen_stmt(stmt.init)
+        start = self.builder.load(self.symbols[plan.var])
+        n = self.parallel_trip_count(plan, start, self.codegen_expr(plan.bound))
+
+        start_slot = self.alloca(i32, "par.start")
+        self.builder.store(start, start_slot)
+        depth_slot = self.alloca(i32, "par.depth")
+        self.builder.store(self.depth, depth_slot)
+        fields = [start_slot, depth_slot]
+        for name in plan.shared + list(plan.reductions):
+            if name not in self.symbols:
+                raise RuntimeError(f"Undefined variable {name} in JIT")
+            fields.append(self.symbols[name])
+        for name in plan.arrays:
+            if name not in self.arrays:
+                raise RuntimeError(f"Undefined array {name} in JIT")
+            ptr, dims, _ = self.arrays[name]
+            fields += [ptr] + dims
+        staging = []
+        for name in plan.privates:
+            values = self.alloca(ir.ArrayType(i32, parallel.MAX_CHUNKS), f"{name}.par")
+            flags = self.alloca(ir.ArrayType(i8, parallel.MAX_CHUNKS), f"{name}.par.set")
+            self.call_c("memset", voidptr, [voidptr, i32, i64],
+                        [self.builder.bitcast(flags, voidptr), ir.Constant(i32, 0), ir.Constant(i64, parallel.MAX_CHUNKS)])
+            staging.append((name, values, flags))
+            fields += [values, flags]
+        ctx = self.alloca(ir.ArrayType(voidptr, len(fields)), "par.ctx")
+        for k, ptr in enumerate(fields):
+            self.builder.store(self.builder.bitcast(ptr, voidptr), self.builder.gep(ctx, [ir.Constant(i32, 0), ir.Constant(i32, k)]))
+
+        body = self.outline_parallel_body(stmt, plan)
+        status = self.builder.call(self.builder.load(self.runtime_hook("parallel")),
+                                   [self.builder.bitcast(body, voidptr), n, self.builder.bitcast(ctx, voidptr)])
+        ok_bb = self.func.append_basic_block("parallel.ok")
+        self.builder.cbranch(self.builder.icmp_signed('!=', status, ir.Constant(i32, 0)), self.exit_block, ok_bb)
+        self.builder.position_at_end(ok_bb)
+        self.check_abort()  # a call in the body failed
+        if staging:
+            self.copy_out_privates(staging)
+        # the loop variable ends where the sequential loop would leave it
+        last = self.builder.mul(self.builder.trunc(n, i32), ir.Constant(i32, plan.step))
+        self.builder.store(self.builder.add(start, last), self.symbols[plan.var])
+
+    def parallel_trip_count(self, plan, start, bound):
+        i64 = ir.IntType(64)
+        s, b = self.builder.sext(start, i64), self.builder.sext(bound, i64)
+        dist = self.builder.sub(b, s) if plan.cmp in ('LT', 'LE') else self.builder.sub(s, b)
+        step = ir.Constant(i64, abs(plan.step))
+        if plan.cmp in ('LT', 'GT'):
+            n = self.builder.sdiv(self.builder.add(dist, ir.Constant(i64, abs(plan.step) - 1)), step)
+            valid = self.builder.icmp_signed('>', dist, ir.Constant(i64, 0))
+        else:
+            n = self.builder.add(self.builder.sdiv(dist, step), ir.Constant(i64, 1))
+            valid = self.builder.icmp_signed('>=', dist, ir.Constant(i64, 0))
+        return self.builder.select(valid, n, ir.Constant(i64, 0))
+
+    def copy_out_privates(self, staging):
+        i32 = ir.IntType(32)
+        for name, _, _ in staging:
+            if name not in self.symbols:
+                self.symbols[name] = self.alloca(i32, name)
+                self.entry_builder.store(ir.Constant(i32, 0), self.symbols[name])
+        pre_bb = self.builder.block
+        loop_bb = self.func.append_basic_block("par.copyout")
+        done_bb = self.func.append_basic_block("par.copyout.done")
+        self.builder.branch(loop_bb)
+        self.builder.position_at_end(loop_bb)
+        c = self.builder.phi(i32, "chunk")
+        c.add_incoming(ir.Constant(i32, 0), pre_bb)
+        for name, values, flags in staging:
+            idx = [ir.Constant(i32, 0), c]
+            assigned = self.builder.load(self.builder.gep(flags, idx))
+            value = self.builder.load(self.builder.gep(values, idx))
+            old = self.builder.load(self.symbols[name])
+            keep = self.builder.select(self.builder.trunc(assigned, ir.IntType(1)), value, old)
+            self.builder.store(keep, self.symbols[name])
+        nxt = self.builder.add(c, ir.Constant(i32, 1))
+        c.add_incoming(nxt, self.builder.block)
+        self.builder.cbranch(self.builder.icmp_signed('<', nxt, ir.Constant(i32, parallel.MAX_CHUNKS)), loop_bb, done_bb)
+        self.builder.position_at_end(done_bb)
+
+    def outline_parallel_body(self, stmt, plan):
+        i8, i32, i64 = ir.IntType(8), ir.IntType(32), ir.IntType(64)
+        voidptr = i8.as_pointer()
+        saved = (self.func, self.builder, self.entry_builder, self.symbols, self.arrays, self.exit_block,
+                 self.fuel_slot, self.fuel, self.di_scope, self.private_flags, self.depth)
+        fn_ty = ir.FunctionType(ir.VoidType(), [i64, i64, voidptr.as_pointer(), i32, self.fuel_type()])
+        self.func = ir.Function(self.module, fn_ty, name=f"{self.func.name}.parallel{self._parallel_count}")
+        self._parallel_count += 1
+        k0, k1, ctx, chunk, fuel = self.func.args
+        entry = self.func.append_basic_block(name="entry")
+        body = self.func.append_basic_block(name="body")
+        self.entry_builder = ir.IRBuilder(entry)
+        self.builder = ir.IRBuilder(body)
+        self.exit_block = self.func.append_basic_block(name="exit")
+        self.symbols, self.arrays, self.private_flags = {}, {}, {}
+        self.in_parallel = True
+        if self.budget is not None:
+            self.load_fuel(fuel)
+        if self.perf:
+            shim = FuncDef(self.func.name, stmt.body)
+            shim.line = stmt.line
+            self.debug_subprogram(shim)
+
+        import itertools
+        fields = itertools.count()  # ctx slots, read in the order codegen_parallel_for wrote them
+        def field(ty):
+            ptr = self.entry_builder.load(self.entry_builder.gep(ctx, [ir.Constant(i32, next(fields))]))
+            return self.entry_builder.bitcast(ptr, ty.as_pointer())
+
+        def local(ty, name, value):
+            slot = self.alloca(ty, name)
+            self.entry_builder.store(value, slot)
+            return slot
+
+        start = self.entry_builder.load(field(i32))
+        self.depth = self.entry_builder.load(field(i32))
+        for name in plan.shared:
+            # read only: a local copy keeps the value in a register
+            self.symbols[name] = local(i32, name, self.entry_builder.load(field(i32)))
+        targets = {}
+        for name, kind in plan.reductions.items():
+            targets[name] = field(i32)
+            self.symbols[name] = local(i32, name, ir.Constant(i32, parallel.REDUCTION_IDENTITY[kind]))
+        for name in plan.arrays:
+            data = self.entry_builder.load(field(i32.as_pointer()))
+            dims = [local(i64, f"{name}.dim{k}", self.entry_builder.load(field(i64)))
+                    for k in range(len(saved[4][name][1]))]
+            self.arrays[name] = (local(data.type, name, data), dims, local(ir.IntType(1), f"{name}.rt", ir.Constant(ir.IntType(1), 0)))
+        staging = []
+        for name in plan.privates:
+            values, flags = field(ir.ArrayType(i32, parallel.MAX_CHUNKS)), field(ir.ArrayType(i8, parallel.MAX_CHUNKS))
+            self.symbols[name] = local(i32, name, ir.Constant(i32, 0))
+            self.private_flags[name] = local(ir.IntType(1), f"{name}.set", ir.Constant(ir.IntType(1), 0))
+            staging.append((name, values, flags))
+        var = self.symbols[plan.var] = self.alloca(i32, plan.var)
+
+        k = local(i64, "k", k0)
+        cond_bb = self.func.append_basic_block("loop.cond")
+        body_bb = self.func.append_basic_block("loop.body")
+        end_bb = self.func.append_basic_block("loop.end")
+        self.builder.branch(cond_bb)
+        self.builder.position_at_end(cond_bb)
+        kv = self.builder.load(k)
+        self.builder.cbranch(self.builder.icmp_signed('<', kv, k1), body_bb, end_bb)
+        self.builder.position_at_end(body_bb)
+        offset = self.builder.mul(self.builder.trunc(kv, i32), ir.Constant(i32, plan.step))
+        self.builder.store(self.builder.add(start, offset), var)
+        self.codegen_block(stmt.body)
+        self.builder.store(self.builder.add(self.builder.load(k), ir.Constant(i64, 1)), k)
+        self.codegen_back_edge(plan.cost)
+        self.builder.branch(cond_bb)
+
+        self.builder.position_at_end(end_bb)
+        for name, kind in plan.reductions.items():
+            self.combine_reduction(kind, targets[name], self.builder.load(self.symbols[name]))
+        for name, values, flags in staging:
+            idx = [ir.Constant(i32, 0), chunk]
+            self.builder.store(self.builder.load(self.symbols[name]), self.builder.gep(values, idx))
+            self.builder.store(self.builder.zext(self.builder.load(self.private_flags[name]), i8), self.builder.gep(flags, idx))
+        self.builder.branch(self.exit_block)
+        self.builder.position_at_end(self.exit_block)
+        self.store_fuel()
+        self.builder.ret_void()
+        self.entry_builder.branch(body)
+
+        outlined = self.func
+        (self.func, self.builder, self.entry_builder, self.symbols, self.arrays, self.exit_block,
+         self.fuel_slot, self.fuel, self.di_scope, self.private_flags, self.depth) = saved
+        self.in_parallel = False
+        return outlined
+
+    def combine_reduction(self, kind, target, value):
+        if kind == 'add':
+            self.builder.atomic_rmw('add', target, value, 'seq_cst')
+            return
+        # no atomic multiply: compare-and-swap until no other chunk got in between
+        pre_bb = self.builder.block
+        retry_bb = self.func.append_basic_block("reduce.retry")
+        done_bb = self.func.append_basic_block("reduce.done")
+        first = self.builder.load(target)
+        self.builder.branch(retry_bb)
+        self.builder.position_at_end(retry_bb)
+        old = self.builder.phi(value.type)
+        old.add_incoming(first, pre_bb)
+        result = self.builder.cmpxchg(target, old, self.builder.mul(old, value), 'seq_cst', 'seq_cst')
+        old.add_incoming(self.builder.extract_value(result, 0), retry_bb)
+        self.builder.cbranch(self.builder.extract_value(result, 1), done_bb, retry_bb)
+        self.builder.position_at_end(done_bb)
+
+    # ---------------- Arrays ----------------
+    # Arrays are flat, zero-initialised, row-major blocks of i32.
+    def array_entry(self, name, rank):
+        if name not in self.arrays:
+            ptr = self.alloca(ir.IntType(32).as_pointer(), name)
+            self.entry_builder.store(ir.Constant(ptr.type.pointee, None), ptr)
+            dims = [self.alloca(ir.IntType(64), f"{name}.dim{k}") for k in range(rank)]
+            owned = self.alloca(ir.IntType(1), f"{name}.rt")
+            self.entry_builder.store(ir.Constant(ir.IntType(1), 0), owned)
+            self.arrays[name] = (ptr, dims, owned)
+        entry = self.arrays[name]
+        if len(entry[1]) != rank:
+            raise RuntimeError(f"Array {name} redeclared with a different rank in JIT")
+        return entry
+
+    def codegen_array_decl(self, stmt):
+        i64 = ir.IntType(64)
+        entry = self.array_entry(stmt.name, len(stmt.dimensions))
+        total = ir.Constant(i64, 1)
+        for slot, d in zip(entry[1], stmt.dimensions):
+            n = self.builder.sext(self.codegen_expr(d), i64)
+            self.builder.store(n, slot)
+            total = self.builder.mul(total, n)
+        self.allocate_array(entry, total)
+
+    def allocate_array(self, entry, total):
+        # budget check, then a fresh zeroed block replaces whatever entry held
+        i64 = ir.IntType(64)
+        ptr, _, owned = entry
+        if self.budget is not None:
+            hook = self.builder.load(self.hook_global("__mycc_alloc_hook",
+                                     ir.FunctionType(ir.IntType(32), [i64]).as_pointer()))
+            over = self.builder.icmp_signed('!=', self.builder.call(hook, [total]), ir.Constant(ir.IntType(32), 0))
+            ok_bb = self.func.append_basic_block("alloc.ok")
+            self.builder.cbranch(over, self.exit_block, ok_bb)
+            self.builder.position_at_end(ok_bb)
+        self.release_array(entry)  # redeclaration replaces the old array
+        raw = self.call_c("calloc", ir.IntType(8).as_pointer(), [i64, i64], [total, ir.Constant(i64, 4)])
+        data = self.builder.bitcast(raw, ptr.type.pointee)
+        self.builder.store(data, ptr)
+        self.builder.store(ir.Constant(ir.IntType(1), 0), owned)
+        return data
+
+    def release_array(self, entry):
+        # calloc'd arrays are freed here; arrays from load_* belong to the Python runtime
+        ptr, _, owned = entry
+        data = self.builder.bitcast(self.builder.load(ptr), ir.IntType(8).as_pointer())
+        rt_bb = self.func.append_basic_block("release.rt")
+        free_bb = self.func.append_basic_block("release.free")
+        done_bb = self.func.append_basic_block("release.done")
+        self.builder.cbranch(self.builder.load(owned), rt_bb, free_bb)
+        self.builder.position_at_end(rt_bb)
+        self.builder.call(self.builder.load(self.runtime_hook("release")), [data])
+        self.builder.branch(done_bb)
+        self.builder.position_at_end(free_bb)
+        self.call_c("free", ir.VoidType(), [data.type], [data])
+        self.builder.branch(done_bb)
+        self.builder.position_at_end(done_bb)
+
+    def element_ptr(self, name, index_exprs):
+        if name not in self.arrays:
+            raise RuntimeError(f"Undefined array {name} in JIT")
+        ptr, dims, _ = self.arrays[name]
+        if len(index_exprs) != len(dims):
+            raise RuntimeError(f"Partial indexing of array {name} is not supported in JIT")
+        i64 = ir.IntType(64)
+        flat = None
+        for slot, e in zip(dims, index_exprs):
+            idx = self.builder.sext(self.codegen_expr(e), i64)
+            flat = idx if flat is None else self.builder.add(self.builder.mul(flat, self.builder.load(slot)), idx)
+        return self.builder.gep(self.builder.load(ptr), [flat])
 
     # ---------------- Generate expression ----------------
     def codegen_expr(self, expr):
         if isinstance(expr, Number):
             return ir.Constant(ir.IntType(32), expr.value)
+        if isinstance(expr, ArrayAccess) or (isinstance(expr, Var) and expr.index_exprs):
+            return self.builder.load(self.element_ptr(expr.name, expr.index_exprs))
         if isinstance(expr, Var):
             ptr = self.symbols.get(expr.name)
             if ptr is None:
                 raise RuntimeError(f"Undefined variable {expr.name} in JIT")
             return self.builder.load(ptr, expr.name)
+        if isinstance(expr, FuncCall):
+            return self.codegen_call(expr)
+        if isinstance(expr, UnaryOp):
+            val = self.codegen_expr(expr.expr)
+            if expr.op == 'NEG':
+                return self.builder.neg(val)
+            elif expr.op == 'NOT':
+                return self.builder.zext(self.builder.icmp_signed('==', val, ir.Constant(val.type, 0)), ir.IntType(32))
+            raise RuntimeError(f"Unknown unary operator {expr.op}")
         if isinstance(expr, BinOp):
             l = self.codegen_expr(expr.left)
             r = self.codegen_expr(expr.right)
@@ -63,21 +733,194 @@ class CodeGen:
             elif expr.op == 'MUL': 
                 return self.builder.mul(l, r)
             elif expr.op == 'DIV': 
-                return self.builder.sdiv(l, r)
+                return self.floor_divmod(l, r)[0]
+            elif expr.op == 'MOD':
+                return self.floor_divmod(l, r)[1]
+            elif expr.op in _CMP_OPS:
+                return self.builder.zext(self.builder.icmp_signed(_CMP_OPS[expr.op], l, r), ir.IntType(32))
+            elif expr.op == 'AND':
+                # the interpreter's int(l and r): r when l is true, else 0
+                return self.builder.select(self.truth(l), r, ir.Constant(r.type, 0))
+            elif expr.op == 'OR':
+                return self.builder.select(self.truth(l), l, r)
             else:
                 raise RuntimeError(f"Unknown operator {expr.op}")
+        raise RuntimeError(f"Unsupported expression {type(expr).__name__} in JIT")
+
+    # ---------------- Builtins ----------------
+    # Data I/O runs in Python (see dataio); generated code reaches it through
+    # function pointers that run_jit fills in, like the budget hooks.
+    _RUNTIME_HOOKS = {
+        # name: (return type, argument types)
+        "load": (ir.IntType(32).as_pointer(), [ir.IntType(8).as_pointer(), ir.IntType(32), ir.IntType(64).as_pointer()]),
+        "save": (ir.IntType(64), [ir.IntType(8).as_pointer(), ir.IntType(32).as_pointer(), ir.IntType(64), ir.IntType(32)]),
+        "release": (ir.VoidType(), [ir.IntType(8).as_pointer()]),
+        "depth": (ir.VoidType(), [ir.IntType(8).as_pointer(), ir.IntType(32)]),  # (function name, limit)
+        # (outlined body, iteration count, context) -> non-zero to stop
+        "parallel": (ir.IntType(32), [ir.IntType(8).as_pointer(), ir.IntType(64), ir.IntType(8).as_pointer()]),
+    }
+
+    def runtime_hook(self, name):
+        ret, args = self._RUNTIME_HOOKS[name]
+        return self.hook_global(f"__mycc_rt_{name}", ir.FunctionType(ret, args).as_pointer())
+
+    def is_array_load(self, expr):
+        return isinstance(expr, FuncCall) and expr.name in dataio.ARRAY_BUILTINS
+
+    def string_arg(self, call, k):
+        if k >= len(call.args) or not isinstance(call.args[k], String):
+            raise RuntimeError(f"{call.name}() expects a string literal path in JIT")
+        return self.global_cstring(call.args[k].value + "\0")
+
+    def array_arg(self, call, k):
+        if k >= len(call.args) or not isinstance(call.args[k], Var) or call.args[k].name not in self.arrays:
+            raise RuntimeError(f"{call.name}() expects an array variable in JIT")
+        return self.arrays[call.args[k].name]
+
+    def array_length(self, entry):
+        total = ir.Constant(ir.IntType(64), 1)
+        for slot in entry[1]:
+            total = self.builder.mul(total, self.builder.load(slot))
+        return total
+
+    def codegen_array_load(self, name, call):
+        if len(call.args) != 1:
+            raise RuntimeError(f"{call.name}() takes 1 argument(s), got {len(call.args)}")
+        path = self.string_arg(call, 0)
+        entry = self.array_entry(name, 1)
+        _, count = self.load_array(entry, path, call.name)
+        self.builder.store(count, entry[1][0])
+
+    def load_array(self, entry, path, builtin):
+        # returns (data pointer, i64 element count); a failed load leaves via the exit block
+        ptr, _, owned = entry
+        count = self.alloca(ir.IntType(64), "count")
+        kind = ir.Constant(ir.IntType(32), 0 if builtin == 'load_bin' else 1)
+        data = self.builder.call(self.builder.load(self.runtime_hook("load")), [path, kind, count])
+        failed = self.builder.icmp_unsigned('==', data, ir.Constant(data.type, None))
+        ok_bb = self.func.append_basic_block("load.ok")
+        self.builder.cbranch(failed, self.exit_block, ok_bb)
+        self.builder.position_at_end(ok_bb)
+        self.release_array(entry)
+        self.builder.store(data, ptr)
+        self.builder.store(ir.Constant(ir.IntType(1), 1), owned)
+        return data, self.builder.load(count)
+
+    def save_array(self, path, data, length, builtin):
+        kind = ir.Constant(ir.IntType(32), 0 if builtin == 'save_bin' else 1)
+        written = self.builder.call(self.builder.load(self.runtime_hook("save")), [path, data, length, kind])
+        ok_bb = self.func.append_basic_block("save.ok")
+        self.builder.cbranch(self.builder.icmp_signed('<', written, ir.Constant(written.type, 0)),
+                             self.exit_block, ok_bb)
+        self.builder.position_at_end(ok_bb)
+        return self.builder.trunc(written, ir.IntType(32))
+
+    def codegen_call(self, call):
+        if call.name == 'len':
+            return self.builder.trunc(self.array_length(self.array_arg(call, 0)), ir.IntType(32))
+        if call.name in ('save_bin', 'save_txt'):
+            if len(call.args) != 2:
+                raise RuntimeError(f"{call.name}() takes 2 argument(s), got {len(call.args)}")
+            path = self.string_arg(call, 0)
+            entry = self.array_arg(call, 1)
+            return self.save_array(path, self.builder.load(entry[0]), self.array_length(entry), call.name)
+        if self.is_array_load(call):
+            raise RuntimeError(f"{call.name}() can only initialise an array variable in JIT")
+        return self.codegen_user_call(call)
+
+    def truth(self, val):
+        return self.builder.icmp_signed('!=', val, ir.Constant(val.type, 0))
+
+    def floor_divmod(self, l, r):
+        # Python semantics (what the interpreter does): round the quotient toward -inf
+        q = self.builder.sdiv(l, r)
+        m = self.builder.srem(l, r)
+        zero = ir.Constant(l.type, 0)
+        adjust = self.builder.and_(self.builder.icmp_signed('!=', m, zero),
+                                   self.builder.icmp_signed('<', self.builder.xor(m, r), zero))
+        q = self.builder.select(adjust, self.builder.sub(q, ir.Constant(l.type, 1)), q)
+        m = self.builder.select(adjust, self.builder.add(m, r), m)
+        return q, m
+
+    # ---------------- Budget checks ----------------
+    # A fuel counter is decremented at every loop back-edge; only when it runs
+    # out does the generated code call back into Python (see run_jit). Fuel
+    # lives in slots of {left, granted}: main uses the global one, and each
+    # parallel loop chunk gets its own, passed down to the functions it calls.
+    # A function counts down a local copy, which promote_locals keeps in a
+    # register, and writes it back to the slot only around calls and on exit.
+    def hook_global(self, name, ty):
+        g = self.module.globals.get(name)
+        if g is None:
+            g = ir.GlobalVariable(self.module, ty, name=name)
+            g.initializer = ir.Constant(ty, None)
+            g.linkage = 'common'  # separately compiled modules share one copy
+        return g
+
+    def fuel_type(self):
+        return ir.IntType(64).as_pointer()
+
+    def main_fuel(self):
+        slot = self.hook_global("__mycc_fuel", ir.ArrayType(ir.IntType(64), 2))
+        return slot.gep([ir.Constant(ir.IntType(32), 0), ir.Constant(ir.IntType(32), 0)])
+
+    def load_fuel(self, slot):
+        self.fuel_slot = slot
+        self.fuel = self.alloca(ir.IntType(64), "fuel")
+        self.entry_builder.store(self.entry_builder.load(slot), self.fuel)
+
+    def store_fuel(self):
+        if self.budget is not None:
+            self.builder.store(self.builder.load(self.fuel), self.fuel_slot)
+
+    def codegen_back_edge(self, cost):
+        if self.budget is None:
+            return
+        i64 = ir.IntType(64)
+        left = self.builder.sub(self.builder.load(self.fuel), ir.Constant(i64, cost))
+        self.builder.store(left, self.fuel)
+        empty_bb = self.func.append_basic_block("fuel.empty")
+        ok_bb = self.func.append_basic_block("fuel.ok")
+        self.builder.cbranch(self.builder.icmp_signed('<', left, ir.Constant(i64, 0)), empty_bb, ok_bb)
+        self.builder.position_at_end(empty_bb)
+        self.builder.store(left, self.fuel_slot)
+        hook = self.builder.load(self.hook_global("__mycc_budget_hook",
+                                 ir.FunctionType(ir.IntType(32), [self.fuel_type()]).as_pointer()))
+        stop = self.builder.icmp_signed('!=', self.builder.call(hook, [self.fuel_slot]), ir.Constant(ir.IntType(32), 0))
+        refill_bb = self.func.append_basic_block("fuel.refill")
+        self.builder.cbranch(stop, self.exit_block, refill_bb)
+        self.builder.position_at_end(refill_bb)
+        self.builder.store(self.builder.load(self.fuel_slot), self.fuel)
+        self.builder.branch(ok_bb)
+        self.builder.position_at_end(ok_bb)
+
+    # ---------------- libc helpers ----------------
+    def call_c(self, name, ret_ty, arg_tys, args):
+        fn = self.module.globals.get(name)
+        if fn is None:
+            fn = ir.Function(self.module, ir.FunctionType(ret_ty, arg_tys), name=name)
+        return self.builder.call(fn, args)
 
     # ---------------- Print integer ----------------
     def printf_int(self, val):
+        self.printf("%d\n\0", [val])
+
+    def printf_str(self, text):
+        self.printf("%s\n\0", [self.global_cstring(text + "\0")])
+
+    def printf(self, fmt, args):
         voidptr_ty = ir.IntType(8).as_pointer()
         printf_ty = ir.FunctionType(ir.IntType(32), [voidptr_ty], var_arg=True)
         printf = self.module.globals.get('printf')
         if printf is None:
             printf = ir.Function(self.module, printf_ty, name="printf")
+        fmt_ptr = self.global_cstring(fmt)
+        self.builder.call(printf, [fmt_ptr] + args)
 
-        fmt = "%d\n\0"
-        c_fmt = ir.Constant(ir.ArrayType(ir.IntType(8), len(fmt)),
-                            bytearray(fmt.encode("utf8")))
+    def global_cstring(self, text):
+        voidptr_ty = ir.IntType(8).as_pointer()
+        data = bytearray(text.encode("utf8"))
+        c_fmt = ir.Constant(ir.ArrayType(ir.IntType(8), len(data)), data)
 
         # make unique global name for each printf call
         name = f"fstr_{self._fmt_counter}"
@@ -87,31 +930,490 @@ class CodeGen:
         global_fmt.linkage = 'internal'
         global_fmt.global_constant = True
         global_fmt.initializer = c_fmt
-        fmt_ptr = self.builder.bitcast(global_fmt, voidptr_ty)
-        self.builder.call(printf, [fmt_ptr, val])
+        return self.builder.bitcast(global_fmt, voidptr_ty)
+
+    # ---------------- Lowering from the mid-level IR ----------------
+    # SSA values map one to one onto LLVM values. An array value becomes a
+    # (data pointer, [i64 dimensions]) pair; every alloc/load site owns an array
+    # entry, so re-running the site or leaving the function frees the old block.
+    def generate_mir(self, mir_module, tree=None):
+        self.tree = tree  # for the interpreter fallback in run_jit
+        for mfunc in mir_module.functions.values():
+            self.codegen_mir_func(mfunc)
+
+    def codegen_mir_func(self, mfunc):
+        i32 = ir.IntType(32)
+        self.func = ir.Function(self.module, ir.FunctionType(i32, ()), name=mfunc.name)
+        entry = self.func.append_basic_block(name="entry")
+        self.entry_builder = ir.IRBuilder(entry)
+        self.builder = ir.IRBuilder(entry)
+        self.arrays = {}
+        self.mir_values = {}
+        if self.budget is not None:
+            self.load_fuel(self.main_fuel())
+        blocks = {b: self.func.append_basic_block(name=b.name) for b in mfunc.blocks}
+        self.exit_block = self.func.append_basic_block(name="exit")
+        # phis first: their operands may be defined further down the CFG
+        for b in mfunc.blocks:
+            self.builder.position_at_end(blocks[b])
+            for phi in b.phis:
+                self.mir_values[phi] = self.mir_phi(phi)
+        tails = {}
+        for b in mfunc.blocks:
+            self.builder.position_at_end(blocks[b])
+            for instr in b.instrs:
+                self.codegen_mir_instr(instr, blocks)
+            tails[b] = self.builder.block  # lowering may have split the block
+        for b in mfunc.blocks:
+            for phi in b.phis:
+                for arg, pred in zip(phi.args, phi.incoming):
+                    self.add_mir_incoming(phi, arg, tails[pred])
+        self.builder.position_at_end(self.exit_block)
+        self.store_fuel()
+        for entry in self.arrays.values():
+            self.release_array(entry)
+        self.builder.ret(ir.Constant(i32, 0))
+        self.entry_builder.branch(blocks[mfunc.entry])
+
+    def mir_phi(self, phi):
+        if phi.type == 'int':
+            return self.builder.phi(ir.IntType(32))
+        if phi.type == 'array':
+            return (self.builder.phi(ir.IntType(32).as_pointer()),
+                    [self.builder.phi(ir.IntType(64)) for _ in range(phi.rank)])
+        raise RuntimeError(f"{phi.type} variables are not supported in JIT")
+
+    def add_mir_incoming(self, phi, arg, block):
+        value = self.mir_value(arg, phi)
+        if phi.type == 'array':
+            ptr, dims = self.mir_values[phi]
+            ptr.add_incoming(value[0], block)
+            for d, v in zip(dims, value[1]):
+                d.add_incoming(v, block)
+        else:
+            self.mir_values[phi].add_incoming(value, block)
+
+    def mir_value(self, v, like=None):
+        like = like or v
+        if isinstance(v, mir.Const):
+            if v.type != 'int':
+                raise RuntimeError("String values are only supported as print and file arguments in JIT")
+            return ir.Constant(ir.IntType(32), v.value)
+        if isinstance(v, mir.Undef):
+            if like.type == 'array':
+                return (ir.Constant(ir.IntType(32).as_pointer(), None), [ir.Constant(ir.IntType(64), 0)] * like.rank)
+            return ir.Constant(ir.IntType(32), 0)
+        return self.mir_values[v]
+
+    def mir_string(self, v):
+        if not isinstance(v, mir.Const) or v.type != 'str':
+            raise RuntimeError("Expected a string literal in JIT")
+        return self.global_cstring(v.value + "\0")
+
+    def codegen_mir_instr(self, instr, blocks):
+        b, op = self.builder, instr.op
+        i32, i64 = ir.IntType(32), ir.IntType(64)
+        if op == 'br':
+            b.branch(blocks[instr.targets[0]])
+            return
+        if op == 'cbr':
+            b.cbranch(self.truth(self.mir_value(instr.args[0])), blocks[instr.targets[0]], blocks[instr.targets[1]])
+            return
+        if op == 'ret':
+            b.branch(self.exit_block)
+            return
+        if op == 'print':
+            arg = instr.args[0]
+            if arg.type == 'str':
+                self.printf("%s\n\0", [self.mir_string(arg)])
+            else:
+                self.printf_int(self.mir_value(arg))
+            return
+        if op == 'charge':
+            self.codegen_back_edge(instr.args[0].value)
+            return
+        if op == 'call':
+            self.mir_values[instr] = self.codegen_mir_call(instr)
+            return
+        if op == 'alloc':
+            entry = self.array_entry(f"{instr.name or 'array'}.{len(self.arrays)}", instr.rank)
+            dims = [b.sext(self.mir_value(a), i64) for a in instr.args]
+            total = ir.Constant(i64, 1)
+            for n in dims:
+                total = b.mul(total, n)
+            self.mir_values[instr] = (self.allocate_array(entry, total), dims)
+            return
+
+        args = [self.mir_value(a) for a in instr.args]
+        if op == 'store':
+            (data, _), index, value = args
+            b.store(value, b.gep(data, [b.sext(index, i64)]))
+            return
+        if op == 'load':
+            (data, _), index = args
+            result = b.load(b.gep(data, [b.sext(index, i64)]))
+        elif op == 'dim':
+            result = b.trunc(args[0][1][instr.args[1].value], i32)
+        elif op == 'len':
+            total = ir.Constant(i64, 1)
+            for n in args[0][1]:
+                total = b.mul(total, n)
+            result = b.trunc(total, i32)
+        elif op == 'copy':
+            result = args[0]
+        elif op == 'neg':
+            result = b.neg(args[0])
+        elif op == 'not':
+            result = b.zext(b.icmp_signed('==', args[0], ir.Constant(i32, 0)), i32)
+        elif op in ('add', 'sub', 'mul'):
+            result = getattr(b, op)(args[0], args[1])
+        elif op in ('div', 'mod'):
+            result = self.floor_divmod(args[0], args[1])[op == 'mod']
+        elif op in _MIR_CMP_OPS:
+            result = b.zext(b.icmp_signed(_MIR_CMP_OPS[op], args[0], args[1]), i32)
+        elif op == 'and':
+            # the interpreter's int(l and r): r when l is true, else 0
+            result = b.select(self.truth(args[0]), args[1], ir.Constant(i32, 0))
+        elif op == 'or':
+            result = b.select(self.truth(args[0]), args[0], args[1])
+        else:
+            raise RuntimeError(f"Unsupported MIR instruction {op} in JIT")
+        self.mir_values[instr] = result
+
+    def codegen_mir_call(self, instr):
+        path = self.mir_string(instr.args[0])
+        if instr.callee in dataio.ARRAY_BUILTINS:
+            entry = self.array_entry(f"{instr.name or 'loaded'}.{len(self.arrays)}", 1)
+            data, count = self.load_array(entry, path, instr.callee)
+            return data, [count]
+        data, dims = self.mir_value(instr.args[1])
+        length = ir.Constant(ir.IntType(64), 1)
+        for n in dims:
+            length = self.builder.mul(length, n)
+        return self.save_array(path, data, length, instr.callee)
+
+    # ---------------- Object files ----------------
+    def emit_object(self):
+        target_machine = binding.Target.from_default_triple().create_target_machine(codemodel='large')
+        llvm_mod = binding.parse_assembly(str(self.module))
+        llvm_mod.verify()
+        promote_locals(llvm_mod)
+        return target_machine.emit_object(llvm_mod)
 
     # ---------------- Run JIT ----------------
-    def run_jit(self):
+    def run_jit(self, metrics=None, perf=None):
+        # perf: a perfmap.PerfRecorder told about every function MCJIT emits
         import ctypes
-        llvm_ir = str(self.module)
+        metrics = metrics if metrics is not None else Metrics()
+        with metrics.phase("ir_serialize"):
+            llvm_ir = str(self.module)
 
         try:
             # JIT compilation
-            triple = binding.get_default_triple()
-            target = binding.Target.from_triple(triple)
-            target_machine = target.create_target_machine()
-            backing_mod = binding.parse_assembly(llvm_ir)
-            engine = binding.create_mcjit_compiler(backing_mod, target_machine)
-            engine.finalize_object()
-            func_ptr = engine.get_function_address("main")
-
-            # Call the JITed function
-            cfunc = ctypes.CFUNCTYPE(ctypes.c_int)(func_ptr)
-            return cfunc()
+            with metrics.phase("llvm_parse"):
+                triple = binding.get_default_triple()
+                target = binding.Target.from_triple(triple)
+                target_machine = target.create_target_machine()
+                backing_mod = binding.parse_assembly(llvm_ir)
+            with metrics.phase("llvm_optimize"):
+                promote_locals(backing_mod)
+            with metrics.phase("mcjit_finalize"):
+                engine = binding.create_mcjit_compiler(backing_mod, target_machine)
+                objects = []
+                if perf is not None:
+                    engine.set_object_cache(lambda module, buf: objects.append(buf))
+                engine.finalize_object()
+                func_ptr = engine.get_function_address("main")
+            if perf is not None:
+                with metrics.phase("perf_map"):
+                    self.report_perf(engine, objects, perf)
 
         except RuntimeError as e:
             # Fallback to interpreter if JIT fails
+            metrics.record_fallback("jit_compile", e)
             print("[Warning] LLVM JIT failed:", e)
             print("[Info] Falling back to interpreter mode...")
-            from interpreter import HybridInterpreter
-            HybridInterpreter(self.tree).run()
+            from interpreter import Interpreter
+            with metrics.phase("execute"):
+                return Interpreter(self.tree, budget=self.budget, workers=self.workers,
+                                   memo=self.memo, max_depth=self.max_depth).run()
+
+        # Call the JITed function
+        cfunc = ctypes.CFUNCTYPE(ctypes.c_int)(func_ptr)
+        metrics.engine = "jit"
+        with metrics.phase("execute"):
+            return _call_with_runtime(engine, cfunc, self.budget, self.workers, self.max_depth)
+
+    def line_table(self, engine):
+        # (address, line) of every statement start, read back from __mycc_line_addrs
+        import ctypes
+        if not self.line_marks:
+            return []
+        addr = engine.get_global_value_address("__mycc_line_addrs")
+        if not addr:
+            return []
+        addrs = (ctypes.c_uint64 * len(self.line_marks)).from_address(addr)
+        return sorted((a, line) for a, (_, _, line) in zip(addrs, self.line_marks))
+
+    def report_perf(self, engine, objects, perf):
+        from perfmap import function_symbols
+        import os
+        lines = self.line_table(engine)
+        source = os.path.abspath(self.source_name)
+        for obj in objects:
+            for name, size in function_symbols(obj).items():
+                start = engine.get_function_address(name)
+                if not start:
+                    continue
+                entries = [(a, line, source) for a, line in lines if start <= a < start + size]
+                perf.record(f"{name} [{self.source_name}]", start, size, entries)
+
+def promote_locals(llvm_mod):
+    # Locals are allocas (see CodeGen.alloca); SROA turns those whose address
+    # never escapes into SSA registers, the fuel counter included. This is the
+    # only LLVM pass run, so the emitted code still follows the source closely.
+    pm = binding.create_module_pass_manager()
+    pm.add_sroa_pass()
+    pm.run(llvm_mod)
+
+def _call_with_runtime(engine, cfunc, budget=None, workers=None, max_depth=None):
+    stack_size = native_stack_size(max_depth or DEFAULT_MAX_DEPTH)
+    runtime = _IORuntime(engine, budget)
+    hooks = _BudgetHooks(budget, engine) if budget is not None else None
+    loops = _ParallelRuntime(engine, workers, hooks, stack_size)
+    calls = _CallRuntime(engine)
+    result = _run_on_stack(cfunc, stack_size)
+    if hooks is not None:
+        hooks.settle()
+    runtime.close()
+    if budget is not None and budget.exceeded is not None:
+        raise budget.exceeded
+    for error in (runtime.error, loops.error, calls.error):
+        if error is not None:
+            raise ProgramError(str(error)) from error
+    return result
+
+def _run_on_stack(cfunc, stack_size):
+    # the calling thread's stack may be too small for max_depth native frames
+    import threading
+    result = []
+    old = threading.stack_size(stack_size)
+    try:
+        thread = threading.Thread(target=lambda: result.append(cfunc()), name="mycc-jit", daemon=True)
+        thread.start()
+    finally:
+        threading.stack_size(old)
+    thread.join()
+    return result[0]
+
+def _set_hook(engine, name, cb):
+    import ctypes
+    addr = engine.get_global_value_address(name)
+    if addr:
+        ctypes.c_void_p.from_address(addr).value = ctypes.cast(cb, ctypes.c_void_p).value
+
+# ---------------- Data I/O runtime for JIT code ----------------
+class _IORuntime:
+    def __init__(self, engine, budget=None):
+        import ctypes
+        self.budget = budget
+        self.error = None
+        self.buffers = {}  # address -> (buffer, ctypes view) kept alive while native code uses it
+        self._load_cb = ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int32,
+                                         ctypes.POINTER(ctypes.c_int64))(self.on_load)
+        self._save_cb = ctypes.CFUNCTYPE(ctypes.c_int64, ctypes.c_char_p, ctypes.c_void_p,
+                                         ctypes.c_int64, ctypes.c_int32)(self.on_save)
+        self._release_cb = ctypes.CFUNCTYPE(None, ctypes.c_void_p)(self.on_release)
+        _set_hook(engine, "__mycc_rt_load", self._load_cb)
+        _set_hook(engine, "__mycc_rt_save", self._save_cb)
+        _set_hook(engine, "__mycc_rt_release", self._release_cb)
+
+    def on_load(self, path, kind, count):
+        import ctypes
+        try:
+            path = path.decode("utf8")
+            buf = dataio.bin_buffer(path) if kind == 0 else dataio.txt_buffer(path)
+            n = len(buf) // dataio.ITEM_SIZE
+            if self.budget is not None:
+                self.budget.allocate(n)
+            if not len(buf):
+                buf = bytearray(dataio.ITEM_SIZE)  # keep a non-null pointer for empty files
+            view = (ctypes.c_char * len(buf)).from_buffer(buf)  # no copy: points into the mapping
+            addr = ctypes.addressof(view)
+            self.buffers[addr] = (buf, view)
+            count[0] = n
+            return addr
+        except Exception as e:
+            self.error = e
+            return None
+
+    def on_save(self, path, data, n, kind):
+        import ctypes
+        try:
+            values = memoryview((ctypes.c_int32 * n).from_address(data)).cast('B').cast(dataio.ITEM_CODE)
+            path = path.decode("utf8")
+            return dataio.save_bin(path, values) if kind == 0 else dataio.save_txt(path, values)
+        except Exception as e:
+            self.error = e
+            return -1
+
+    def on_release(self, data):
+        self.buffers.pop(data, None)
+
+    def close(self):
+        self.buffers.clear()
+
+# ---------------- Budget callbacks for JIT code ----------------
+class _BudgetHooks:
+    # Fuel slots are {left, granted}: what native code burnt since the last
+    # refill is granted - left. Chunks of parallel loops call in from worker
+    # threads, so charging the budget is serialised.
+    def __init__(self, budget, engine):
+        import ctypes
+        import threading
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.fuel = None
+        # callbacks must stay referenced for as long as native code may call them
+        self._fuel_cb = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p)(self.on_empty)
+        self._alloc_cb = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_int64)(self.on_alloc)
+        _set_hook(engine, "__mycc_budget_hook", self._fuel_cb)
+        _set_hook(engine, "__mycc_alloc_hook", self._alloc_cb)
+        addr = engine.get_global_value_address("__mycc_fuel")
+        if addr:
+            self.fuel = (ctypes.c_int64 * 2).from_address(addr)
+            self.grant(self.fuel)
+
+    def new_slot(self):
+        # empty: the chunk's first back-edge asks for fuel
+        import ctypes
+        return (ctypes.c_int64 * 2)()
+
+    def grant(self, slot):
+        slot[0] = slot[1] = self.budget.refill()
+
+    def on_empty(self, addr):
+        import ctypes
+        slot = (ctypes.c_int64 * 2).from_address(addr)
+        try:
+            with self.lock:
+                if self.budget.exceeded is not None:
+                    return 1  # another chunk ran out: stop this one too
+                self.budget.charge(slot[1] - slot[0])
+                self.grant(slot)
+            return 0
+        except ResourceLimitExceeded:
+            return 1
+        except Exception:
+            return 1
+
+    def on_alloc(self, n):
+        try:
+            self.budget.allocate(n)
+            return 0
+        except ResourceLimitExceeded:
+            return 1
+        except Exception:
+            return 1
+
+    def settle(self, slot=None):
+        # account for fuel burnt since the last refill
+        slot = self.fuel if slot is None else slot
+        with self.lock:
+            if slot is not None and self.budget.exceeded is None:
+                self.budget.statements += slot[1] - slot[0]
+                slot[1] = slot[0]
+
+# ---------------- Parallel loop runtime for JIT code ----------------
+class _ParallelRuntime:
+    def __init__(self, engine, workers=None, hooks=None, stack_size=0):
+        import ctypes
+        self.workers = workers or parallel.default_workers()
+        self.hooks = hooks  # _BudgetHooks, when the run has a budget
+        self.stack_size = stack_size  # chunks call functions too, see native_stack_size
+        self.error = None
+        addr = engine.get_global_value_address("__mycc_parallel_active")
+        self.active = ctypes.c_int32.from_address(addr) if addr else None
+        self._body_ty = ctypes.CFUNCTYPE(None, ctypes.c_int64, ctypes.c_int64, ctypes.c_void_p, ctypes.c_int32,
+                                         ctypes.c_void_p)
+        self._cb = ctypes.CFUNCTYPE(ctypes.c_int32, ctypes.c_void_p, ctypes.c_int64,
+                                    ctypes.c_void_p)(self.on_parallel)
+        _set_hook(engine, "__mycc_rt_parallel", self._cb)
+
+    def on_parallel(self, fn, n, ctx):
+        import ctypes
+        try:
+            body = self._body_ty(fn)
+            bounds = parallel.split(n, self.workers)
+            hooks = self.hooks
+            # every chunk burns its own fuel, charged to the budget as it refills
+            slots = [hooks.new_slot() if hooks is not None else None for _ in bounds]
+            fuel = [ctypes.addressof(slot) if slot is not None else None for slot in slots]
+            try:
+                if len(bounds) == 1:
+                    body(0, n, ctx, 0, fuel[0])
+                else:
+                    self.run_chunks(body, bounds, ctx, fuel)
+            finally:
+                if hooks is not None:
+                    for slot in slots:
+                        hooks.settle(slot)
+            if hooks is not None:
+                if hooks.budget.exceeded is not None:
+                    return 1
+                hooks.budget.check()  # chunks together may have used more than was left
+            return 0
+        except ResourceLimitExceeded:
+            return 1
+        except Exception as e:
+            self.error = e
+            return 1
+
+    def run_chunks(self, body, bounds, ctx, fuel):
+        # ctypes drops the GIL around each native call, so chunks really run concurrently
+        pool = parallel.thread_pool(self.workers, self.stack_size)
+        if self.active is not None:
+            self.active.value = 1
+        futures = []
+        try:
+            futures = [pool.submit(body, k0, k1, ctx, c, fuel[c]) for c, (k0, k1) in enumerate(bounds)]
+            for f in futures:
+                f.result()
+        finally:
+            concurrent.futures.wait(futures)  # no chunk may still be running once the flag drops
+            if self.active is not None:
+                self.active.value = 0
+
+# ---------------- Call depth limit for JIT code ----------------
+class _CallRuntime:
+    def __init__(self, engine):
+        import ctypes
+        self.error = None
+        self._depth_cb = ctypes.CFUNCTYPE(None, ctypes.c_char_p, ctypes.c_int32)(self.on_depth)
+        _set_hook(engine, "__mycc_rt_depth", self._depth_cb)
+
+    def on_depth(self, name, limit):
+        # same message as the interpreter's
+        self.error = RuntimeError(f"maximum call depth {limit} exceeded in {name.decode('utf8')}()")
+
+# ---------------- Run separately compiled modules ----------------
+def run_jit_objects(objects, entry="main", perf=None, workers=None, budget=None, max_depth=None):
+    # budget only meters objects compiled with budget checks (ModuleBuilder(metered=True))
+    import ctypes
+    target_machine = binding.Target.from_default_triple().create_target_machine()
+    engine = binding.create_mcjit_compiler(binding.parse_assembly(""), target_machine)
+    for data in objects:
+        engine.add_object_file(binding.ObjectFileRef.from_data(data))
+    engine.finalize_object()
+    if perf is not None:
+        from perfmap import function_symbols
+        for data in objects:
+            for name, size in function_symbols(data).items():
+                addr = engine.get_function_address(name)
+                if addr:
+                    perf.record(name, addr, size)
+    func_ptr = engine.get_function_address(entry)
+    if not func_ptr:
+        raise RuntimeError(f"Entry point {entry} not found in linked modules")
+    cfunc = ctypes.CFUNCTYPE(ctypes.c_int)(func_ptr)
+    return _call_with_runtime(engine, cfunc, budget, workers, max_depth)
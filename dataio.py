@@ -0,0 +1,115 @@
+import mmap
+import os
+from array import array
+from limits import ProgramError
+
+# Binary files are flat native-endian int32, the same layout the JIT uses for arrays.
+ITEM_SIZE = 4
+ITEM_CODE = 'i'
+ITEM_MIN, ITEM_MAX = -2 ** 31, 2 ** 31 - 1
+
+# Elements are int32 in every engine, but only JIT arithmetic is 32-bit: it
+# wraps, while the interpreters compute with Python ints. Summing 0..99999 read
+# from a file prints 4999950000 interpreted and 704982704 compiled, so results
+# that must agree across engines have to stay in int32 range. Reading or saving
+# a value outside it is an error.
+
+# Below this size a plain read beats setting up a mapping
+MMAP_THRESHOLD = 1 << 16
+
+BUILTINS = ('load_bin', 'load_txt', 'save_bin', 'save_txt', 'len')
+ARRAY_BUILTINS = ('load_bin', 'load_txt')  # builtins that produce a new array
+
+# ---------------- Raw buffers ----------------
+def map_file(path):
+    # writable buffer over the file contents; large files are mapped copy-on-write,
+    # so the program can modify the array without touching the file
+    size = os.path.getsize(path)
+    if size < MMAP_THRESHOLD:
+        with open(path, 'rb') as f:
+            return bytearray(f.read())
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+def bin_buffer(path):
+    buf = map_file(path)
+    if len(buf) % ITEM_SIZE:
+        raise ProgramError(f'{path}: size {len(buf)} is not a multiple of {ITEM_SIZE} bytes')
+    return buf
+
+def txt_buffer(path):
+    buf = map_file(path)
+    try:
+        return bytearray(array(ITEM_CODE, map(int, buf[:].split())).tobytes())
+    except (ValueError, OverflowError):
+        raise ProgramError(txt_error(path, buf)) from None
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+
+def txt_error(path, buf):
+    # slow path once parsing failed: the first bad value and its line
+    for lineno, line in enumerate(buf[:].splitlines(), 1):
+        for token in line.split():
+            try:
+                value = int(token)
+            except ValueError:
+                return f'{path}:{lineno}: {token.decode(errors="replace")!r} is not an integer'
+            if not ITEM_MIN <= value <= ITEM_MAX:
+                return f'{path}:{lineno}: {value} does not fit in int32'
+    return f'{path}: not a text file of integers'
+
+# ---------------- Interpreter arrays ----------------
+def load_bin(path):
+    # zero-copy: the returned view indexes the mapping directly
+    return memoryview(bin_buffer(path)).cast(ITEM_CODE)
+
+def load_txt(path):
+    return memoryview(txt_buffer(path)).cast(ITEM_CODE)
+
+def flatten(path, arr):
+    if isinstance(arr, (memoryview, array)):
+        return arr
+    flat = array(ITEM_CODE)
+    stack = [arr]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            stack.extend(reversed(item))
+        elif ITEM_MIN <= item <= ITEM_MAX:
+            flat.append(item)
+        else:
+            raise ProgramError(f'{path}: cannot save {item}, it does not fit in int32')
+    return flat
+
+def save_bin(path, arr):
+    data = flatten(path, arr)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+def save_txt(path, arr):
+    data = flatten(path, arr)
+    with open(path, 'w') as f:
+        f.write('\n'.join(map(str, data)))
+        if len(data):
+            f.write('\n')
+    return len(data)
+
+def length(arr):
+    # total element count, matching the flat arrays of the JIT
+    dims = getattr(arr, 'dims', None)  # parallel.SharedArray in a parallel loop worker
+    if dims is not None:
+        n = 1
+        for d in dims:
+            n *= d
+        return n
+    n = 1
+    while isinstance(arr, list):
+        n *= len(arr)
+        if not arr:
+            break
+        arr = arr[0]
+    if isinstance(arr, (memoryview, array)):
+        n *= len(arr)
+    return n
@@ -0,0 +1,81 @@
+import asyncio
+import io
+from ast_cache import parse_source
+from interpreter import Interpreter
+
+DEFAULT_SLICE = 1000
+
+# ---------------- Resumable program run ----------------
+# A slice ends between statements, inside function bodies too. Calls nested
+# more than 100 deep (interpreter._RESUMABLE_DEPTH) run to completion within
+# the slice that made them, so deep recursion can still make one slice long.
+# Slices are measured in steps, the points where Interpreter.steps() pauses:
+# about one per statement, but a call run whole is a single step. For the
+# statement count, pass a limits.Budget and read budget.statements.
+class Execution:
+    def __init__(self, program, slice_size=DEFAULT_SLICE, out=None, modules=None, cache=None, budget=None):
+        # program is either source text or an already parsed Program
+        self.tree = parse_source(program, cache) if isinstance(program, str) else program
+        self.slice_size = slice_size
+        self.out = out if out is not None else io.StringIO()
+        self.interpreter = Interpreter(self.tree, modules, out=self.out, budget=budget)
+        self.steps = 0  # steps taken so far (not statements, see above)
+        self.slices = 0
+        self.done = False
+        self.error = None
+        self._runner = self.interpreter.steps()
+
+    def step(self, n=None):
+        # take up to n steps; returns True once the program has finished
+        if self.done:
+            return True
+        n = self.slice_size if n is None else n
+        runner = self._runner
+        count = 0
+        try:
+            while count < n:
+                next(runner)
+                count += 1
+        except StopIteration:
+            self.done = True
+        except Exception as e:
+            self.done = True
+            self.error = e
+        self.steps += count
+        self.slices += 1
+        if self.error is not None:
+            raise self.error
+        return self.done
+
+    def run_sync(self):
+        while not self.step():
+            pass
+        return self
+
+    async def run(self):
+        # yield to the event loop between slices so many programs share it fairly
+        while not self.step():
+            await asyncio.sleep(0)
+        return self
+
+    def cancel(self):
+        self._runner.close()
+        self.done = True
+
+    def output(self):
+        if isinstance(self.out, io.StringIO):
+            return self.out.getvalue()
+        return None
+
+# ---------------- Convenience helpers ----------------
+async def run_program(program, slice_size=DEFAULT_SLICE, out=None, modules=None, cache=None, budget=None):
+    return await Execution(program, slice_size, out, modules, cache, budget).run()
+
+async def run_many(programs, slice_size=DEFAULT_SLICE, cache=None, return_exceptions=True):
+    # run every program concurrently on the current event loop, each with its own output
+    executions = [Execution(p, slice_size, cache=cache) for p in programs]
+    results = await asyncio.gather(*(e.run() for e in executions), return_exceptions=return_exceptions)
+    for e, r in zip(executions, results):
+        if isinstance(r, BaseException):
+            e.error = r
+    return executions
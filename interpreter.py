@@ -1,62 +1,382 @@
+import sys
 from ast_nodes import *
+import dataio
+import parallel
+from limits import ProgramError
+import purity
+
+DEFAULT_MAX_DEPTH = 10000  # nested calls before a program is stopped, in every engine
+_PY_FRAMES_PER_CALL = 24  # Python recursion one call level may need, deep expressions included
+_RESUMABLE_DEPTH = 100  # steps() steps through calls nested this deep, and runs deeper ones whole
+
+# ---------------- Call frames ----------------
+class Frame:
+    # One activation of a function. Locals live in a list, at the slots
+    # resolve_slots gave their names; Var and assignment nodes carry their slot,
+    # so the hot paths never hash a name. Mapping access by name is for the
+    # code around the interpreter (parallel loops, tools).
+    __slots__ = ('layout', 'slots')
+
+    def __init__(self, layout):
+        self.layout = layout  # name -> slot
+        self.slots = [None] * len(layout)  # None: not assigned yet
+
+    def __getitem__(self, name):
+        value = self.slots[self.layout[name]]
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, value):
+        self.slots[self.layout[name]] = value
+
+    def __contains__(self, name):
+        return name in self.layout and self.slots[self.layout[name]] is not None
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def update(self, values):
+        for name, value in values.items():
+            self[name] = value
+
+def resolve_slots(func):
+    # parameters first, then every other name in order of appearance
+    layout = {name: k for k, name in enumerate(func.params)}
+    for node in walk(func.body):
+        name = None
+        if isinstance(node, (Var, ArrayAccess, VarDecl, AssignStmt)):
+            name = node.name
+        elif isinstance(node, Slice):
+            name = node.var
+        if name is not None:
+            node.slot = layout.setdefault(name, len(layout))
+    return layout
 
 class Interpreter:
-    def __init__(self, tree):
+    def __init__(self, tree, modules=None, out=None, budget=None, workers=None, memo=None, max_depth=None):
         self.tree = tree
-        self.env = {}  
+        self.env = Frame({})  # frame of the running function
+        self.out = out  # file-like sink for print(); None means sys.stdout
+        self.budget = budget  # limits.Budget, charged at loop back-edges, calls and array allocation
+        self.workers = workers or parallel.default_workers()  # processes for `parallel for`
+        self.plans = {}  # ParallelForStmt -> parallel.ParallelPlan
+        # function table: imported modules, then the program's own functions (the
+        # module build rejects a name defined twice, so the order never matters)
+        self.funcs = {}
+        for module in modules or []:
+            self.funcs.update(module.funcs)
+        for func in tree.funcs:
+            if isinstance(func, FuncDef):
+                self.funcs[func.name] = func
+        self.layouts = {}  # FuncDef -> {name: slot}
+        self.pure = purity.pure_functions(self.funcs)
+        # memo: results cached per pure function (oldest evicted first); None or 0 disables
+        self.memo = memo
+        self.caches = {name: {} for name in self.pure} if memo else {}
+        self.max_depth = max_depth or DEFAULT_MAX_DEPTH
+        self.depth = 0
+        self.returned = None  # value of the return statement being unwound
+        self.call_sites = {}  # node -> whether it calls a user function (see steps_into)
 
     def run(self):
+        self.reserve_stack()
         for func in self.tree.funcs:
-            if func.name == 'main':
+            if isinstance(func, FuncDef) and func.name == 'main':
+                self.env = Frame(self.layout(func))
                 self.exec_block(func.body)
 
+    # ---------------- Calls ----------------
+    def reserve_stack(self):
+        # calls recurse in Python: make room for max_depth of them
+        limit = self.max_depth * _PY_FRAMES_PER_CALL + 1000
+        if sys.getrecursionlimit() < limit:
+            sys.setrecursionlimit(limit)
+
+    def layout(self, func):
+        layout = self.layouts.get(func)
+        if layout is None:
+            layout = self.layouts[func] = resolve_slots(func)
+        return layout
+
+    def call(self, func, args):
+        cache, key, hit = self.enter_call(func, args)
+        if hit:
+            return cache[key]
+        frame = Frame(self.layout(func))
+        frame.slots[:len(args)] = args
+        caller, self.env = self.env, frame
+        self.depth += 1
+        try:
+            result = self.returned if self.exec_block(func.body) else 0
+        finally:
+            self.env = caller
+            self.depth -= 1
+        if cache is not None:
+            self.remember(cache, key, result)
+        return result
+
+    def enter_call(self, func, args):
+        # checks, memo lookup and budget charge of a call: (cache, key, hit)
+        if len(args) != len(func.params):
+            raise ProgramError(f'{func.name}() takes {len(func.params)} argument(s), got {len(args)}')
+        if self.depth >= self.max_depth:
+            raise ProgramError(f'maximum call depth {self.max_depth} exceeded in {func.name}()')
+        cache, key = self.caches.get(func.name), None
+        if cache is not None:
+            key = tuple(args)
+            try:
+                if key in cache:
+                    return cache, key, True
+            except TypeError:
+                cache = None  # an array argument: not memoizable
+        if self.budget is not None:
+            # a call is charged like a loop back-edge, so recursion can't run unmetered
+            self.budget.charge(len(func.body.statements) + 1)
+        return cache, key, False
+
+    def remember(self, cache, key, result):
+        if len(cache) >= self.memo:
+            del cache[next(iter(cache))]  # oldest first
+        cache[key] = result
+
+    # ---------------- Resumable execution ----------------
+    # Same semantics as run(), but yields after every statement (and loop
+    # back-edge) so a caller can pause and resume the program between steps.
+    # Function bodies are stepped through too, down to _RESUMABLE_DEPTH nested
+    # calls; resuming costs a generator frame per level, so calls nested deeper
+    # than that run to completion within one step.
+    def steps(self):
+        self.reserve_stack()
+        for func in self.tree.funcs:
+            if isinstance(func, FuncDef) and func.name == 'main':
+                self.env = Frame(self.layout(func))
+                yield from self.iter_block(func.body)
+
+    # these return True once a return statement has run, like exec_block
+    def iter_block(self, block):
+        for stmt in block.statements:
+            if (yield from self.iter_stmt(stmt)):
+                return True
+
+    def iter_stmt(self, stmt):
+        if isinstance(stmt, IfStmt):
+            if (yield from self.iter_expr(stmt.cond)):
+                return (yield from self.iter_block(stmt.then_block))
+            elif stmt.else_block:
+                return (yield from self.iter_block(stmt.else_block))
+            else:
+                yield
+
+        elif isinstance(stmt, WhileStmt):
+            budget, cost = self.budget, len(stmt.body.statements) + 1
+            while (yield from self.iter_expr(stmt.cond)):
+                if (yield from self.iter_block(stmt.body)):
+                    return True
+                if budget is not None:
+                    budget.charge(cost)
+                yield
+
+        elif isinstance(stmt, ForStmt):
+            budget, cost = self.budget, len(stmt.body.statements) + 1
+            yield from self.iter_simple(stmt.init)
+            while (yield from self.iter_expr(stmt.cond)):
+                if (yield from self.iter_block(stmt.body)):
+                    return True
+                yield from self.iter_simple(stmt.update)
+                if budget is not None:
+                    budget.charge(cost)
+                yield
+
+        elif isinstance(stmt, Block):
+            return (yield from self.iter_block(stmt))
+
+        else:
+            returned = yield from self.iter_simple(stmt)
+            yield
+            return returned
+
+    def iter_simple(self, stmt):
+        # exec_stmt for a statement without a body, stepping through the calls it makes
+        if not self.steps_into(stmt):
+            return self.exec_stmt(stmt)
+        if isinstance(stmt, VarDecl):
+            if stmt.dimensions:
+                dims = []
+                for d in stmt.dimensions:
+                    dims.append((yield from self.iter_expr(d)))
+                self.env.slots[stmt.slot] = self.new_array(dims)
+            else:
+                self.env.slots[stmt.slot] = yield from self.iter_expr(stmt.expr)
+        elif isinstance(stmt, AssignStmt):
+            if stmt.index_exprs:
+                arr = self.load(stmt)
+                idx = []
+                for e in stmt.index_exprs:
+                    idx.append((yield from self.iter_expr(e)))
+                self.assign_array(arr, idx, (yield from self.iter_expr(stmt.expr)))
+            else:
+                self.env.slots[stmt.slot] = yield from self.iter_expr(stmt.expr)
+        elif isinstance(stmt, PrintStmt):
+            print((yield from self.iter_expr(stmt.expr)), file=self.out)
+        elif isinstance(stmt, ReturnStmt):
+            self.returned = (yield from self.iter_expr(stmt.expr)) if stmt.expr is not None else 0
+            return True
+        elif isinstance(stmt, FuncCall):
+            yield from self.iter_expr(stmt)
+        else:
+            return self.exec_stmt(stmt)  # parallel loops: their bodies run in workers
+
+    def iter_expr(self, expr):
+        # eval_expr, stepping through the bodies of the functions it calls
+        if not self.steps_into(expr):
+            return self.eval_expr(expr)
+        if isinstance(expr, FuncCall):
+            args = []
+            for a in expr.args:
+                args.append((yield from self.iter_expr(a)))
+            if expr.name in dataio.BUILTINS:
+                return self.call_builtin(expr.name, args)
+            func = self.funcs.get(expr.name)
+            if func is None:
+                raise ProgramError(f'Unknown function: {expr.name}')
+            return (yield from self.iter_call(func, args))
+        elif isinstance(expr, BinOp):
+            l = yield from self.iter_expr(expr.left)
+            r = yield from self.iter_expr(expr.right)
+            return self.eval_binop(expr.op, l, r)
+        elif isinstance(expr, UnaryOp):
+            val = yield from self.iter_expr(expr.expr)
+            if expr.op == 'NEG': return -val
+            elif expr.op == 'NOT': return int(not val)
+        elif isinstance(expr, (Var, ArrayAccess)):
+            val = self.load(expr)
+            for i in expr.index_exprs:
+                val = val[(yield from self.iter_expr(i))]
+            return val
+        elif isinstance(expr, Slice):
+            arr = self.env.slots[expr.slot]
+            start = (yield from self.iter_expr(expr.start)) if expr.start else None
+            end = (yield from self.iter_expr(expr.end)) if expr.end else None
+            return arr[start:end]
+        raise RuntimeError(f'Unknown expression: {expr}')
+
+    def iter_call(self, func, args):
+        cache, key, hit = self.enter_call(func, args)
+        if hit:
+            return cache[key]
+        frame = Frame(self.layout(func))
+        frame.slots[:len(args)] = args
+        caller, self.env = self.env, frame
+        self.depth += 1
+        try:
+            result = self.returned if (yield from self.iter_block(func.body)) else 0
+        finally:
+            self.env = caller
+            self.depth -= 1
+        if cache is not None:
+            self.remember(cache, key, result)
+        return result
+
+    def steps_into(self, node):
+        # whether node calls a user function the resumable path should step through
+        if self.depth >= _RESUMABLE_DEPTH:
+            return False
+        calls = self.call_sites.get(node)
+        if calls is None:
+            calls = self.call_sites[node] = any(isinstance(n, FuncCall) and n.name not in dataio.BUILTINS
+                                                for n in walk(node))
+        return calls
+
     # ---------------- Block ----------------
+    # exec_block and exec_stmt return True when a return statement ran; its
+    # value is in self.returned
     def exec_block(self, block):
         for stmt in block.statements:
-            self.exec_stmt(stmt)
+            if self.exec_stmt(stmt):
+                return True
 
     # ---------------- Statements ----------------
     def exec_stmt(self, stmt):
         if isinstance(stmt, VarDecl):
             if stmt.dimensions:  # array
-                self.env[stmt.name] = self.create_array(stmt.dimensions)
+                self.env.slots[stmt.slot] = self.create_array(stmt.dimensions)
             else:
-                self.env[stmt.name] = self.eval_expr(stmt.expr)
+                self.env.slots[stmt.slot] = self.eval_expr(stmt.expr)
 
         elif isinstance(stmt, AssignStmt):
-            if hasattr(stmt, 'index_exprs') and stmt.index_exprs:
-                arr = self.env[stmt.name]
+            if stmt.index_exprs:
+                arr = self.load(stmt)
                 idx = [self.eval_expr(e) for e in stmt.index_exprs]
                 self.assign_array(arr, idx, self.eval_expr(stmt.expr))
             else:
-                self.env[stmt.name] = self.eval_expr(stmt.expr)
+                self.env.slots[stmt.slot] = self.eval_expr(stmt.expr)
 
         elif isinstance(stmt, PrintStmt):
-            print(self.eval_expr(stmt.expr))
+            print(self.eval_expr(stmt.expr), file=self.out)
 
         elif isinstance(stmt, IfStmt):
             if self.eval_expr(stmt.cond):
-                self.exec_block(stmt.then_block)
+                return self.exec_block(stmt.then_block)
             elif stmt.else_block:
-                self.exec_block(stmt.else_block)
+                return self.exec_block(stmt.else_block)
 
         elif isinstance(stmt, WhileStmt):
+            # back-edges charge the budget for a whole iteration at once
+            budget, cost = self.budget, len(stmt.body.statements) + 1
             while self.eval_expr(stmt.cond):
-                self.exec_block(stmt.body)
+                if self.exec_block(stmt.body):
+                    return True
+                if budget is not None:
+                    budget.charge(cost)
+
+        elif isinstance(stmt, ParallelForStmt):
+            self.exec_parallel_for(stmt)
 
         elif isinstance(stmt, ForStmt):
+            budget, cost = self.budget, len(stmt.body.statements) + 1
             self.exec_stmt(stmt.init)
             while self.eval_expr(stmt.cond):
-                self.exec_block(stmt.body)
+                if self.exec_block(stmt.body):
+                    return True
                 self.exec_stmt(stmt.update)
+                if budget is not None:
+                    budget.charge(cost)
+
+        elif isinstance(stmt, Block):
+            return self.exec_block(stmt)
 
         elif isinstance(stmt, ReturnStmt):
-            # ignoring return values for now
-            pass
+            self.returned = self.eval_expr(stmt.expr) if stmt.expr is not None else 0
+            return True
+
+        elif isinstance(stmt, FuncCall):
+            self.eval_expr(stmt)
 
         else:
             raise RuntimeError(f'Unknown statement: {stmt}')
 
+    # ---------------- Parallel loops ----------------
+    def exec_parallel_for(self, stmt):
+        plan = self.plans.get(stmt)
+        if plan is None:
+            plan = self.plans[stmt] = parallel.analyze(stmt, self.pure)
+        self.exec_stmt(stmt.init)
+        slots, var, step = self.env.slots, self.env.layout[plan.var], plan.step
+        start = slots[var]
+        n = plan.trip_count(start, self.eval_expr(plan.bound))
+        if self.workers == 1 or n < 2:
+            budget = self.budget
+            for k in range(n):
+                slots[var] = start + k * step
+                self.exec_block(stmt.body)
+                if budget is not None:
+                    budget.charge(plan.cost)
+        else:
+            # workers meter their chunks with a share of the budget (see limits.Budget.share)
+            parallel.run_interpreted(self, plan, start, n, self.workers)
+        slots[var] = start + n * step
+
     # ---------------- Expressions ----------------
     def eval_expr(self, expr):
         if isinstance(expr, Number):
@@ -66,20 +386,22 @@ class Interpreter:
             return expr.value
 
         elif isinstance(expr, Var):
-            val = self.env[expr.name]
-            if getattr(expr, 'index_exprs', None):
+            val = self.env.slots[expr.slot]
+            if val is None:
+                raise RuntimeError(f'Undefined variable {expr.name}')
+            if expr.index_exprs:
                 for i in expr.index_exprs:
                     val = val[self.eval_expr(i)]
             return val
 
         elif isinstance(expr, ArrayAccess):
-            val = self.env[expr.name]
+            val = self.load(expr)
             for i in expr.index_exprs:
                 val = val[self.eval_expr(i)]
             return val
 
         elif isinstance(expr, Slice):
-            arr = self.env[expr.var]
+            arr = self.env.slots[expr.slot]
             start = self.eval_expr(expr.start) if expr.start else None
             end = self.eval_expr(expr.end) if expr.end else None
             return arr[start:end]
@@ -94,9 +416,24 @@ class Interpreter:
             if expr.op == 'NEG': return -val
             elif expr.op == 'NOT': return int(not val)
 
+        elif isinstance(expr, FuncCall):
+            args = [self.eval_expr(a) for a in expr.args]
+            if expr.name in dataio.BUILTINS:
+                return self.call_builtin(expr.name, args)
+            func = self.funcs.get(expr.name)
+            if func is None:
+                raise ProgramError(f'Unknown function: {expr.name}')
+            return self.call(func, args)
+
         else:
             raise RuntimeError(f'Unknown expression: {expr}')
 
+    def load(self, node):
+        val = self.env.slots[node.slot]
+        if val is None:
+            raise RuntimeError(f'Undefined variable {node.name}')
+        return val
+
     # ---------------- Operators ----------------
     def eval_binop(self, op, l, r):
         if op == 'PLUS': return l + r
@@ -115,11 +452,38 @@ class Interpreter:
         else:
             raise RuntimeError(f'Unknown operator: {op}')
 
+    # ---------------- Builtins ----------------
+    def call_builtin(self, name, args):
+        expected = 1 if name in ('load_bin', 'load_txt', 'len') else 2
+        if len(args) != expected:
+            raise RuntimeError(f'{name}() takes {expected} argument(s), got {len(args)}')
+        if name == 'len':
+            return dataio.length(args[0])
+        if name in dataio.ARRAY_BUILTINS:
+            arr = dataio.load_bin(args[0]) if name == 'load_bin' else dataio.load_txt(args[0])
+            if self.budget is not None:
+                self.budget.allocate(len(arr))
+            return arr
+        if name == 'save_bin':
+            return dataio.save_bin(args[0], args[1])
+        return dataio.save_txt(args[0], args[1])
+
     # ---------------- Arrays ----------------
     def create_array(self, dimensions):
-        if len(dimensions) == 0: return 0
-        dim = self.eval_expr(dimensions[0])
-        return [self.create_array(dimensions[1:]) for _ in range(dim)]
+        return self.new_array([self.eval_expr(d) for d in dimensions])
+
+    def new_array(self, dims):
+        if self.budget is not None:
+            # checked before allocating, so oversized arrays never hit memory
+            total = 1
+            for dim in dims:
+                total *= max(dim, 0)
+            self.budget.allocate(total)
+        return self.build_array(dims)
+
+    def build_array(self, dims):
+        if len(dims) == 0: return 0
+        return [self.build_array(dims[1:]) for _ in range(dims[0])]
 
     def assign_array(self, arr, indices, value):
         for idx in indices[:-1]:
@@ -14,6 +14,8 @@ TOKEN_SPEC = [
     ('ELSE', r'else'),
     ('WHILE', r'while'),
     ('FOR', r'for'),
+    ('PARALLEL', r'parallel\b'),
+    ('IMPORT', r'import\b'),
     ('ID', r'[A-Za-z_][A-Za-z0-9_]*'),
 
     # Numbers
@@ -62,24 +64,26 @@ TOKEN_SPEC = [
 TOK_REGEX = '|'.join(f'(?P<{name}>{pattern})' for name, pattern in TOKEN_SPEC)
 
 class Token:
-    def __init__(self, type_, value):
+    def __init__(self, type_, value, line=None):
         self.type = type_
         self.value = value
+        self.line = line  # 1-based source line, for diagnostics and debug info
     def __repr__(self):
         return f'Token({self.type},{self.value})'
 
 def lex(code):
+    line = 1
     for mo in re.finditer(TOK_REGEX, code, re.DOTALL):
         kind, value = mo.lastgroup, mo.group()
         if kind == 'NUMBER':
-            yield Token('NUMBER', int(value))
+            yield Token('NUMBER', int(value), line)
         elif kind == 'STRING':
-            value = value[1:-1]  # remove quotes
-            yield Token('STRING', value)
+            yield Token('STRING', value[1:-1], line)  # remove quotes
+            line += value.count('\n')
         elif kind in ('SKIP', 'COMMENT', 'MCOMMENT'):
+            line += value.count('\n')
             continue
         elif kind == 'MISMATCH':
-            raise RuntimeError(f'Unexpected character: {value}')
+            raise RuntimeError(f'Unexpected character: {value} on line {line}')
         else:
-            yield Token(kind, value)
-
+            yield Token(kind, value, line)
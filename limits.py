@@ -0,0 +1,93 @@
+import time
+
+class ResourceLimitExceeded(RuntimeError):
+    def __init__(self, kind, limit, used):
+        self.kind = kind  # 'statements', 'time' or 'array_elements'
+        self.limit = limit
+        self.used = used
+        super().__init__(f'{kind} limit exceeded: used {used}, limit {limit}')
+
+    def to_dict(self):
+        return {"error": "resource_limit", "kind": self.kind, "limit": self.limit, "used": self.used}
+
+class ProgramError(RuntimeError):
+    # the program failed at run time (file I/O, call depth, unknown function, ...),
+    # in any engine; its output so far stands, so the driver reports it instead
+    # of re-running the program
+    pass
+
+_CLOCK_EVERY = 1024  # statements charged between wall-clock checks
+
+# ---------------- Per-run resource budget ----------------
+class Budget:
+    # statements are charged in bulk at loop back-edges and calls: the body's
+    # top-level statements plus one, with a nested block counting as a single
+    # statement. The counter approximates work done; it is not an exact count.
+    def __init__(self, max_statements=None, max_seconds=None, max_array_elements=None):
+        self.max_statements = max_statements
+        self.max_seconds = max_seconds
+        self.max_array_elements = max_array_elements
+        self.start()
+
+    def start(self):
+        self.statements = 0
+        self.array_elements = 0
+        self.started = time.monotonic()
+        self.deadline = self.started + self.max_seconds if self.max_seconds is not None else None
+        self.exceeded = None
+        self.check_at = self.next_check()
+
+    def next_check(self):
+        # statement count at which charge() next looks at the limits and the clock
+        at = self.statements + _CLOCK_EVERY if self.deadline is not None else float('inf')
+        if self.max_statements is not None:
+            at = min(at, self.max_statements + 1)
+        return at
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def charge(self, n):
+        # called at every back-edge: one add and one compare until a check is due
+        self.statements += n
+        if self.statements >= self.check_at:
+            self.check()
+
+    def check(self):
+        if self.max_statements is not None and self.statements > self.max_statements:
+            self.fail('statements', self.max_statements, self.statements)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.fail('time', self.max_seconds, round(self.elapsed(), 6))
+        self.check_at = self.next_check()
+
+    def allocate(self, n):
+        self.array_elements += n
+        if self.max_array_elements is not None and self.array_elements > self.max_array_elements:
+            self.fail('array_elements', self.max_array_elements, self.array_elements)
+
+    def fail(self, kind, limit, used):
+        self.exceeded = ResourceLimitExceeded(kind, limit, used)
+        raise self.exceeded
+
+    # ---------------- Parallel loop workers ----------------
+    # Each worker process meters its chunk with a share of the budget: the
+    # statements still left and the same deadline. Its count is absorbed back
+    # once the chunk is done, and the parent then reports any limit it broke.
+    def share(self):
+        left = None if self.max_statements is None else self.max_statements - self.statements
+        part = Budget(left, self.max_seconds)
+        part.started, part.deadline = self.started, self.deadline
+        part.check_at = part.next_check()
+        return part
+
+    def absorb(self, statements):
+        self.statements += statements
+        self.check()
+
+    # ---------------- JIT fuel ----------------
+    # Native code decrements a fuel counter at back-edges and only calls back
+    # into Python when it runs dry, so refills are kept reasonably large.
+    def refill(self, chunk=1 << 16):
+        if self.max_statements is None:
+            return chunk
+        return max(0, min(chunk, self.max_statements - self.statements))
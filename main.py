@@ -1,47 +1,235 @@
 import sys
+import json
+import argparse
 from lexer import lex
 from parser import Parser
-from interpreter import Interpreter
-from codegen import CodeGen
-from ast_nodes import VarDecl, Number, PrintStmt, BinOp, Var  # import all necessary AST nodes
+from interpreter import Interpreter, DEFAULT_MAX_DEPTH
+from ast_cache import ASTCache, DEFAULT_MAX_BYTES, parse_source
+from modules import ModuleBuilder, imports_of, run_modules
+from limits import Budget, ResourceLimitExceeded, ProgramError
+from metrics import Metrics, count_nodes, count_ir_instructions
+from mir_opt import DEFAULT_PASSES, parse_passes
+
+def build_mir(tree, passes, dump=False, metrics=None):
+    # lower to the SSA mid-level IR and optimize it; None when the program uses
+    # something the IR can't express yet (the AST engines then run it instead)
+    from mir import build_program, dump_module
+    from mir_opt import optimize
+    metrics = metrics if metrics is not None else Metrics()
+    try:
+        with metrics.phase("mir_build"):
+            module = build_program(tree)
+    except RuntimeError as e:
+        metrics.record_fallback("mir_build", e, "mir", "ast")
+        print("[Warning] MIR build failed:", e, file=sys.stderr)
+        return None
+    metrics.count("mir_instructions", module.instruction_count())
+    with metrics.phase("mir_optimize"):
+        stats = optimize(module, passes)
+    for name, changes in stats.items():
+        metrics.count(f"mir_{name}", changes)
+    metrics.count("mir_instructions_optimized", module.instruction_count())
+    if dump:
+        print(dump_module(module), file=sys.stderr)
+    return module
+
+def run_file(path, mode, cache=None, build_dir=None, budget=None, metrics=None, perf=None,
+             mir_passes=None, dump_mir=False, workers=None, memo=None, max_depth=None):
+    # metrics (a metrics.Metrics) collects per-phase timings and sizes when given;
+    # perf (a perfmap.PerfRecorder) is told about JIT-emitted code in compile mode;
+    # mir_passes (a tuple of mir_opt pass names) runs the program through the mid-level IR;
+    # workers caps the threads/processes `parallel for` loops use;
+    # memo sizes the result caches of pure functions (None: off), max_depth limits call nesting
+    metrics = metrics if metrics is not None else Metrics()
+    if mode == "build":
+        # Incrementally (re)compile every module reachable from path
+        with metrics.phase("build"):
+            report = ModuleBuilder(build_dir, "compile", cache).build(path)
+        metrics.count("modules", len(report.timings))
+        metrics.count("modules_rebuilt", len(report.rebuilt))
+        report.print(sys.stdout)
+        return
 
-def run_file(path, mode):
     with open(path) as f:
         code = f.read()
+    metrics.count("source_bytes", len(code))
+
+    # Lexical analysis + parse tokens into AST (or load a cached tree)
+    if cache is not None:
+        hits = cache.hits
+        with metrics.phase("frontend"):
+            tree = parse_source(code, cache)
+        metrics.count("cache_hit", cache.hits > hits)
+    else:
+        with metrics.phase("lex"):
+            tokens = list(lex(code))
+        metrics.count("tokens", len(tokens))
+        with metrics.phase("parse"):
+            parser = Parser(tokens)
+            tree = parser.parse()
+    metrics.count("ast_nodes", count_nodes(tree))
+
+    if imports_of(tree) and mode in ("interpret", "compile"):
+        if mir_passes is not None:
+            # the IR has no calls, so it can't use anything imported
+            error = RuntimeError("imports are not supported in MIR")
+            metrics.record_fallback("mir_build", error, "mir", "ast")
+            print("[Warning] MIR build failed:", error, file=sys.stderr)
+        # Separate compilation: only modules whose source or dependencies changed are rebuilt
+        metrics.engine = "jit" if mode == "compile" else "interpreter"
+        with metrics.phase("build_and_execute"):
+            run_modules(path, mode, build_dir, cache, perf=perf, workers=workers, max_depth=max_depth,
+                        budget=budget, memo=memo, parsed=(code, tree))
+        return
 
-    # Lexical analysis
-    tokens = lex(code)
-    
-    # Parse tokens into AST
-    parser = Parser(tokens)
-    tree = parser.parse()
+    module = None
+    if mir_passes is not None and mode in ("interpret", "compile"):
+        module = build_mir(tree, mir_passes, dump_mir, metrics)
 
-    if mode == "interpret":
+    if mode == "interpret" and module is not None:
+        from mir_interp import MirInterpreter
+        metrics.engine = "mir_interpreter"
+        with metrics.phase("execute"):
+            MirInterpreter(module, budget=budget).run()
+    elif mode == "interpret":
         # Directly run interpreter
-        Interpreter(tree).run()
+        metrics.engine = "interpreter"
+        with metrics.phase("execute"):
+            Interpreter(tree, budget=budget, workers=workers, memo=memo, max_depth=max_depth).run()
     elif mode == "compile":
+        from codegen import CodeGen
         # Generate LLVM IR
-        cg = CodeGen()
-        cg.generate(tree)
+        cg = CodeGen(budget, perf=perf is not None, source_name=path, workers=workers, memo=memo,
+                     max_depth=max_depth)
+        try:
+            with metrics.phase("ir_build"):
+                if module is not None:
+                    cg.generate_mir(module, tree)
+                else:
+                    cg.generate(tree)
+        except RuntimeError as e:
+            # construct the JIT can't lower yet
+            metrics.record_fallback("ir_build", e)
+            print("[Warning] LLVM codegen failed:", e)
+            print("[Info] Falling back to interpreter mode...")
+            with metrics.phase("execute"):
+                Interpreter(tree, budget=budget, workers=workers, memo=memo, max_depth=max_depth).run()
+            return
+        metrics.count("ir_instructions", count_ir_instructions(cg.module))
         print("=== LLVM IR ===")
         print(cg.module)
         print("=== Program Output ===")
         try:
             # Try JIT
-            cg.run_jit()
+            cg.run_jit(metrics, perf)
+        except (ResourceLimitExceeded, ProgramError):
+            raise  # the program ran and failed: re-running it would repeat its output
         except Exception as e:
-            # Fallback to interpreter if JIT fails
+            # Fallback to interpreter if the JIT couldn't run the program
+            metrics.record_fallback("jit_execute", e)
             print("[Warning] LLVM JIT failed:", e)
             print("[Info] Falling back to interpreter mode...")
-            Interpreter(tree).run()
+            if budget is not None:
+                budget.start()
+            with metrics.phase("execute_fallback"):
+                Interpreter(tree, budget=budget, workers=workers, memo=memo, max_depth=max_depth).run()
     else:
-        print("Unknown mode. Use 'interpret' or 'compile'.")
+        print("Unknown mode. Use 'interpret', 'compile' or 'build'.")
+
+def parse_args(argv):
+    ap = argparse.ArgumentParser(usage="python main.py <interpret|compile|build> <file> [options]")
+    ap.add_argument("mode")
+    ap.add_argument("file")
+    ap.add_argument("--cache", action="store_true",
+                    help="reuse parsed ASTs for unchanged sources")
+    ap.add_argument("--cache-dir", default=None,
+                    help="AST cache directory (default: $MYCC_CACHE_DIR or ~/.cache/mycc)")
+    ap.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                    help="evict least recently used cache entries above this size")
+    ap.add_argument("--build-dir", default=None,
+                    help="where per-module build outputs live (default: .mycc_build)")
+    ap.add_argument("--max-statements", type=int, default=None,
+                    help="abort after roughly this many executed statements")
+    ap.add_argument("--timeout", type=float, default=None,
+                    help="abort after this many seconds of wall time")
+    ap.add_argument("--max-array-elements", type=int, default=None,
+                    help="abort when arrays allocated in total exceed this many elements")
+    ap.add_argument("--timings", action="store_true",
+                    help="print per-phase wall/CPU times and sizes to stderr")
+    ap.add_argument("--metrics-json", default=None, metavar="PATH",
+                    help="write phase metrics as JSON to PATH ('-' for stderr)")
+    ap.add_argument("--perf-map", action="store_true",
+                    help="compile mode: list JIT-emitted functions in /tmp/perf-<pid>.map")
+    ap.add_argument("--jitdump", action="store_true",
+                    help="compile mode: write /tmp/jit-<pid>.dump with code and .my line info for perf inject")
+    ap.add_argument("--mir", action="store_true",
+                    help="run through the SSA mid-level IR (IR interpreter, or LLVM lowered from the IR)")
+    ap.add_argument("--mir-passes", default=None, metavar="LIST",
+                    help=f"comma separated MIR passes, implies --mir (default: {','.join(DEFAULT_PASSES)}; '' for none)")
+    ap.add_argument("--dump-mir", action="store_true",
+                    help="print the optimized mid-level IR to stderr, implies --mir")
+    ap.add_argument("--workers", type=int, default=None, metavar="N",
+                    help="workers for `parallel for` loops (default: $MYCC_WORKERS or the CPU count)")
+    ap.add_argument("--memo", type=int, default=None, metavar="N",
+                    help="cache up to N results per pure function (integer arguments, no I/O or arrays)")
+    ap.add_argument("--max-depth", type=int, default=None, metavar="N",
+                    help="maximum call depth (default: %d)" % DEFAULT_MAX_DEPTH)
+    return ap.parse_args(argv)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python main.py <interpret|compile> <file>")
+    if len(sys.argv) < 3:
+        print("Usage: python main.py <interpret|compile|build> <file> [options]")
         sys.exit(1)
-    
-    mode = sys.argv[1]
-    filepath = sys.argv[2]
-    run_file(filepath, mode)
+
+    args = parse_args(sys.argv[1:])
+    cache = None
+    if args.cache or args.cache_dir:
+        cache = ASTCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    budget = None
+    if args.max_statements is not None or args.timeout is not None or args.max_array_elements is not None:
+        budget = Budget(args.max_statements, args.timeout, args.max_array_elements)
+    metrics = Metrics()
+    perf = None
+    if args.perf_map or args.jitdump:
+        from perfmap import PerfRecorder
+        perf = PerfRecorder(args.perf_map, args.jitdump)
+    mir_passes = None
+    if args.mir or args.mir_passes is not None or args.dump_mir:
+        try:
+            mir_passes = DEFAULT_PASSES if args.mir_passes is None else parse_passes(args.mir_passes)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(2)
+    if args.mode == "compile" and args.max_depth is not None:
+        from codegen import MAX_JIT_DEPTH
+        if args.max_depth > MAX_JIT_DEPTH:
+            # JIT calls recurse on a native stack of bounded size
+            print(f"--max-depth {args.max_depth} is more than JIT code can reach on its stack "
+                  f"(at most {MAX_JIT_DEPTH})", file=sys.stderr)
+            sys.exit(2)
+    status = 0
+    try:
+        run_file(args.file, args.mode, cache, args.build_dir, budget, metrics, perf, mir_passes, args.dump_mir,
+                 args.workers, args.memo, args.max_depth)
+    except ResourceLimitExceeded as e:
+        sys.stdout.flush()
+        print(json.dumps(e.to_dict()), file=sys.stderr)
+        metrics.count("resource_limit", e.kind)
+        status = 3
+    except ProgramError as e:
+        sys.stdout.flush()
+        print("[Error]", e, file=sys.stderr)
+        status = 1
+    finally:
+        if perf is not None:
+            perf.close()
+        # flush program output (including the JIT's libc buffer) before the report
+        sys.stdout.flush()
+        if args.timings:
+            metrics.print_table()
+        if args.metrics_json == "-":
+            print(metrics.to_json(indent=1), file=sys.stderr)
+        elif args.metrics_json:
+            with open(args.metrics_json, "w") as f:
+                f.write(metrics.to_json(indent=1))
+    sys.exit(status)
@@ -0,0 +1,78 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+from ast_nodes import Node
+
+class Metrics:
+    def __init__(self):
+        self.phases = {}  # name -> {"wall": seconds, "cpu": seconds, "calls": n}, in first-seen order
+        self.counters = {}
+        self.engine = None  # 'interpreter', 'mir_interpreter' or 'jit'
+        self.fallback = None  # {"from": ..., "to": ..., "reason": ...} when the JIT gave up
+
+    # ---------------- Recording ----------------
+    @contextmanager
+    def phase(self, name):
+        c0, t0 = time.process_time(), time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+            entry["wall"] += time.perf_counter() - t0
+            entry["cpu"] += time.process_time() - c0
+            entry["calls"] += 1
+
+    def count(self, name, value):
+        self.counters[name] = value
+
+    def record_fallback(self, stage, error, source="jit", target="interpreter"):
+        self.fallback = {"from": source, "to": target, "stage": stage,
+                         "reason": f"{type(error).__name__}: {error}"}
+        self.engine = target
+
+    # ---------------- Reporting ----------------
+    def total(self):
+        return sum(p["wall"] for p in self.phases.values())
+
+    def to_dict(self):
+        return {
+            "phases": {name: dict(p) for name, p in self.phases.items()},
+            "total_wall": self.total(),
+            "counters": dict(self.counters),
+            "engine": self.engine,
+            "fell_back": self.fallback is not None,
+            "fallback": self.fallback,
+        }
+
+    def to_json(self, **kw):
+        return json.dumps(self.to_dict(), **kw)
+
+    def print_table(self, out=None):
+        out = out or sys.stderr
+        total = self.total() or 1.0
+        print(f"{'phase':<16} {'wall':>10} {'cpu':>10} {'share':>7}", file=out)
+        for name, p in self.phases.items():
+            print(f"{name:<16} {p['wall'] * 1000:>8.2f}ms {p['cpu'] * 1000:>8.2f}ms {p['wall'] / total:>6.1%}", file=out)
+        print(f"{'total':<16} {self.total() * 1000:>8.2f}ms", file=out)
+        for name, value in self.counters.items():
+            print(f"{name:<16} {value:>10}", file=out)
+        print(f"{'engine':<16} {self.engine or '-':>10}", file=out)
+        if self.fallback:
+            print(f"fallback: {self.fallback['stage']} failed ({self.fallback['reason']})", file=out)
+
+# ---------------- Size counters ----------------
+def count_nodes(tree):
+    n = 0
+    stack = [tree]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Node):
+            n += 1
+            stack.extend(vars(item).values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return n
+
+def count_ir_instructions(module):
+    return sum(len(block.instructions) for func in module.functions for block in func.blocks)
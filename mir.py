@@ -0,0 +1,585 @@
+import json
+from ast_nodes import *
+import dataio
+
+# Mid-level IR: a CFG of basic blocks in SSA form, built from the AST and shared
+# by the IR interpreter (mir_interp) and the LLVM backend (CodeGen.generate_mir).
+# Optimization passes live in mir_opt.
+
+# ---------------- Opcodes ----------------
+BINOPS = {'PLUS': 'add', 'MINUS': 'sub', 'MUL': 'mul', 'DIV': 'div', 'MOD': 'mod',
+          'LT': 'lt', 'GT': 'gt', 'LE': 'le', 'GE': 'ge', 'EQ': 'eq', 'NE': 'ne',
+          'AND': 'and', 'OR': 'or'}
+UNOPS = {'NEG': 'neg', 'NOT': 'not'}
+
+# Same semantics as Interpreter.eval_binop, so folding matches the reference engine
+BINARY_EVAL = {
+    'add': lambda a, b: a + b,
+    'sub': lambda a, b: a - b,
+    'mul': lambda a, b: a * b,
+    'div': lambda a, b: a // b,
+    'mod': lambda a, b: a % b,
+    'lt': lambda a, b: int(a < b),
+    'gt': lambda a, b: int(a > b),
+    'le': lambda a, b: int(a <= b),
+    'ge': lambda a, b: int(a >= b),
+    'eq': lambda a, b: int(a == b),
+    'ne': lambda a, b: int(a != b),
+    'and': lambda a, b: int(a and b),
+    'or': lambda a, b: int(a or b),
+}
+UNARY_EVAL = {'neg': lambda a: -a, 'not': lambda a: int(not a)}
+
+COMMUTATIVE = {'add', 'mul', 'eq', 'ne'}
+# result depends only on the operands: may be shared, hoisted or dropped
+PURE = set(BINARY_EVAL) | set(UNARY_EVAL) | {'copy', 'dim', 'len'}
+# pure, but raise on a zero divisor, so only moved when the divisor is a known non-zero
+TRAPPING = {'div', 'mod'}
+TERMINATORS = {'br', 'cbr', 'ret'}
+
+I32_MIN, I32_MAX = -2 ** 31, 2 ** 31 - 1
+
+# ---------------- Values ----------------
+class Value:
+    type = 'int'  # 'int', 'str' or 'array'
+    rank = 0      # dimensions of an array value
+
+class Const(Value):
+    def __init__(self, value):
+        self.value = value
+        self.type = 'str' if isinstance(value, str) else 'int'
+
+class Undef(Value):
+    # a variable read on a path where it was never assigned
+    pass
+
+class Instr(Value):
+    def __init__(self, op, args=(), type='int', rank=0, name=None):
+        self.op = op
+        self.args = list(args)
+        self.type = type    # None for instructions without a result
+        self.rank = rank
+        self.name = name    # source variable the result was assigned to, for dumps
+        self.block = None
+        self.targets = []   # successors of br/cbr
+        self.incoming = []  # phi: predecessor block of each argument
+        self.callee = None  # call: builtin name
+
+    @property
+    def is_safe(self):
+        # pure and cannot raise: fine to execute speculatively or not at all
+        if self.op not in PURE:
+            return False
+        if self.op in TRAPPING:
+            d = self.args[1]
+            return isinstance(d, Const) and d.value != 0
+        return True
+
+def value_key(v):
+    # identity for instructions, contents for constants
+    if isinstance(v, Const):
+        return ('c', repr(v.value))
+    if isinstance(v, Undef):
+        return ('u', 0)
+    return ('i', id(v))
+
+# ---------------- Blocks and functions ----------------
+class BasicBlock:
+    def __init__(self, name):
+        self.name = name
+        self.phis = []
+        self.instrs = []  # ends with exactly one terminator
+        self.preds = []
+
+    @property
+    def terminator(self):
+        if self.instrs and self.instrs[-1].op in TERMINATORS:
+            return self.instrs[-1]
+        return None
+
+    @property
+    def succs(self):
+        term = self.terminator
+        return term.targets if term is not None else []
+
+    def append(self, instr):
+        instr.block = self
+        self.instrs.append(instr)
+        return instr
+
+    def insert_before_terminator(self, instr):
+        instr.block = self
+        self.instrs.insert(len(self.instrs) - 1 if self.terminator else len(self.instrs), instr)
+        return instr
+
+    def retarget(self, old, new):
+        # point this block's terminator at new instead of old
+        term = self.terminator
+        term.targets = [new if t is old else t for t in term.targets]
+        old.preds = [p for p in old.preds if p is not self]
+        new.preds.append(self)
+
+class Function:
+    def __init__(self, name):
+        self.name = name
+        self.blocks = []
+        self._labels = {}
+
+    @property
+    def entry(self):
+        return self.blocks[0]
+
+    def new_block(self, hint, after=None):
+        n = self._labels.get(hint, 0)
+        self._labels[hint] = n + 1
+        block = BasicBlock(hint if n == 0 else f"{hint}{n}")
+        if after is None:
+            self.blocks.append(block)
+        else:
+            self.blocks.insert(self.blocks.index(after) + 1, block)
+        return block
+
+    def instructions(self):
+        for block in self.blocks:
+            yield from block.phis
+            yield from block.instrs
+
+    def instruction_count(self):
+        return sum(len(b.phis) + len(b.instrs) for b in self.blocks)
+
+class MirModule:
+    def __init__(self):
+        self.functions = {}  # name -> Function
+
+    def instruction_count(self):
+        return sum(f.instruction_count() for f in self.functions.values())
+
+# ---------------- Building from the AST ----------------
+# SSA construction follows Braun et al., "Simple and Efficient Construction of
+# Static Single Assignment Form": variables are looked up through the CFG on
+# demand, and loop headers stay unsealed until their back-edge exists.
+class MirBuilder:
+    def build(self, tree, entry='main'):
+        module = MirModule()
+        funcdef = next((f for f in tree.funcs if isinstance(f, FuncDef) and f.name == entry), None)
+        if funcdef is None:
+            raise RuntimeError(f"No {entry} function")
+        module.functions[entry] = self.build_function(funcdef)
+        return module
+
+    def build_function(self, funcdef):
+        self.func = Function(funcdef.name)
+        self.defs = {}        # variable -> {block: value}
+        self.incomplete = {}  # unsealed block -> {variable: phi}
+        self.sealed = set()
+        self.var_types = {}   # variable -> (type, rank)
+        self.written = set()
+        self.block = self.func.new_block("entry")
+        self.seal(self.block)
+        self.build_block(funcdef.body)
+        if self.block is not None:
+            self.terminate(Instr('ret', type=None))
+        for name in self.var_types:
+            if name not in self.written:
+                raise RuntimeError(f"Undefined variable {name}")
+        return self.func
+
+    # ---------------- Emitting ----------------
+    def emit(self, op, args=(), type='int', rank=0, name=None):
+        return self.block.append(Instr(op, args, type, rank, name))
+
+    def terminate(self, instr, targets=()):
+        instr.targets = list(targets)
+        self.block.append(instr)
+        for t in targets:
+            t.preds.append(self.block)
+        self.block = None
+
+    def jump(self, target):
+        if self.block is not None:
+            self.terminate(Instr('br', type=None), [target])
+
+    # ---------------- Variables ----------------
+    def assign(self, name, value):
+        expected = self.var_types.setdefault(name, (value.type, value.rank))
+        if expected != (value.type, value.rank):
+            raise RuntimeError(f"Variable {name} changes type in MIR")
+        if not isinstance(value, Instr) or value.name is not None or value.op == 'phi':
+            # keep one SSA name per assignment; copy propagation folds these away
+            value = self.emit('copy', [value], value.type, value.rank)
+        value.name = name
+        self.written.add(name)
+        self.write(name, self.block, value)
+
+    def write(self, name, block, value):
+        self.defs.setdefault(name, {})[block] = value
+
+    def read(self, name, block=None):
+        block = block or self.block
+        defs = self.defs.get(name)
+        if defs is not None and block in defs:
+            return defs[block]
+        # a read before any assignment in program order (loop-carried) is taken to be an int
+        self.var_types.setdefault(name, ('int', 0))
+        return self.read_recursive(name, block)
+
+    def read_recursive(self, name, block):
+        if block not in self.sealed:
+            value = self.new_phi(name, block)
+            self.incomplete.setdefault(block, {})[name] = value
+        elif len(block.preds) == 1:
+            value = self.read(name, block.preds[0])
+        elif not block.preds:
+            value = Undef()
+        else:
+            value = self.new_phi(name, block)
+            self.write(name, block, value)
+            self.add_phi_operands(name, value)
+        self.write(name, block, value)
+        return value
+
+    def new_phi(self, name, block):
+        type, rank = self.var_types[name]
+        phi = Instr('phi', type=type, rank=rank, name=name)
+        phi.block = block
+        block.phis.append(phi)
+        return phi
+
+    def add_phi_operands(self, name, phi):
+        for pred in phi.block.preds:
+            phi.args.append(self.read(name, pred))
+            phi.incoming.append(pred)
+
+    def seal(self, block):
+        for name, phi in self.incomplete.pop(block, {}).items():
+            self.add_phi_operands(name, phi)
+        self.sealed.add(block)
+
+    # ---------------- Statements ----------------
+    def build_block(self, block):
+        for stmt in block.statements:
+            if self.block is None:
+                # code after a return: keep building into a block nothing reaches
+                self.block = self.func.new_block("dead")
+                self.seal(self.block)
+            self.build_stmt(stmt)
+
+    def build_stmt(self, stmt):
+        if isinstance(stmt, VarDecl):
+            if stmt.dimensions:
+                dims = [self.int_expr(d) for d in stmt.dimensions]
+                self.assign(stmt.name, self.emit('alloc', dims, 'array', len(dims)))
+            elif stmt.expr is not None:
+                self.assign(stmt.name, self.expr(stmt.expr))
+            else:
+                self.assign(stmt.name, Const(0))
+
+        elif isinstance(stmt, AssignStmt):
+            if stmt.index_exprs:
+                arr = self.array_var(stmt.name)
+                index = self.flat_index(stmt.name, arr, stmt.index_exprs)
+                self.emit('store', [arr, index, self.int_expr(stmt.expr)], None)
+            else:
+                self.assign(stmt.name, self.expr(stmt.expr))
+
+        elif isinstance(stmt, PrintStmt):
+            value = self.expr(stmt.expr)
+            if value.type == 'array':
+                raise RuntimeError("Printing a whole array is not supported in MIR")
+            self.emit('print', [value], None)
+
+        elif isinstance(stmt, IfStmt):
+            cond = self.int_expr(stmt.cond)
+            then_bb = self.func.new_block("if.then")
+            else_bb = self.func.new_block("if.else") if stmt.else_block else None
+            end_bb = self.func.new_block("if.end")
+            self.terminate(Instr('cbr', [cond], None), [then_bb, else_bb or end_bb])
+            self.seal(then_bb)
+            self.block = then_bb
+            self.build_block(stmt.then_block)
+            self.jump(end_bb)
+            if else_bb:
+                self.seal(else_bb)
+                self.block = else_bb
+                self.build_block(stmt.else_block)
+                self.jump(end_bb)
+            self.seal(end_bb)
+            self.block = end_bb
+
+        elif isinstance(stmt, WhileStmt):
+            self.build_loop(stmt.cond, stmt.body)
+
+        elif isinstance(stmt, ParallelForStmt):
+            # the IR has no notion of outlined loop bodies yet; the AST engines run these
+            raise RuntimeError("parallel for is not supported in MIR")
+
+        elif isinstance(stmt, ForStmt):
+            self.build_stmt(stmt.init)
+            self.build_loop(stmt.cond, stmt.body, stmt.update)
+
+        elif isinstance(stmt, Block):
+            self.build_block(stmt)
+
+        elif isinstance(stmt, ReturnStmt):
+            # only main is built, and its result is unused: evaluate for side effects and stop
+            if stmt.expr is not None:
+                self.expr(stmt.expr)
+            self.terminate(Instr('ret', type=None))
+
+        elif isinstance(stmt, FuncCall):
+            self.call(stmt)
+
+        elif isinstance(stmt, (Var, ArrayAccess)):
+            pass  # bare expression statement, nothing to do
+
+        else:
+            raise RuntimeError(f"Unsupported statement {type(stmt).__name__} in MIR")
+
+    def build_loop(self, cond, body, update=None):
+        header = self.func.new_block("loop.cond")
+        self.jump(header)
+        self.block = header
+        c = self.int_expr(cond)
+        body_bb = self.func.new_block("loop.body")
+        end_bb = self.func.new_block("loop.end")
+        self.terminate(Instr('cbr', [c], None), [body_bb, end_bb])
+        self.seal(body_bb)
+        self.seal(end_bb)
+        self.block = body_bb
+        self.build_block(body)
+        if update is not None and self.block is not None:
+            self.build_stmt(update)
+        if self.block is not None:
+            # budgets are charged per iteration at the back-edge, as in the other engines
+            self.emit('charge', [Const(len(body.statements) + 1)], None)
+        self.jump(header)
+        self.seal(header)
+        self.block = end_bb
+
+    # ---------------- Expressions ----------------
+    def expr(self, e):
+        if isinstance(e, Number):
+            return Const(e.value)
+        if isinstance(e, String):
+            return Const(e.value)
+        if isinstance(e, ArrayAccess) or (isinstance(e, Var) and getattr(e, 'index_exprs', None)):
+            arr = self.array_var(e.name)
+            return self.emit('load', [arr, self.flat_index(e.name, arr, e.index_exprs)])
+        if isinstance(e, Var):
+            return self.read(e.name)
+        if isinstance(e, BinOp):
+            if e.op not in BINOPS:
+                raise RuntimeError(f"Unknown operator {e.op}")
+            left = self.int_expr(e.left)
+            return self.emit(BINOPS[e.op], [left, self.int_expr(e.right)])
+        if isinstance(e, UnaryOp):
+            if e.op not in UNOPS:
+                raise RuntimeError(f"Unknown unary operator {e.op}")
+            return self.emit(UNOPS[e.op], [self.int_expr(e.expr)])
+        if isinstance(e, FuncCall):
+            return self.call(e)
+        raise RuntimeError(f"Unsupported expression {type(e).__name__} in MIR")
+
+    def int_expr(self, e):
+        value = self.expr(e)
+        if value.type != 'int':
+            raise RuntimeError(f"Expected an integer, got a {value.type} in MIR")
+        return value
+
+    def array_var(self, name):
+        if name not in self.var_types:
+            raise RuntimeError(f"Undefined array {name}")
+        arr = self.read(name)
+        if arr.type != 'array':
+            raise RuntimeError(f"{name} is not an array")
+        return arr
+
+    def flat_index(self, name, arr, index_exprs):
+        # row-major: ((i0 * d1 + i1) * d2 + i2) ..., with dim reads left for CSE/LICM
+        if len(index_exprs) != arr.rank:
+            raise RuntimeError(f"Partial indexing of array {name} is not supported in MIR")
+        flat = None
+        for k, e in enumerate(index_exprs):
+            index = self.int_expr(e)
+            if flat is None:
+                flat = index
+            else:
+                dim = self.emit('dim', [arr, Const(k)])
+                flat = self.emit('add', [self.emit('mul', [flat, dim]), index])
+        return flat
+
+    def call(self, e):
+        if e.name not in dataio.BUILTINS:
+            raise RuntimeError(f"Calls to user functions are not supported in MIR ({e.name})")
+        expected = 1 if e.name in ('load_bin', 'load_txt', 'len') else 2
+        if len(e.args) != expected:
+            raise RuntimeError(f"{e.name}() takes {expected} argument(s), got {len(e.args)}")
+        args = [self.expr(a) for a in e.args]
+        if e.name == 'len':
+            if args[0].type != 'array':
+                raise RuntimeError("len() expects an array")
+            return self.emit('len', args)
+        if args[0].type != 'str':
+            raise RuntimeError(f"{e.name}() expects a string path")
+        if e.name in dataio.ARRAY_BUILTINS:
+            instr = self.emit('call', args, 'array', 1)
+        else:
+            if args[1].type != 'array':
+                raise RuntimeError(f"{e.name}() expects an array")
+            instr = self.emit('call', args)
+        instr.callee = e.name
+        return instr
+
+def build_program(tree, entry='main'):
+    return MirBuilder().build(tree, entry)
+
+# ---------------- Textual dump ----------------
+def dump_function(func):
+    names = {}
+    for instr in func.instructions():
+        if instr.type is not None:
+            n = len(names)
+            names[instr] = f"%{instr.name}.{n}" if instr.name else f"%{n}"
+
+    def fmt(v):
+        if isinstance(v, Const):
+            return json.dumps(v.value) if v.type == 'str' else str(v.value)
+        if isinstance(v, Undef):
+            return "undef"
+        return names.get(v, "%<dead>")
+
+    lines = [f"func {func.name}() {{"]
+    for block in func.blocks:
+        label = f"{block.name}:"
+        if block.preds:
+            label = f"{label:<24}; preds = {', '.join(p.name for p in block.preds)}"
+        lines.append(label)
+        for instr in block.phis + block.instrs:
+            if instr.op == 'phi':
+                text = "phi " + ", ".join(f"[{fmt(a)}, {b.name}]" for a, b in zip(instr.args, instr.incoming))
+            elif instr.op == 'call':
+                text = f"call {instr.callee}(" + ", ".join(fmt(a) for a in instr.args) + ")"
+            else:
+                text = " ".join([instr.op, ", ".join([fmt(a) for a in instr.args] + [t.name for t in instr.targets])]).rstrip()
+            lines.append(f"  {names[instr]} = {text}" if instr in names else f"  {text}")
+    lines.append("}")
+    return "\n".join(lines)
+
+def dump_module(module):
+    return "\n\n".join(dump_function(f) for f in module.functions.values()) + "\n"
+
+# ---------------- CFG analyses ----------------
+def reverse_postorder(func):
+    entry = func.entry
+    seen, post = {entry}, []
+    stack = [(entry, iter(entry.succs))]
+    while stack:
+        block, succs = stack[-1]
+        for s in succs:
+            if s not in seen:
+                seen.add(s)
+                stack.append((s, iter(s.succs)))
+                break
+        else:
+            stack.pop()
+            post.append(block)
+    return post[::-1]
+
+class DomTree:
+    # Cooper, Harvey and Kennedy, "A Simple, Fast Dominance Algorithm"
+    def __init__(self, func):
+        self.order = reverse_postorder(func)
+        index = {b: k for k, b in enumerate(self.order)}
+        entry = self.order[0]
+        idom = {entry: entry}
+        changed = True
+        while changed:
+            changed = False
+            for block in self.order[1:]:
+                new = None
+                for p in block.preds:
+                    if p not in idom:
+                        continue
+                    if new is None:
+                        new = p
+                        continue
+                    a, b = p, new
+                    while a is not b:
+                        while index[a] > index[b]:
+                            a = idom[a]
+                        while index[b] > index[a]:
+                            b = idom[b]
+                    new = a
+                if idom.get(block) is not new:
+                    idom[block] = new
+                    changed = True
+        self.idom = idom
+        self.children = {b: [] for b in self.order}
+        for block in self.order[1:]:
+            self.children[idom[block]].append(block)
+        # pre/post numbers of a dominator tree walk make dominates() O(1)
+        self.pre, self.post = {}, {}
+        counter = 0
+        stack = [(entry, False)]
+        while stack:
+            block, leaving = stack.pop()
+            counter += 1
+            if leaving:
+                self.post[block] = counter
+                continue
+            self.pre[block] = counter
+            stack.append((block, True))
+            stack.extend((c, False) for c in reversed(self.children[block]))
+
+    def dominates(self, a, b):
+        return self.pre[a] <= self.pre[b] and self.post[b] <= self.post[a]
+
+# ---------------- Verification ----------------
+def verify(func):
+    # structural SSA checks; raises RuntimeError describing the first problem
+    def fail(msg):
+        raise RuntimeError(f"MIR verify ({func.name}): {msg}")
+
+    blocks = set(func.blocks)
+    for block in func.blocks:
+        if block.terminator is None:
+            fail(f"block {block.name} has no terminator")
+        if any(i.op in TERMINATORS for i in block.instrs[:-1]):
+            fail(f"block {block.name} has a terminator before its end")
+        for s in block.succs:
+            if s not in blocks:
+                fail(f"block {block.name} branches to a removed block")
+            if block not in s.preds:
+                fail(f"{block.name} -> {s.name} missing from preds")
+        for p in block.preds:
+            if block not in p.succs:
+                fail(f"{p.name} listed as pred of {block.name} without an edge")
+        for phi in block.phis:
+            if sorted(map(id, phi.incoming)) != sorted(map(id, block.preds)):
+                fail(f"phi in {block.name} does not match its predecessors")
+
+    dom = DomTree(func)
+    position = {}
+    for block in dom.order:
+        for k, instr in enumerate(block.phis + block.instrs):
+            if instr.block is not block:
+                fail(f"{instr.op} in {block.name} has a stale block link")
+            position[instr] = k
+
+    def dominates_use(v, block, k):
+        if not isinstance(v, Instr):
+            return True
+        if v not in position:
+            return False
+        if v.block is block:
+            return position[v] < k
+        return dom.dominates(v.block, block)
+
+    for block in dom.order:
+        for k, instr in enumerate(block.phis + block.instrs):
+            if instr.op == 'phi':
+                for v, pred in zip(instr.args, instr.incoming):
+                    if pred in dom.pre and not dominates_use(v, pred, len(pred.phis) + len(pred.instrs)):
+                        fail(f"phi operand in {block.name} does not dominate the edge from {pred.name}")
+            elif not all(dominates_use(v, block, k) for v in instr.args):
+                fail(f"{instr.op} in {block.name} uses a value that does not dominate it")
@@ -0,0 +1,187 @@
+from mir import *
+import dataio
+
+# Executes the mid-level IR. Each function is translated once into "threaded
+# code": every instruction becomes a closure over register slots, and each
+# block ends in a jump closure that performs the phi moves for the edge taken
+# and returns the next block.
+
+class ArrayValue:
+    # flat row-major elements plus the shape, like the JIT's arrays
+    __slots__ = ('data', 'dims')
+
+    def __init__(self, data, dims):
+        self.data = data
+        self.dims = dims
+
+class MirInterpreter:
+    def __init__(self, module, out=None, budget=None):
+        self.module = module
+        self.out = out  # file-like sink for print(); None means sys.stdout
+        self.budget = budget  # limits.Budget, charged at loop back-edges and array allocation
+        self.compiled = {}
+
+    def run(self, entry='main'):
+        if entry not in self.module.functions:
+            raise RuntimeError(f"No {entry} function")
+        return self.call(entry)
+
+    def call(self, name):
+        code, template = self.compiled.get(name) or self.compile(self.module.functions[name])
+        regs = list(template)
+        while code is not None:
+            steps, jump = code
+            for step in steps:
+                step(regs)
+            code = jump(regs)
+        return 0
+
+    # ---------------- Translation ----------------
+    def compile(self, func):
+        slots, template = {}, []
+
+        def slot(v):
+            if v not in slots:
+                slots[v] = len(template)
+                template.append(v.value if isinstance(v, Const) else 0)
+            return slots[v]
+
+        for instr in func.instructions():
+            if instr.type is not None:
+                slot(instr)
+        # [steps, jump] per block, filled in once every block has one to jump to
+        codes = {block: [None, None] for block in func.blocks}
+        for block in func.blocks:
+            code = codes[block]
+            code[0] = [s for s in (self.step(i, slot) for i in block.instrs[:-1]) if s is not None]
+            code[1] = self.jump(block, block.terminator, slot, codes)
+        result = (codes[func.entry], template)
+        self.compiled[func.name] = result
+        return result
+
+    def edge(self, pred, succ, slot, codes):
+        # jump closure body for pred -> succ: parallel copy into succ's phis
+        target = codes[succ]
+        moves = [(slot(phi), slot(phi.args[phi.incoming.index(pred)])) for phi in succ.phis]
+        if not moves:
+            return lambda r: target
+        if len(moves) == 1:
+            (d, s), = moves
+            def go(r):
+                r[d] = r[s]
+                return target
+            return go
+        dsts = [d for d, _ in moves]
+        srcs = [s for _, s in moves]
+        def go(r):
+            values = [r[s] for s in srcs]
+            for d, v in zip(dsts, values):
+                r[d] = v
+            return target
+        return go
+
+    def jump(self, block, term, slot, codes):
+        if term.op == 'ret':
+            return lambda r: None
+        if term.op == 'br':
+            return self.edge(block, term.targets[0], slot, codes)
+        c = slot(term.args[0])
+        on_true = self.edge(block, term.targets[0], slot, codes)
+        on_false = self.edge(block, term.targets[1], slot, codes)
+        return lambda r: on_true(r) if r[c] else on_false(r)
+
+    def step(self, instr, slot):
+        op = instr.op
+        args = [slot(a) for a in instr.args]
+        d = slot(instr) if instr.type is not None else None
+
+        if op in BINARY_EVAL:
+            a, b = args
+            # the common operators get their own closures to skip a call per instruction
+            if op == 'add':
+                def step(r): r[d] = r[a] + r[b]
+            elif op == 'sub':
+                def step(r): r[d] = r[a] - r[b]
+            elif op == 'mul':
+                def step(r): r[d] = r[a] * r[b]
+            elif op == 'lt':
+                def step(r): r[d] = int(r[a] < r[b])
+            elif op == 'le':
+                def step(r): r[d] = int(r[a] <= r[b])
+            elif op == 'gt':
+                def step(r): r[d] = int(r[a] > r[b])
+            elif op == 'ge':
+                def step(r): r[d] = int(r[a] >= r[b])
+            elif op == 'eq':
+                def step(r): r[d] = int(r[a] == r[b])
+            elif op == 'ne':
+                def step(r): r[d] = int(r[a] != r[b])
+            else:
+                f = BINARY_EVAL[op]
+                def step(r): r[d] = f(r[a], r[b])
+            return step
+        if op in UNARY_EVAL:
+            f, (a,) = UNARY_EVAL[op], args
+            def step(r): r[d] = f(r[a])
+            return step
+        if op == 'copy':
+            (a,) = args
+            def step(r): r[d] = r[a]
+            return step
+        if op == 'load':
+            a, i = args
+            def step(r): r[d] = r[a].data[r[i]]
+            return step
+        if op == 'store':
+            a, i, v = args
+            def step(r): r[a].data[r[i]] = r[v]
+            return step
+        if op == 'dim':
+            a, k = args[0], instr.args[1].value
+            def step(r): r[d] = r[a].dims[k]
+            return step
+        if op == 'len':
+            (a,) = args
+            def step(r): r[d] = len(r[a].data)
+            return step
+        if op == 'print':
+            (a,), out = args, self.out
+            def step(r): print(r[a], file=out)
+            return step
+        if op == 'charge':
+            if self.budget is None:
+                return None
+            charge, cost = self.budget.charge, instr.args[0].value
+            def step(r): charge(cost)
+            return step
+        if op == 'alloc':
+            budget = self.budget
+            def step(r):
+                dims = tuple(r[s] for s in args)
+                total = 1
+                for n in dims:
+                    total *= max(n, 0)
+                if budget is not None:
+                    # checked before allocating, so oversized arrays never hit memory
+                    budget.allocate(total)
+                r[d] = ArrayValue([0] * total, dims)
+            return step
+        if op == 'call':
+            return self.call_builtin(instr.callee, args, d)
+        raise RuntimeError(f"Unknown MIR instruction {op}")
+
+    def call_builtin(self, name, args, d):
+        budget = self.budget
+        if name in dataio.ARRAY_BUILTINS:
+            load = dataio.load_bin if name == 'load_bin' else dataio.load_txt
+            (path,) = args
+            def step(r):
+                data = load(r[path])
+                if budget is not None:
+                    budget.allocate(len(data))
+                r[d] = ArrayValue(data, (len(data),))
+            return step
+        save = dataio.save_bin if name == 'save_bin' else dataio.save_txt
+        path, arr = args
+        def step(r): r[d] = save(r[path], r[arr].data)
+        return step
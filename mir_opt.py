@@ -0,0 +1,334 @@
+from mir import *
+
+# Optimization passes over the mid-level IR. Each pass takes a Function, rewrites
+# it in place and returns how many changes it made.
+
+# ---------------- Helpers ----------------
+def resolve(mapping, v):
+    while v in mapping:
+        v = mapping[v]
+    return v
+
+def replace_uses(func, mapping):
+    if not mapping:
+        return
+    for instr in func.instructions():
+        if any(a in mapping for a in instr.args):
+            instr.args = [resolve(mapping, a) for a in instr.args]
+
+def remove_unreachable(func):
+    reachable = set(reverse_postorder(func))
+    dead = [b for b in func.blocks if b not in reachable]
+    for block in func.blocks:
+        if block not in reachable:
+            continue
+        kept = [k for k, p in enumerate(block.preds) if p in reachable]
+        if len(kept) != len(block.preds):
+            block.preds = [block.preds[k] for k in kept]
+            for phi in block.phis:
+                pairs = [(a, b) for a, b in zip(phi.args, phi.incoming) if b in reachable]
+                phi.args = [a for a, _ in pairs]
+                phi.incoming = [b for _, b in pairs]
+    func.blocks = [b for b in func.blocks if b in reachable]
+    return len(dead)
+
+def invariant(v, loop):
+    return not isinstance(v, Instr) or v.block not in loop.blocks
+
+# ---------------- Copy propagation ----------------
+# Forwards copies and single-valued phis to their source, and folds operations
+# on constants (only when the result fits in 32 bits, where both engines agree).
+def simplify(instr):
+    op, args = instr.op, instr.args
+    if op == 'copy':
+        return args[0]
+    if op == 'dim' and isinstance(args[0], Instr) and args[0].op == 'alloc':
+        return args[0].args[args[1].value]  # shape of a fresh array is its alloc operands
+    if op in BINARY_EVAL:
+        a, b = args
+        if isinstance(a, Const) and isinstance(b, Const) and a.type == b.type == 'int':
+            if op in TRAPPING and b.value == 0:
+                return None
+            result = BINARY_EVAL[op](a.value, b.value)
+            return Const(result) if I32_MIN <= result <= I32_MAX else None
+        if op in ('add', 'sub') and isinstance(b, Const) and b.value == 0:
+            return a
+        if op == 'add' and isinstance(a, Const) and a.value == 0:
+            return b
+        if op == 'mul':
+            for x, y in ((a, b), (b, a)):
+                if isinstance(y, Const) and y.value == 1:
+                    return x
+                if isinstance(y, Const) and y.value == 0:
+                    return Const(0)
+    if op in UNARY_EVAL and isinstance(args[0], Const) and args[0].type == 'int':
+        result = UNARY_EVAL[op](args[0].value)
+        return Const(result) if I32_MIN <= result <= I32_MAX else None
+    return None
+
+def trivial_phi(phi, mapping):
+    # the only value other than the phi itself (and undef), if there is exactly one
+    found, undef = None, False
+    for a in phi.args:
+        a = resolve(mapping, a)
+        if a is phi:
+            continue
+        if isinstance(a, Undef):
+            undef = True
+            continue
+        if found is not None and value_key(a) != value_key(found):
+            return None
+        found = a
+    if found is None:
+        return Undef()
+    if undef and isinstance(found, Instr):
+        return None  # a definition on only some paths need not dominate the phi
+    return found
+
+def copy_propagation(func):
+    total = 0
+    while True:
+        mapping = {}
+        for block in func.blocks:
+            for phi in list(block.phis):
+                value = trivial_phi(phi, mapping)
+                if value is not None:
+                    mapping[phi] = value
+                    block.phis.remove(phi)
+            for instr in list(block.instrs):
+                instr.args = [resolve(mapping, a) for a in instr.args]
+                value = simplify(instr)
+                if value is not None:
+                    mapping[instr] = value
+                    block.instrs.remove(instr)
+        if not mapping:
+            return total
+        replace_uses(func, mapping)
+        total += len(mapping)
+
+# ---------------- Common subexpression elimination ----------------
+# Dominator-based value numbering: a pure instruction is replaced by an
+# identical one that dominates it.
+def expression_key(instr):
+    keys = [value_key(a) for a in instr.args]
+    if instr.op in COMMUTATIVE:
+        keys.sort()
+    return (instr.op, tuple(keys))
+
+def common_subexpressions(func):
+    dom = DomTree(func)
+    table, mapping = {}, {}
+    stack = [(dom.order[0], None)]
+    while stack:
+        block, added = stack.pop()
+        if added is not None:
+            # leaving the dominator subtree: its expressions are out of scope again
+            for key in added:
+                del table[key]
+            continue
+        added = []
+        for instr in list(block.instrs):
+            instr.args = [resolve(mapping, a) for a in instr.args]
+            if instr.op not in PURE or instr.op == 'copy':
+                continue
+            key = expression_key(instr)
+            if key in table:
+                mapping[instr] = table[key]
+                block.instrs.remove(instr)
+            else:
+                table[key] = instr
+                added.append(key)
+        stack.append((block, added))
+        stack.extend((child, None) for child in dom.children[block])
+    replace_uses(func, mapping)
+    return len(mapping)
+
+# ---------------- Loops ----------------
+class Loop:
+    def __init__(self, header):
+        self.header = header
+        self.blocks = {header}
+        self.latches = []
+
+def find_loops(func, dom=None):
+    # natural loops, innermost first
+    dom = dom or DomTree(func)
+    loops = {}
+    for block in dom.order:
+        for succ in block.succs:
+            if succ in dom.pre and dom.dominates(succ, block):
+                loop = loops.setdefault(succ, Loop(succ))
+                loop.latches.append(block)
+                work = [block]
+                while work:
+                    b = work.pop()
+                    if b not in loop.blocks:
+                        loop.blocks.add(b)
+                        work.extend(b.preds)
+    return sorted(loops.values(), key=lambda l: len(l.blocks))
+
+def ensure_preheader(func, loop, loops=()):
+    # the single block outside the loop that enters it; created when missing
+    header = loop.header
+    outside = [p for p in header.preds if p not in loop.blocks]
+    if len(outside) == 1 and len(outside[0].succs) == 1:
+        return outside[0]
+    pre = func.new_block(header.name + ".pre", after=outside[-1])
+    for phi in header.phis:
+        pairs = [(a, b) for a, b in zip(phi.args, phi.incoming) if b in outside]
+        merged = Instr('phi', [a for a, _ in pairs], phi.type, phi.rank, phi.name)
+        merged.incoming = [b for _, b in pairs]
+        merged.block = pre
+        pre.phis.append(merged)
+        keep = [(a, b) for a, b in zip(phi.args, phi.incoming) if b not in outside]
+        phi.args = [merged] + [a for a, _ in keep]
+        phi.incoming = [pre] + [b for _, b in keep]
+    for p in outside:
+        p.retarget(header, pre)
+    br = Instr('br', type=None)
+    br.targets = [header]
+    pre.append(br)
+    header.preds.append(pre)
+    for other in loops:
+        if other is not loop and header in other.blocks:
+            other.blocks.add(pre)
+    return pre
+
+# ---------------- Loop-invariant code motion ----------------
+def hoist_invariants(func):
+    dom = DomTree(func)
+    loops = find_loops(func, dom)
+    moved = 0
+    for loop in loops:
+        pre = ensure_preheader(func, loop, loops)
+        changed = True
+        while changed:
+            changed = False
+            for block in func.blocks:
+                if block not in loop.blocks:
+                    continue
+                for instr in list(block.instrs):
+                    if instr.is_safe and instr.op != 'copy' and all(invariant(a, loop) for a in instr.args):
+                        block.instrs.remove(instr)
+                        pre.insert_before_terminator(instr)
+                        moved += 1
+                        changed = True
+    return moved
+
+# ---------------- Strength reduction ----------------
+# A basic induction variable i = phi [init, pre], [i +/- step, latch] with a
+# loop-invariant step turns every i * k (k invariant) into its own additive
+# induction variable: j = phi [init * k, pre], [j +/- step * k, latch].
+def induction_variables(loop, pre, latch):
+    ivs = {}
+    for phi in loop.header.phis:
+        if len(phi.args) != 2 or phi.type != 'int':
+            continue
+        init = phi.args[phi.incoming.index(pre)]
+        nxt = phi.args[phi.incoming.index(latch)]
+        if not isinstance(nxt, Instr) or nxt.op not in ('add', 'sub') or nxt.block not in loop.blocks:
+            continue
+        a, b = nxt.args
+        if a is phi and invariant(b, loop):
+            ivs[phi] = (init, nxt, b)
+        elif nxt.op == 'add' and b is phi and invariant(a, loop):
+            ivs[phi] = (init, nxt, a)
+    return ivs
+
+def reduce_strength(func):
+    dom = DomTree(func)
+    loops = find_loops(func, dom)
+    reduced_total = 0
+    for loop in loops:
+        if len(loop.latches) != 1:
+            continue
+        pre = ensure_preheader(func, loop, loops)
+        latch = loop.latches[0]
+        if len(loop.header.preds) != 2:
+            continue
+        ivs = induction_variables(loop, pre, latch)
+        if not ivs:
+            continue
+        reduced, mapping = {}, {}
+        for block in dom.order:
+            if block not in loop.blocks:
+                continue
+            for instr in list(block.instrs):
+                if instr.op != 'mul':
+                    continue
+                a, b = instr.args
+                if a in ivs and invariant(b, loop):
+                    iv, k = a, b
+                elif b in ivs and invariant(a, loop):
+                    iv, k = b, a
+                else:
+                    continue
+                key = (id(iv), value_key(k))
+                if key not in reduced:
+                    init, nxt, step = ivs[iv]
+                    start = pre.insert_before_terminator(Instr('mul', [init, k]))
+                    stride = pre.insert_before_terminator(Instr('mul', [step, k]))
+                    j = Instr('phi', [start], name=instr.name)
+                    j.incoming = [pre]
+                    j.block = loop.header
+                    loop.header.phis.append(j)
+                    j_next = Instr(nxt.op, [j, stride])
+                    j_next.block = nxt.block
+                    nxt.block.instrs.insert(nxt.block.instrs.index(nxt) + 1, j_next)
+                    j.args.append(j_next)
+                    j.incoming.append(latch)
+                    reduced[key] = j
+                mapping[instr] = reduced[key]
+                block.instrs.remove(instr)
+        replace_uses(func, mapping)
+        reduced_total += len(mapping)
+    return reduced_total
+
+# ---------------- Dead code elimination ----------------
+def eliminate_dead_code(func):
+    live, work = set(), []
+    for block in func.blocks:
+        for instr in block.instrs:
+            if not instr.is_safe:
+                live.add(instr)
+                work.append(instr)
+    while work:
+        for a in work.pop().args:
+            if isinstance(a, Instr) and a not in live:
+                live.add(a)
+                work.append(a)
+    removed = 0
+    for block in func.blocks:
+        before = len(block.phis) + len(block.instrs)
+        block.phis = [p for p in block.phis if p in live]
+        block.instrs = [i for i in block.instrs if i in live]
+        removed += before - len(block.phis) - len(block.instrs)
+    return removed
+
+# ---------------- Pipeline ----------------
+PASSES = {
+    'copyprop': copy_propagation,
+    'cse': common_subexpressions,
+    'licm': hoist_invariants,
+    'sr': reduce_strength,
+    'dce': eliminate_dead_code,
+}
+DEFAULT_PASSES = ('copyprop', 'cse', 'licm', 'sr', 'copyprop', 'cse', 'dce')
+
+def parse_passes(text):
+    passes = tuple(p for p in text.split(',') if p)
+    unknown = [p for p in passes if p not in PASSES]
+    if unknown:
+        raise ValueError(f"unknown MIR pass(es): {', '.join(unknown)}; available: {', '.join(PASSES)}")
+    return passes
+
+def optimize(module, passes=DEFAULT_PASSES, check=False):
+    # returns {pass name: changes made}; check verifies the IR after every pass
+    stats = {}
+    for func in module.functions.values():
+        remove_unreachable(func)
+        for name in passes:
+            stats[name] = stats.get(name, 0) + PASSES[name](func)
+            if check:
+                verify(func)
+    return stats
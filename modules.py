@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from ast_nodes import FuncDef, FuncCall, ImportStmt, walk
+from dataio import BUILTINS
+from ast_cache import compiler_fingerprint, parse_source, dump_tree, load_tree
+
+DEFAULT_BUILD_DIR = ".mycc_build"
+# Files whose contents decide the object file a given source compiles to
+_BACKEND_SOURCES = ("lexer.py", "parser.py", "ast_nodes.py", "codegen.py", "purity.py", "parallel.py",
+                    "limits.py", "dataio.py", "interpreter.py", "mir.py")
+
+def source_hash(code):
+    return hashlib.sha256(code.encode("utf8")).hexdigest()
+
+def resolve_import(from_path, target):
+    return os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(from_path)), target))
+
+def imports_of(tree):
+    return [s.path for s in tree.funcs if isinstance(s, ImportStmt)]
+
+# ---------------- Interpreter-side module object ----------------
+class Module:
+    def __init__(self, name, path, tree):
+        self.name = name
+        self.path = path
+        self.tree = tree
+        self.funcs = {f.name: f for f in tree.funcs if isinstance(f, FuncDef)}
+
+    def __repr__(self):
+        return f'Module({self.name})'
+
+# ---------------- Dependency graph node ----------------
+class ModuleInfo:
+    def __init__(self, path, name, code, imports, tree=None):
+        self.path = path
+        self.name = name
+        self.code = code
+        self.source_hash = source_hash(code)
+        self.imports = imports  # resolved absolute paths
+        self.tree = tree  # None until parsed (skipped for up-to-date modules)
+        self.hash = None  # source + transitive dependency hashes
+
+class ModuleTiming:
+    def __init__(self, name, rebuilt, seconds, reason):
+        self.name, self.rebuilt, self.seconds, self.reason = name, rebuilt, seconds, reason
+
+    def __repr__(self):
+        if self.rebuilt:
+            return f'rebuilt {self.name} ({self.seconds * 1000:.1f} ms, {self.reason})'
+        return f'up to date {self.name}'
+
+class BuildReport:
+    def __init__(self, root, order, timings, total):
+        self.root = root
+        self.order = order  # ModuleInfo list, dependencies first
+        self.timings = timings
+        self.total = total
+
+    @property
+    def rebuilt(self):
+        return [t.name for t in self.timings if t.rebuilt]
+
+    def print(self, out=None):
+        out = out or sys.stderr
+        for t in self.timings:
+            print(f'[build] {t}', file=out)
+        print(f'[build] {len(self.rebuilt)}/{len(self.timings)} modules rebuilt in {self.total * 1000:.1f} ms', file=out)
+
+# ---------------- Incremental builder ----------------
+class ModuleBuilder:
+    def __init__(self, build_dir=None, backend="interpret", cache=None, metered=False, memo=None, max_depth=None):
+        if backend not in ("interpret", "compile"):
+            raise ValueError(f'Unknown backend: {backend}')
+        self.build_dir = build_dir or DEFAULT_BUILD_DIR
+        self.backend = backend
+        self.cache = cache  # optional ASTCache for parsing changed modules
+        # metered: compile resource limit checks into the objects (see limits.Budget);
+        # memo, max_depth: as for CodeGen. Such objects are kept apart from plain ones.
+        self.memo, self.max_depth = memo, max_depth
+        self.variant = ""
+        if backend == "compile":
+            self.variant = ("-metered" if metered else "") + (f"-memo{memo}" if memo else "") + \
+                           (f"-depth{max_depth}" if max_depth else "")
+        self.manifest = self._load_manifest()
+
+    def _manifest_path(self):
+        # one manifest per backend and variant, so all builds can share a build dir
+        return os.path.join(self.build_dir, f"manifest-{self.backend}{self.variant}.json")
+
+    def _load_manifest(self):
+        try:
+            with open(self._manifest_path()) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {"modules": {}}
+        if manifest.get("compiler") != self._fingerprint():
+            return {"modules": {}}  # compiler changed: everything is stale
+        return manifest
+
+    def _save_manifest(self):
+        os.makedirs(self.build_dir, exist_ok=True)
+        self.manifest["compiler"] = self._fingerprint()
+        path = self._manifest_path()
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    def _fingerprint(self):
+        if self.backend == "compile":
+            return compiler_fingerprint(_BACKEND_SOURCES)
+        return compiler_fingerprint()
+
+    # ---------------- Graph discovery ----------------
+    def scan(self, root, parsed=None):
+        # parsed: (code, tree) of the root module when the caller already parsed it
+        root = os.path.abspath(root)
+        base = os.path.dirname(root)
+        infos = {}
+        order = []
+        visiting = []
+
+        def visit(path):
+            if path in infos:
+                return infos[path]
+            if path in visiting:
+                cycle = visiting[visiting.index(path):] + [path]
+                raise ImportError('Import cycle: ' + ' -> '.join(os.path.relpath(p, base) for p in cycle))
+            visiting.append(path)
+            if path == root and parsed is not None:
+                code, tree = parsed
+            else:
+                try:
+                    with open(path) as f:
+                        code = f.read()
+                except OSError as e:
+                    raise ImportError(f'Cannot import {os.path.relpath(path, base)}: {e.strerror}') from None
+                tree = None
+            name = os.path.relpath(path, base)
+            entry = self.manifest["modules"].get(path)
+            if tree is not None:
+                imports = [resolve_import(path, p) for p in imports_of(tree)]
+            elif entry and entry.get("source_hash") == source_hash(code):
+                imports = entry["imports"]  # unchanged source: reuse recorded imports, skip parsing
+            else:
+                tree = parse_source(code, self.cache)
+                imports = [resolve_import(path, p) for p in imports_of(tree)]
+            info = ModuleInfo(path, name, code, imports, tree)
+            for dep in imports:
+                visit(dep)
+            h = hashlib.sha256(info.source_hash.encode())
+            for dep in imports:
+                h.update(infos[dep].hash.encode())
+            info.hash = h.hexdigest()
+            visiting.pop()
+            infos[path] = info
+            order.append(info)
+            return info
+
+        visit(root)
+        return order
+
+    # ---------------- Build ----------------
+    def build(self, root, parsed=None):
+        t_start = time.perf_counter()
+        order = self.scan(root, parsed)
+        timings = []
+        for info in order:
+            entry = self.manifest["modules"].get(info.path)
+            reason = self._stale_reason(info, entry)
+            if reason is None:
+                timings.append(ModuleTiming(info.name, False, 0.0, None))
+                continue
+            t0 = time.perf_counter()
+            self._compile(info)
+            timings.append(ModuleTiming(info.name, True, time.perf_counter() - t0, reason))
+        self._check_duplicates(order)
+        if self.backend == "compile":
+            self._check_calls(order)
+        self._save_manifest()
+        return BuildReport(os.path.abspath(root), order, timings, time.perf_counter() - t_start)
+
+    def _stale_reason(self, info, entry):
+        if entry is None:
+            return "new"
+        if entry.get("source_hash") != info.source_hash:
+            return "source changed"
+        if entry.get("hash") != info.hash:
+            return "dependency changed"
+        if not os.path.exists(self._artifact(entry)):
+            return "missing artifact"
+        return None
+
+    def _artifact(self, entry):
+        return os.path.join(self.build_dir, entry["artifact"])
+
+    def _compile(self, info):
+        if info.tree is None:
+            info.tree = parse_source(info.code, self.cache)
+        stem = os.path.splitext(info.name)[0].replace(os.sep, "_").replace(".", "_")
+        if self.backend == "compile":
+            from codegen import CodeGen
+            from limits import Budget
+            # the checks don't depend on the limits, which the runtime applies
+            cg = CodeGen(Budget() if "-metered" in self.variant else None, memo=self.memo, max_depth=self.max_depth)
+            cg.generate_module(info.tree, info.name)
+            data = cg.emit_object()
+            artifact = f"{stem}-{info.hash[:16]}{self.variant}.o"
+        else:
+            data = dump_tree(info.tree)
+            artifact = f"{stem}-{info.hash[:16]}.ast"
+        os.makedirs(self.build_dir, exist_ok=True)
+        old = self.manifest["modules"].get(info.path)
+        with open(os.path.join(self.build_dir, artifact), "wb") as f:
+            f.write(data)
+        if old and old.get("artifact") != artifact:
+            try:
+                os.remove(self._artifact(old))
+            except OSError:
+                pass
+        self.manifest["modules"][info.path] = {
+            "source_hash": info.source_hash,
+            "hash": info.hash,
+            "imports": info.imports,
+            "funcs": [f.name for f in info.tree.funcs if isinstance(f, FuncDef)],
+            "params": {f.name: len(f.params) for f in info.tree.funcs if isinstance(f, FuncDef)},
+            "calls": sorted({(n.name, len(n.args)) for n in walk(info.tree)
+                             if isinstance(n, FuncCall) and n.name not in BUILTINS}),
+            "artifact": artifact,
+        }
+
+    def _check_duplicates(self, order):
+        seen = {}
+        for info in order:
+            for name in self.manifest["modules"][info.path]["funcs"]:
+                if name in seen:
+                    raise ImportError(f'Function {name} defined in both {seen[name]} and {info.name}')
+                seen[name] = info.name
+
+    def _check_calls(self, order):
+        # object files are linked by name: a missing or mis-called function must not reach the JIT linker
+        params = {}
+        for info in order:
+            params.update(self.manifest["modules"][info.path].get("params", {}))
+        for info in order:
+            for name, nargs in self.manifest["modules"][info.path].get("calls", []):
+                if name not in params:
+                    raise ImportError(f'Function {name} called in {info.name} is not defined in any module')
+                if params[name] != nargs:
+                    raise ImportError(f'{name}() takes {params[name]} argument(s), got {nargs} in {info.name}')
+
+    # ---------------- Load build outputs ----------------
+    def load_modules(self, report):
+        modules = []
+        for info in report.order:
+            tree = info.tree
+            if tree is None:
+                with open(self._artifact(self.manifest["modules"][info.path]), "rb") as f:
+                    tree = load_tree(f.read())
+            modules.append(Module(info.name, info.path, tree))
+        return modules
+
+    def load_objects(self, report):
+        objects = []
+        for info in report.order:
+            with open(self._artifact(self.manifest["modules"][info.path]), "rb") as f:
+                objects.append(f.read())
+        return objects
+
+# ---------------- Run a multi-module program ----------------
+def run_modules(root, backend="interpret", build_dir=None, cache=None, report_out=None, perf=None, workers=None,
+                max_depth=None, budget=None, memo=None, parsed=None):
+    builder = ModuleBuilder(build_dir, backend, cache, metered=budget is not None, memo=memo, max_depth=max_depth)
+    report = builder.build(root, parsed)
+    report.print(report_out)
+    if backend == "compile":
+        from codegen import run_jit_objects
+        return run_jit_objects(builder.load_objects(report), perf=perf, workers=workers, budget=budget,
+                               max_depth=max_depth)
+    from interpreter import Interpreter
+    modules = builder.load_modules(report)
+    return Interpreter(modules[-1].tree, modules[:-1], budget=budget, workers=workers, memo=memo,
+                       max_depth=max_depth).run()
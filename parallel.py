@@ -0,0 +1,494 @@
+import os
+from array import array
+from ast_nodes import *
+import dataio
+from limits import ResourceLimitExceeded
+
+# `parallel for` support shared by the engines: checking that a loop's
+# iterations really are independent, splitting its range into chunks, and the
+# worker pools (threads for JIT code, processes for the interpreter).
+
+REDUCTION_OPS = {'PLUS': 'add', 'MINUS': 'add', 'MUL': 'mul'}
+REDUCTION_IDENTITY = {'add': 0, 'mul': 1}
+MAX_CHUNKS = 64  # JIT code keeps per-chunk private values in fixed-size arrays
+
+def default_workers():
+    env = os.environ.get("MYCC_WORKERS")
+    return max(1, int(env)) if env else (os.cpu_count() or 1)
+
+def split(n, workers):
+    # contiguous [k0, k1) iteration ranges, at most one per worker
+    workers = max(1, min(workers, n, MAX_CHUNKS))
+    q, r = divmod(n, workers)
+    bounds, k0 = [], 0
+    for w in range(workers):
+        k1 = k0 + q + (w < r)
+        bounds.append((k0, k1))
+        k0 = k1
+    return bounds
+
+# ---------------- Loop analysis ----------------
+class ParallelPlan:
+    def __init__(self, var, start, bound, cmp, step, body):
+        self.var = var        # loop variable, i = start + k * step for iteration k
+        self.start = start    # expressions, evaluated once before the loop
+        self.bound = bound
+        self.cmp = cmp        # LT, LE, GT or GE, with the loop variable on the left
+        self.step = step      # non-zero int constant
+        self.body = body
+        self.cost = len(body.statements) + 1  # budget statements per iteration, as for ForStmt
+        self.reductions = {}  # scalar -> 'add' | 'mul', combined across chunks
+        self.privates = []    # scalars assigned before use in every iteration
+        self.shared = []      # scalars only read
+        self.arrays = []      # arrays indexed in the body
+
+    def trip_count(self, start, bound):
+        s = self.step
+        if self.cmp == 'LT':
+            return -((start - bound) // s) if bound > start else 0
+        if self.cmp == 'LE':
+            return (bound - start) // s + 1 if bound >= start else 0
+        if self.cmp == 'GT':
+            return -((bound - start) // -s) if start > bound else 0
+        return (start - bound) // -s + 1 if start >= bound else 0
+
+def analyze(stmt, pure=()):
+    # raises RuntimeError when the loop is not in the supported form; pure names
+    # the user functions the body may call (see purity.pure_functions)
+    var, start = _loop_start(stmt.init)
+    cond = stmt.cond
+    if not (isinstance(cond, BinOp) and cond.op in ('LT', 'LE', 'GT', 'GE') and _is_scalar(cond.left, var)):
+        raise RuntimeError(f"parallel for: condition must compare {var} with <, <=, > or >=")
+    upd = stmt.update
+    if not (isinstance(upd, AssignStmt) and upd.name == var and not upd.index_exprs
+            and isinstance(upd.expr, BinOp) and upd.expr.op in ('PLUS', 'MINUS')
+            and _is_scalar(upd.expr.left, var) and isinstance(upd.expr.right, Number)
+            and upd.expr.right.value > 0):
+        raise RuntimeError(f"parallel for: update must be {var} = {var} + constant (or - constant)")
+    step = upd.expr.right.value if upd.expr.op == 'PLUS' else -upd.expr.right.value
+    if (step > 0) != (cond.op in ('LT', 'LE')):
+        raise RuntimeError(f"parallel for: {var} moves away from its bound")
+    plan = ParallelPlan(var, start, cond.right, cond.op, step, stmt.body)
+    _Checker(plan, pure).check()
+    return plan
+
+def _loop_start(init):
+    if isinstance(init, VarDecl) and not init.dimensions and init.expr is not None:
+        return init.name, init.expr
+    if isinstance(init, AssignStmt) and not init.index_exprs:
+        return init.name, init.expr
+    raise RuntimeError("parallel for: initialiser must assign the loop variable")
+
+def _scalar_write(stmt):
+    if isinstance(stmt, VarDecl):
+        return not stmt.dimensions
+    return isinstance(stmt, AssignStmt) and not stmt.index_exprs
+
+def _is_scalar(expr, name):
+    return isinstance(expr, Var) and expr.name == name and not expr.index_exprs
+
+class _Checker:
+    # Iterations may run in any order and on any worker, so the body may only
+    # - index arrays (the program declares that different iterations touch different elements),
+    # - read scalars the loop never writes,
+    # - use scalars it assigns before reading them in the same iteration (privates),
+    # - accumulate into scalars with s = s + e, s = s - e or s = s * e (reductions),
+    # - call pure functions.
+    def __init__(self, plan, pure):
+        self.plan = plan
+        self.pure = pure
+        self.arrays = []
+        self.stored = []  # arrays assigned to
+        self.shared = []
+        writes = {}  # scalar -> [AssignStmt/VarDecl]
+        for stmt in self.statements(plan.body.statements):
+            if _scalar_write(stmt):
+                writes.setdefault(stmt.name, []).append(stmt)
+        self.writes = writes
+        for name, stmts in writes.items():
+            if name == plan.var:
+                raise RuntimeError(f"parallel for: the loop variable {name} is assigned in the body")
+            kinds = {self.reduction_kind(s) for s in stmts}
+            if len(kinds) == 1 and None not in kinds:
+                plan.reductions[name] = kinds.pop()
+            else:
+                plan.privates.append(name)
+
+    def statements(self, stmts):
+        for stmt in stmts:
+            yield stmt
+            if isinstance(stmt, IfStmt):
+                yield from self.statements(stmt.then_block.statements)
+                if stmt.else_block:
+                    yield from self.statements(stmt.else_block.statements)
+            elif isinstance(stmt, WhileStmt):
+                yield from self.statements(stmt.body.statements)
+            elif isinstance(stmt, ForStmt):
+                yield from self.statements([stmt.init, stmt.update] + stmt.body.statements)
+            elif isinstance(stmt, Block):
+                yield from self.statements(stmt.statements)
+
+    def reduction_terms(self, stmt):
+        # s = s + a - b ... or s = s * a * ...: (kind, [a, b, ...]), else None
+        if not isinstance(stmt, AssignStmt):
+            return None
+        e, kinds, terms = stmt.expr, set(), []
+        while isinstance(e, BinOp) and e.op in REDUCTION_OPS:
+            kinds.add(REDUCTION_OPS[e.op])
+            terms.append(e.right)
+            e = e.left
+        if len(kinds) != 1 or not _is_scalar(e, stmt.name):
+            return None
+        if any(stmt.name in self.reads(t) for t in terms):
+            return None
+        return kinds.pop(), terms
+
+    def reduction_kind(self, stmt):
+        terms = self.reduction_terms(stmt)
+        return terms[0] if terms else None
+
+    def reads(self, expr):
+        # names read by an expression, arrays included
+        names, stack = [], [expr]
+        while stack:
+            e = stack.pop()
+            if isinstance(e, (Var, ArrayAccess)):
+                names.append(e.name)
+                stack.extend(e.index_exprs or [])
+            elif isinstance(e, BinOp):
+                stack += [e.left, e.right]
+            elif isinstance(e, UnaryOp):
+                stack.append(e.expr)
+            elif isinstance(e, FuncCall):
+                stack.extend(e.args)
+            elif isinstance(e, Slice):
+                names.append(e.var)
+                stack += [x for x in (e.start, e.end) if x is not None]
+        return names
+
+    def check(self):
+        self.block(self.plan.body.statements, {self.plan.var})
+        plan = self.plan
+        plan.arrays = sorted(set(self.arrays))
+        plan.shared = sorted(set(self.shared) - set(plan.arrays) - {plan.var})
+        # the bound is evaluated once, so the body must not be able to move it
+        for name in self.reads(plan.bound):
+            if name in self.writes or name in self.stored or name == plan.var:
+                raise RuntimeError(f"parallel for: the loop bound depends on {name}, which the body changes")
+        for name in self.reads(plan.start):
+            if name == plan.var:
+                raise RuntimeError(f"parallel for: the start value depends on {plan.var}")
+
+    def expr(self, e, defined):
+        stack = [e]
+        while stack:
+            e = stack.pop()
+            if isinstance(e, (Var, ArrayAccess)):
+                if e.index_exprs:
+                    self.arrays.append(e.name)
+                    stack.extend(e.index_exprs)
+                else:
+                    self.scalar(e.name, defined)
+            elif isinstance(e, BinOp):
+                stack += [e.left, e.right]
+            elif isinstance(e, UnaryOp):
+                stack.append(e.expr)
+            elif isinstance(e, FuncCall):
+                self.call(e, defined)
+            elif isinstance(e, Slice):
+                self.arrays.append(e.var)
+                stack += [x for x in (e.start, e.end) if x is not None]
+
+    def call(self, call, defined):
+        if call.name in dataio.BUILTINS and call.name != 'len':
+            raise RuntimeError(f"parallel for: {call.name}() is not allowed in the body")
+        if call.name not in dataio.BUILTINS and call.name not in self.pure:
+            raise RuntimeError(f"parallel for: {call.name}() is not a pure function")
+        if call.name == 'len':
+            for a in call.args:
+                if isinstance(a, Var) and not a.index_exprs:
+                    self.arrays.append(a.name)
+                else:
+                    self.expr(a, defined)
+            return
+        for a in call.args:
+            self.expr(a, defined)
+
+    def scalar(self, name, defined):
+        plan = self.plan
+        if name in plan.reductions:
+            raise RuntimeError(f"parallel for: reduction variable {name} is read in the body")
+        if name in self.writes and name not in defined:
+            raise RuntimeError(f"parallel for: {name} is read before it is assigned, "
+                               f"so its value would carry over between iterations")
+        if name not in self.writes:
+            self.shared.append(name)
+
+    def block(self, stmts, defined):
+        # defined: privates assigned on every path so far in this iteration
+        for stmt in stmts:
+            if isinstance(stmt, VarDecl):
+                if stmt.dimensions:
+                    raise RuntimeError("parallel for: arrays cannot be declared in the body")
+                if stmt.expr is not None:
+                    self.assignment(stmt, defined)
+                defined.add(stmt.name)
+            elif isinstance(stmt, AssignStmt):
+                if stmt.index_exprs:
+                    self.arrays.append(stmt.name)
+                    self.stored.append(stmt.name)
+                    for e in stmt.index_exprs:
+                        self.expr(e, defined)
+                    self.expr(stmt.expr, defined)
+                else:
+                    self.assignment(stmt, defined)
+                    defined.add(stmt.name)
+            elif isinstance(stmt, IfStmt):
+                self.expr(stmt.cond, defined)
+                self.block(stmt.then_block.statements, set(defined))
+                if stmt.else_block:
+                    self.block(stmt.else_block.statements, set(defined))
+            elif isinstance(stmt, WhileStmt):
+                self.expr(stmt.cond, defined)
+                self.block(stmt.body.statements, set(defined))
+            elif isinstance(stmt, ForStmt):
+                # nested loops, parallel ones included, run sequentially inside a chunk
+                self.block([stmt.init], defined)
+                self.expr(stmt.cond, defined)
+                self.block(stmt.body.statements + [stmt.update], set(defined))
+            elif isinstance(stmt, Block):
+                self.block(stmt.statements, defined)
+            elif isinstance(stmt, FuncCall):
+                self.call(stmt, defined)
+            elif isinstance(stmt, PrintStmt):
+                raise RuntimeError("parallel for: print is not allowed in the body (iteration order is unspecified)")
+            elif isinstance(stmt, ReturnStmt):
+                raise RuntimeError("parallel for: return is not allowed in the body")
+            elif isinstance(stmt, (Var, ArrayAccess)):
+                pass
+            else:
+                raise RuntimeError(f"parallel for: unsupported statement {type(stmt).__name__}")
+
+    def assignment(self, stmt, defined):
+        if isinstance(stmt.expr, FuncCall) and stmt.expr.name in dataio.ARRAY_BUILTINS:
+            raise RuntimeError(f"parallel for: {stmt.expr.name}() is not allowed in the body")
+        if stmt.name in self.plan.reductions:
+            for term in self.reduction_terms(stmt)[1]:
+                self.expr(term, defined)
+        else:
+            self.expr(stmt.expr, defined)
+
+# ---------------- Worker pools ----------------
+_thread_pools = {}
+_process_pools = {}
+
+def thread_pool(workers, stack_size=0):
+    # JIT chunks are native code called through ctypes, which releases the GIL;
+    # stack_size is what the calls they make need (0: the platform default)
+    from concurrent.futures import ThreadPoolExecutor
+    import threading
+    key = (workers, stack_size)
+    pool = _thread_pools.get(key)
+    if pool is None:
+        pool = _thread_pools[key] = ThreadPoolExecutor(workers, thread_name_prefix="mycc-par")
+        # threads take the stack size set when they start, and a pool starts
+        # them on demand: hold every one in a barrier so all start now
+        barrier = threading.Barrier(workers)
+        old = threading.stack_size(stack_size)
+        try:
+            started = [pool.submit(barrier.wait) for _ in range(workers)]
+        finally:
+            threading.stack_size(old)
+        for f in started:
+            f.result()
+    return pool
+
+def process_pool(workers):
+    # forkserver keeps workers independent of whatever threads this process has
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    pool = _process_pools.get(workers)
+    if pool is None:
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        pool = _process_pools[workers] = ProcessPoolExecutor(workers, mp_context=ctx)
+    return pool
+
+# ---------------- Shared-memory arrays (interpreter) ----------------
+class SharedArray:
+    # Nested-list look-alike over a flat int64 buffer, so interpreter code that
+    # does arr[i][j] (and arr[i][j] = v) works unchanged in worker processes.
+    # One-dimensional arrays are handed to workers as the plain memoryview.
+    __slots__ = ('flat', 'dims', 'offset', 'stride')
+
+    def __init__(self, flat, dims, offset=0):
+        self.flat = flat
+        self.dims = dims
+        self.offset = offset
+        stride = 1
+        for d in dims[1:]:
+            stride *= d
+        self.stride = stride
+
+    def __len__(self):
+        return self.dims[0]
+
+    def _index(self, i):
+        n = self.dims[0]
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('list index out of range')
+        return i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(self.dims[0]))]
+        start = self.offset + self._index(i) * self.stride
+        if len(self.dims) == 2:
+            return self.flat[start:start + self.stride]  # innermost rows index natively
+        return SharedArray(self.flat, self.dims[1:], start)
+
+def array_shape(value):
+    dims = []
+    while isinstance(value, list):
+        dims.append(len(value))
+        if not value:
+            break
+        value = value[0]
+    if isinstance(value, (memoryview, array)):
+        dims.append(len(value))
+    return dims
+
+def _rows(value, dims):
+    # innermost rows of a rectangular nested list, in row-major order
+    if len(dims) <= 1:
+        yield value
+        return
+    for row in value:
+        yield from _rows(row, dims[1:])
+
+class SharedArrays:
+    # copies the loop's arrays into shared memory, and back into the same
+    # (possibly aliased) Python objects once the workers are done
+    def __init__(self, env, names):
+        from multiprocessing import shared_memory
+        self.blocks = {}  # id(array) -> (SharedMemory, dims); names sharing an array share a block
+        self.values = {}
+        self.names = {}
+        for name in names:
+            value = env[name]
+            self.names[name] = id(value)
+            if id(value) in self.blocks:
+                continue
+            dims = array_shape(value)
+            total = 1
+            for d in dims:
+                total *= d
+            shm = shared_memory.SharedMemory(create=True, size=max(total, 1) * 8)
+            flat = shm.buf.cast('q')
+            off = 0
+            for row in _rows(value, dims):
+                n = len(row)
+                flat[off:off + n] = array('q', row)
+                off += n
+            flat.release()
+            self.blocks[id(value)] = (shm, dims)
+            self.values[id(value)] = value
+
+    def descriptors(self):
+        return {name: (self.blocks[key][0].name, self.blocks[key][1]) for name, key in self.names.items()}
+
+    def copy_back(self):
+        for key, (shm, dims) in self.blocks.items():
+            flat = shm.buf.cast('q')
+            off = 0
+            for row in _rows(self.values[key], dims):
+                n = len(row)
+                if isinstance(row, memoryview):
+                    row[:] = array(row.format, flat[off:off + n].tolist())
+                else:
+                    row[:] = flat[off:off + n].tolist()
+                off += n
+            flat.release()
+
+    def close(self):
+        for shm, _ in self.blocks.values():
+            shm.close()
+            shm.unlink()
+        self.blocks = {}
+
+def _attach(descriptors):
+    # workers share the parent's resource tracker, which unlinks the blocks if the parent dies
+    from multiprocessing import shared_memory
+    handles, arrays, opened = [], {}, {}
+    for name, (shm_name, dims) in descriptors.items():
+        if shm_name not in opened:
+            shm = shared_memory.SharedMemory(name=shm_name)
+            flat = shm.buf.cast('q')
+            handles.append((shm, flat))
+            opened[shm_name] = flat if len(dims) == 1 else SharedArray(flat, dims)
+        arrays[name] = opened[shm_name]
+    return handles, arrays
+
+def run_chunk(job, k0, k1):
+    # worker process: run iterations [k0, k1) of a parallel loop with the interpreter
+    from interpreter import Interpreter, Frame
+    (body, layout, funcs, memo, max_depth, depth, budget, cost, var, start, step, scalars, descriptors,
+     reductions, privates) = job
+    handles, arrays = _attach(descriptors)
+    interp = Interpreter(Program(list(funcs.values())), budget=budget, workers=1, memo=memo, max_depth=max_depth)
+    interp.depth = depth  # calls in the body continue from the loop's own depth
+    interp.reserve_stack()
+    env = interp.env = Frame(layout)  # the body's nodes carry slots from the parent's layout
+    try:
+        env.update(scalars)
+        env.update(arrays)
+        for name, kind in reductions.items():
+            env[name] = REDUCTION_IDENTITY[kind]
+        try:
+            for k in range(k0, k1):
+                env[var] = start + k * step
+                interp.exec_block(body)
+                if budget is not None:
+                    budget.charge(cost)
+        except ResourceLimitExceeded:
+            pass  # the parent sees it once it absorbs this chunk's count
+        partials = {name: env[name] for name in reductions}
+        # privates this chunk assigned; the parent applies them in chunk order
+        final = {name: env[name] for name in privates if name in env}
+    finally:
+        # views into the blocks must be gone before they can be closed
+        interp.env = env = None
+        arrays.clear()
+        for shm, flat in handles:
+            flat.release()
+            shm.close()
+    return partials, final, budget.statements if budget is not None else 0
+
+def run_interpreted(interp, plan, start, n, workers):
+    # iterations [0, n) of the loop across a process pool, leaving reductions
+    # and privates in interp.env as a sequential run would
+    env = interp.env
+    shared = SharedArrays(env, plan.arrays)
+    try:
+        scalars = {name: env[name] for name in plan.shared if name in env}
+        budget = interp.budget.share() if interp.budget is not None else None
+        job = (plan.body, env.layout, interp.funcs, interp.memo, interp.max_depth, interp.depth, budget, plan.cost,
+               plan.var, start, plan.step, scalars, shared.descriptors(), plan.reductions, plan.privates)
+        bounds = split(n, workers)
+        pool = process_pool(workers)
+        futures = [pool.submit(run_chunk, job, k0, k1) for k0, k1 in bounds]
+        results = [f.result() for f in futures]
+        if interp.budget is not None:
+            interp.budget.absorb(sum(used for _, _, used in results))
+        shared.copy_back()
+    finally:
+        shared.close()
+    for name, kind in plan.reductions.items():
+        value = env[name]
+        for partials, _, _ in results:
+            value = value + partials[name] if kind == 'add' else value * partials[name]
+        env[name] = value
+    for _, final, _ in results:
+        env.update(final)
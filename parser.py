@@ -30,6 +30,8 @@ class Parser:
             tok = self.current()
             if tok.type == 'FUNC':
                 stmts.append(self.parse_func())
+            elif tok.type == 'IMPORT':
+                stmts.append(self.parse_import())
             else:
                 stmt = self.parse_statement()
                 if stmt:
@@ -38,12 +40,29 @@ class Parser:
 
     # ---------------- Functions ----------------
     def parse_func(self):
-        self.eat('FUNC')
+        line = self.eat('FUNC').line
         name = self.eat('ID').value
         self.eat('LPAREN')
+        params = []
+        if self.current() and self.current().type != 'RPAREN':
+            params.append(self.eat('ID').value)
+            while self.current() and self.current().type == 'COMMA':
+                self.eat('COMMA')
+                params.append(self.eat('ID').value)
         self.eat('RPAREN')
+        if len(set(params)) != len(params):
+            raise SyntaxError(f'Duplicate parameter name in function {name}')
         body = self.parse_block()
-        return FuncDef(name, body)
+        func = FuncDef(name, body, params)
+        func.line = line
+        return func
+
+    # ---------------- Imports ----------------
+    def parse_import(self):
+        self.eat('IMPORT')
+        path = self.eat('STRING').value
+        self.eat('SEMI')
+        return ImportStmt(path)
 
     # ---------------- Blocks ----------------
     def parse_block(self):
@@ -77,6 +96,12 @@ class Parser:
     # ---------------- Statements ----------------
     def parse_statement(self):
         tok = self.current()
+        stmt = self.parse_statement_at(tok)
+        if isinstance(stmt, Node) and stmt.line is None:
+            stmt.line = tok.line
+        return stmt
+
+    def parse_statement_at(self, tok):
         if not tok:
             return None
 
@@ -101,6 +126,9 @@ class Parser:
         if tok.type == 'FOR':
             return self.parse_for()
 
+        if tok.type == 'PARALLEL':
+            return self.parse_parallel_for()
+
         if tok.type == 'RETURN':
             return self.parse_return()
 
@@ -130,6 +158,11 @@ class Parser:
     # ---------------- Assignment / Variable ----------------
     def parse_assignment_or_var(self):
         name = self.eat('ID').value
+        if self.current() and self.current().type == 'LPAREN':
+            call = self.parse_call(name)
+            if self.current() and self.current().type == 'SEMI':
+                self.eat('SEMI')
+            return call
         index_exprs = []
         while self.current() and self.current().type == 'LBRACKET':
             self.eat('LBRACKET')
@@ -198,17 +231,21 @@ class Parser:
         if not tok:
             raise SyntaxError("Unexpected end of input in for-loop")
         if tok.type == 'VAR':
-            return self.parse_var_decl()
+            stmt = self.parse_var_decl()
         elif tok.type == 'ID':
-            return self.parse_assignment_or_var()
+            stmt = self.parse_assignment_or_var()
         else:
             raise SyntaxError(f'Invalid simple statement in for-loop: {tok}')
+        stmt.line = tok.line
+        return stmt
 
     def parse_for(self):
         self.eat('FOR')
         self.eat('LPAREN')
         init = self.parse_simple_statement()
-        self.eat('SEMI')
+        # simple statements already consume their trailing ';'
+        if self.current() and self.current().type == 'SEMI':
+            self.eat('SEMI')
         cond = self.parse_expr()
         self.eat('SEMI')
         update = self.parse_simple_statement()
@@ -216,6 +253,11 @@ class Parser:
         body = self.parse_block()
         return ForStmt(init, cond, update, body)
 
+    def parse_parallel_for(self):
+        self.eat('PARALLEL')
+        loop = self.parse_for()
+        return ParallelForStmt(loop.init, loop.cond, loop.update, loop.body)
+
     # ---------------- Expressions ----------------
     def parse_expr(self):
         return self.parse_logical()
@@ -294,6 +336,8 @@ class Parser:
             return String(tok.value)
         elif tok.type == 'ID':
             name = self.eat('ID').value
+            if self.current() and self.current().type == 'LPAREN':
+                return self.parse_call(name)
             index_exprs = []
             while self.current() and self.current().type == 'LBRACKET':
                 self.eat('LBRACKET')
@@ -310,6 +354,18 @@ class Parser:
         else:
             raise SyntaxError(f'Unexpected token: {tok}')
 
+    # ---------------- Function calls ----------------
+    def parse_call(self, name):
+        self.eat('LPAREN')
+        args = []
+        if self.current() and self.current().type != 'RPAREN':
+            args.append(self.parse_expr())
+            while self.current() and self.current().type == 'COMMA':
+                self.eat('COMMA')
+                args.append(self.parse_expr())
+        self.eat('RPAREN')
+        return FuncCall(name, args)
+
 # ---------------- AST Node for Expression Statements ----------------
 class ExprStmt(Node):
     def __init__(self, expr):
@@ -0,0 +1,109 @@
+import ctypes
+import mmap
+import os
+import struct
+import threading
+import time
+
+# ---------------- ELF symbols ----------------
+# Just enough ELF64 parsing to find the size of every function in an object
+# file emitted by MCJIT; start addresses come from the execution engine.
+_SHT_SYMTAB = 2
+_STT_FUNC = 2
+
+def function_symbols(obj):
+    if obj[:4] != b'\x7fELF' or obj[4] != 2:
+        raise ValueError('not an ELF64 object')
+    endian = '<' if obj[5] == 1 else '>'
+    shoff, = struct.unpack_from(endian + 'Q', obj, 0x28)
+    shentsize, shnum = struct.unpack_from(endian + 'HH', obj, 0x3A)
+    sections = [struct.unpack_from(endian + 'IIQQQQIIQQ', obj, shoff + k * shentsize) for k in range(shnum)]
+    result = {}
+    for _, sh_type, _, _, offset, size, link, _, _, entsize in sections:
+        if sh_type != _SHT_SYMTAB:
+            continue
+        strtab = sections[link][4]
+        for k in range(size // entsize):
+            st_name, st_info, _, st_shndx, _, st_size = struct.unpack_from(endian + 'IBBHQQ', obj, offset + k * entsize)
+            if st_info & 0xf != _STT_FUNC or st_shndx == 0:
+                continue  # not a function, or only declared here
+            end = obj.index(b'\0', strtab + st_name)
+            result[obj[strtab + st_name:end].decode()] = st_size
+    return result
+
+# ---------------- /tmp/perf-<pid>.map ----------------
+class PerfMap:
+    def __init__(self, pid=None, directory="/tmp"):
+        self.path = os.path.join(directory, f"perf-{pid or os.getpid()}.map")
+
+    def record(self, name, addr, size, lines=None, code=None):
+        # perf reads "START SIZE symbolname" lines, hex without 0x
+        with open(self.path, "a") as f:
+            f.write(f"{addr:x} {size:x} {name}\n")
+
+    def close(self):
+        pass
+
+# ---------------- jitdump (perf inject --jit) ----------------
+_JITDUMP_MAGIC = 0x4A695444
+_JIT_CODE_LOAD = 0
+_JIT_CODE_DEBUG_INFO = 2
+_ELF_MACHINES = {"x86_64": 62, "aarch64": 183, "arm64": 183, "ppc64le": 21, "s390x": 22}
+
+def _timestamp():
+    # perf record -k mono expects CLOCK_MONOTONIC
+    return time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+
+class JitDump:
+    def __init__(self, pid=None, directory="/tmp"):
+        self.pid = pid or os.getpid()
+        self.path = os.path.join(directory, f"jit-{self.pid}.dump")
+        self.index = 0
+        self.file = open(self.path, "w+b")
+        machine = _ELF_MACHINES.get(os.uname().machine, 0)
+        self.file.write(struct.pack("<IIIIIIQQ", _JITDUMP_MAGIC, 1, 40, machine, 0, self.pid, _timestamp(), 0))
+        self.file.flush()
+        # perf only finds the dump through an executable mapping of it in this process
+        self._marker = mmap.mmap(self.file.fileno(), 40, flags=mmap.MAP_PRIVATE,
+                                 prot=mmap.PROT_READ | mmap.PROT_EXEC)
+
+    def record(self, name, addr, size, lines=None, code=None):
+        if lines:
+            # (address, line, filename) entries, emitted before the code they describe
+            body = struct.pack("<QQ", addr, len(lines))
+            for line_addr, line, filename in lines:
+                body += struct.pack("<QII", line_addr, line, 0) + filename.encode() + b"\0"
+            self._write(_JIT_CODE_DEBUG_INFO, body)
+        if code is None:
+            code = ctypes.string_at(addr, size)
+        body = struct.pack("<IIQQQQ", self.pid, threading.get_native_id(), addr, addr, size, self.index)
+        self._write(_JIT_CODE_LOAD, body + name.encode() + b"\0" + code)
+        self.index += 1
+
+    def _write(self, kind, body):
+        self.file.write(struct.pack("<IIQ", kind, 16 + len(body), _timestamp()) + body)
+        self.file.flush()
+
+    def close(self):
+        self._marker.close()
+        self.file.close()
+
+# ---------------- Both at once ----------------
+class PerfRecorder:
+    def __init__(self, perf_map=True, jitdump=False, pid=None, directory="/tmp"):
+        self.sinks = []
+        if perf_map:
+            self.sinks.append(PerfMap(pid, directory))
+        if jitdump:
+            self.sinks.append(JitDump(pid, directory))
+        self.symbols = []  # (name, addr, size) of everything recorded
+
+    def record(self, name, addr, size, lines=None):
+        self.symbols.append((name, addr, size))
+        code = ctypes.string_at(addr, size)
+        for sink in self.sinks:
+            sink.record(name, addr, size, lines, code)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
@@ -0,0 +1,49 @@
+from ast_nodes import *
+import dataio
+
+# Pure functions: no output, no file I/O, no arrays, and calls only to other
+# pure functions. With integer arguments their result depends on nothing but
+# the argument values, so calls may be memoized or run from parallel loops.
+
+_PURE_NODES = (Number, Var, BinOp, UnaryOp, VarDecl, AssignStmt, IfStmt, WhileStmt,
+               ForStmt, Block, ReturnStmt, FuncCall)
+
+def calls(node):
+    # names of the user functions called anywhere below node
+    return {n.name for n in walk(node) if isinstance(n, FuncCall) and n.name not in dataio.BUILTINS}
+
+def locally_pure(func):
+    for n in walk(func.body):
+        if not isinstance(n, _PURE_NODES):
+            return False
+        if isinstance(n, (Var, AssignStmt)) and n.index_exprs:
+            return False
+        if isinstance(n, VarDecl) and n.dimensions:
+            return False
+        if isinstance(n, FuncCall) and n.name in dataio.BUILTINS:
+            return False
+    return True
+
+def pure_functions(funcs):
+    # funcs: name -> FuncDef; recursion is fine, so start from every locally
+    # pure function and drop the ones that call anything else until stable
+    pure = {name for name, f in funcs.items() if locally_pure(f)}
+    callees = {name: calls(funcs[name].body) for name in pure}
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            if not callees[name] <= pure:
+                pure.discard(name)
+                changed = True
+    return pure
+
+def reachable(funcs, roots):
+    # roots plus every function they call, directly or not (unknown names are skipped)
+    seen, work = set(), [r for r in roots if r in funcs]
+    while work:
+        name = work.pop()
+        if name not in seen:
+            seen.add(name)
+            work.extend(c for c in calls(funcs[name].body) if c in funcs)
+    return seen
@@ -0,0 +1,41 @@
+# A data file that doesn't hold int32 values must fail as a program error that
+# names the file and line, not with a traceback.
+#
+#   python test_dataio.py   (or pytest test_dataio.py)
+import os
+import tempfile
+
+import dataio
+from limits import ProgramError
+
+def error_for(text):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "data.txt")
+        with open(path, "w") as f:
+            f.write(text)
+        try:
+            dataio.load_txt(path)
+        except ProgramError as e:
+            return str(e).replace(path, "data.txt")
+    return None
+
+def test_load_txt_reports_line_of_bad_value():
+    assert error_for("1 2\n3 x 4\n") == "data.txt:2: 'x' is not an integer"
+    assert error_for("1\n2\n\n4999950000\n") == "data.txt:4: 4999950000 does not fit in int32"
+    assert error_for("-2147483649\n") == "data.txt:1: -2147483649 does not fit in int32"
+    assert error_for("2147483647 -2147483648\n") is None
+
+def test_save_rejects_value_outside_int32():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "data.bin")
+        try:
+            dataio.save_bin(path, [[1, 2], [3, 2 ** 31]])
+        except ProgramError as e:
+            assert str(e) == f"{path}: cannot save 2147483648, it does not fit in int32"
+        else:
+            assert False, "save_bin accepted a value outside int32"
+
+if __name__ == "__main__":
+    test_load_txt_reports_line_of_bad_value()
+    test_save_rejects_value_outside_int32()
+    print("ok")
@@ -0,0 +1,104 @@
+# Resource limits must hold inside `parallel for` bodies, which run on worker
+# processes (interpreter) or threads (JIT): a body that never finishes is
+# stopped by --timeout like any other loop. The call depth limit must fail
+# the same way in every engine, and JIT code must have the native stack the
+# limit allows for.
+#
+#   python test_limits.py   (or pytest test_limits.py)
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ENDLESS = """
+func main() {
+    var a[8];
+    parallel for (var i = 0; i < 8; i = i + 1) {
+        var x = 0;
+        while (1) { x = x + 1; }
+        a[i] = x;
+    }
+    print(a[0]);
+}
+"""
+
+SUMS = """
+func sq(x) { return x * x; }
+func main() {
+    var a[400];
+    parallel for (var i = 0; i < 400; i = i + 1) {
+        var j = 0;
+        var t = 0;
+        while (j < 10) { t = t + sq(j); j = j + 1; }
+        a[i] = t + i;
+    }
+    print(a[399]);
+}
+"""
+
+DEEP = """
+func depth(n) {
+    if (n == 0) { return 0; }
+    return 1 + depth(n - 1);
+}
+func main() {
+    print(1);
+    print(depth(%d));
+}
+"""
+
+def run(source, mode, *options):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "prog.my")
+        with open(path, "w") as f:
+            f.write(source)
+        # the guard only matters if the limit is ignored
+        return subprocess.run([sys.executable, os.path.join(HERE, "main.py"), mode, path, *options],
+                              capture_output=True, text=True, timeout=60)
+
+def limit_error(proc):
+    return json.loads(proc.stderr.strip().splitlines()[-1])
+
+def test_timeout_stops_endless_parallel_body():
+    for mode in ("interpret", "compile"):
+        for workers in ("1", "2"):
+            proc = run(ENDLESS, mode, "--timeout", "0.5", "--workers", workers)
+            assert proc.returncode == 3, (mode, workers, proc.stderr)
+            assert limit_error(proc)["kind"] == "time", (mode, workers)
+
+def test_statement_limit_counts_parallel_body():
+    # 400 iterations of about 56 statements: the same count however the loop is split
+    for mode in ("interpret", "compile"):
+        for workers in ("1", "2"):
+            proc = run(SUMS, mode, "--max-statements", "5000", "--workers", workers)
+            assert proc.returncode == 3, (mode, workers, proc.stderr)
+            assert limit_error(proc)["kind"] == "statements", (mode, workers)
+            proc = run(SUMS, mode, "--max-statements", "100000", "--workers", workers)
+            assert proc.returncode == 0, (mode, workers, proc.stderr)
+            assert proc.stdout.split()[-1] == "684", (mode, workers)
+
+def test_call_depth_error_matches_across_engines():
+    for mode in ("interpret", "compile"):
+        proc = run(DEEP % 20000, mode)
+        assert proc.returncode == 1, (mode, proc.stderr)
+        assert proc.stdout.split()[-1] == "1", mode
+        assert proc.stderr.strip() == "[Error] maximum call depth 10000 exceeded in depth()", (mode, proc.stderr)
+
+def test_jit_stack_holds_max_depth():
+    # a million frames need more than the usual 8 MiB main thread stack
+    proc = run(DEEP % 1000000, "compile", "--max-depth", "1200000")
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.split()[-1] == "1000000"
+    proc = run(DEEP % 1000000, "compile", "--max-depth", "100000000")
+    assert proc.returncode == 2, proc.stderr
+    assert "--max-depth 100000000 is more than JIT code can reach" in proc.stderr
+
+if __name__ == "__main__":
+    test_timeout_stops_endless_parallel_body()
+    test_statement_limit_counts_parallel_body()
+    test_call_depth_error_matches_across_engines()
+    test_jit_stack_holds_max_depth()
+    print("ok")
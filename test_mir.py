@@ -0,0 +1,125 @@
+# Each MIR pass must make the rewrite it exists for and leave valid SSA that
+# computes the same output as the AST interpreter.
+#
+#   python test_mir.py   (or pytest test_mir.py)
+import io
+import os
+import re
+
+from lexer import lex
+from parser import Parser
+from interpreter import Interpreter
+from mir import build_program, dump_module
+from mir_opt import PASSES, DEFAULT_PASSES, optimize
+from mir_interp import MirInterpreter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# n and m are not constants, so copyprop cannot fold n * m away before LICM
+SOURCE = """
+func main() {
+    var a[10];
+    var n = len(a);
+    var m = a[0] + 3;
+    var unused = n - m;
+    for (var i = 0; i < n; i = i + 1) {
+        a[i] = n * m + i * 4 + n * m;
+    }
+    print(a[9]);
+}
+"""
+
+def build(source):
+    return build_program(Parser(lex(source)).parse())
+
+def blocks(module):
+    # block name -> its instructions from the dump, without result names and
+    # with operands reduced to the source variable ("%i.6" -> "%i", "%7" -> "%")
+    out, current = {}, None
+    for line in dump_module(module).splitlines():
+        if line.startswith("  "):
+            text = re.sub(r"^%[\w.]+ = ", "", line.strip())
+            out[current].append(re.sub(r"%(?:([A-Za-z_]\w*)\.\d+|\d+)", r"%\1", text))
+        elif line.endswith(":") or "; preds" in line:
+            current = line.split(":")[0]
+            out[current] = []
+    return out
+
+def run(module):
+    out = io.StringIO()
+    MirInterpreter(module, out=out).run()
+    return out.getvalue()
+
+def apply(module, name):
+    before = blocks(module)
+    changes = optimize(module, (name,), check=True)[name]
+    return before, blocks(module), changes
+
+def test_copyprop_forwards_copies_and_phis():
+    module = build(SOURCE)
+    before, after, changes = apply(module, 'copyprop')
+    assert "copy 0" in before["entry"] and "phi [%n, entry], [%n, loop.body]" in before["loop.cond"]
+    assert not any(t.startswith("copy") for b in after.values() for t in b)
+    assert [t for t in after["loop.cond"] if t.startswith("phi")] == ["phi [0, entry], [%i, loop.body]"]
+    assert changes == 4
+    assert run(module) == "96\n"
+
+def test_cse_merges_repeated_product():
+    module = build(SOURCE)
+    optimize(module, ('copyprop',))
+    before, after, changes = apply(module, 'cse')
+    assert before["loop.body"].count("mul %n, %m") == 2
+    assert after["loop.body"].count("mul %n, %m") == 1
+    assert changes == 1
+
+def test_licm_hoists_invariant_product():
+    module = build(SOURCE)
+    optimize(module, ('copyprop', 'cse'))
+    before, after, changes = apply(module, 'licm')
+    assert "mul %n, %m" in before["loop.body"] and "mul %n, %m" not in before["entry"]
+    assert "mul %n, %m" not in after["loop.body"] and "mul %n, %m" in after["entry"]
+    assert changes == 1
+    assert run(module) == "96\n"
+
+def test_sr_turns_index_times_four_into_induction_variable():
+    module = build(SOURCE)
+    optimize(module, ('copyprop', 'cse', 'licm'))
+    before, after, changes = apply(module, 'sr')
+    assert "mul %i, 4" in before["loop.body"]
+    assert not any(t.startswith("mul") for t in after["loop.body"])
+    # start and stride in the preheader, the new variable stepped at the latch
+    assert after["entry"][-3:-1] == ["mul 0, 4", "mul 1, 4"]
+    assert "phi [%, entry], [%, loop.body]" in after["loop.cond"]
+    assert after["loop.body"][-4:-2] == ["add %i, 1", "add %, %"]
+    assert changes == 1
+    assert run(module) == "96\n"
+
+def test_dce_drops_unused_value():
+    module = build(SOURCE)
+    optimize(module, ('copyprop',))
+    before, after, changes = apply(module, 'dce')
+    assert "sub %n, %m" in before["entry"]
+    assert "sub %n, %m" not in after["entry"]
+    assert changes == 1
+
+def test_passes_preserve_benchmark_output():
+    # every pass on its own and the default pipeline, verified after each pass
+    directory = os.path.join(HERE, "benchmarks", "programs")
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as f:
+            source = f.read()
+        expected = io.StringIO()
+        Interpreter(Parser(lex(source)).parse(), out=expected).run()
+        for passes in [(p,) for p in PASSES] + [DEFAULT_PASSES]:
+            module = build(source)
+            optimize(module, passes, check=True)
+            assert run(module) == expected.getvalue(), (name, passes)
+
+if __name__ == "__main__":
+    test_copyprop_forwards_copies_and_phis()
+    test_cse_merges_repeated_product()
+    test_licm_hoists_invariant_product()
+    test_sr_turns_index_times_four_into_induction_variable()
+    test_dce_drops_unused_value()
+    test_passes_preserve_benchmark_output()
+    print("ok")
@@ -0,0 +1,73 @@
+# The perf map written for JIT code must list every emitted function at the
+# address the execution engine gave it, with the size from the object file.
+#
+#   python test_perfmap.py   (or pytest test_perfmap.py)
+import os
+import tempfile
+
+from llvmlite import binding
+
+from lexer import lex
+from parser import Parser
+from codegen import CodeGen, promote_locals
+from perfmap import PerfRecorder, function_symbols
+
+SOURCE = """
+func fib(n) {
+    if (n < 2) { return n; }
+    return fib(n - 1) + fib(n - 2);
+}
+func main() {
+    var out[8];
+    parallel for (var i = 0; i < 8; i = i + 1) {
+        out[i] = i * i;
+    }
+    print(fib(10) + out[7]);
+}
+"""
+
+def jit_with_perf_map(directory):
+    # what CodeGen.run_jit does with a recorder, keeping the engine and the object
+    cg = CodeGen(perf=True, source_name="perf_test.my")
+    cg.generate(Parser(lex(SOURCE)).parse())
+    target_machine = binding.Target.from_default_triple().create_target_machine()
+    llvm_mod = binding.parse_assembly(str(cg.module))
+    promote_locals(llvm_mod)
+    engine = binding.create_mcjit_compiler(llvm_mod, target_machine)
+    objects = []
+    engine.set_object_cache(lambda module, buf: objects.append(buf))
+    engine.finalize_object()
+    perf = PerfRecorder(perf_map=True, directory=directory)
+    try:
+        cg.report_perf(engine, objects, perf)
+    finally:
+        perf.close()
+    return engine, objects
+
+def read_perf_map(path):
+    # "START SIZE name [source]" lines, hex without 0x
+    entries = {}
+    with open(path) as f:
+        for line in f:
+            addr, size, symbol = line.rstrip("\n").split(" ", 2)
+            name, source = symbol.rsplit(" [", 1)
+            assert source == "perf_test.my]", line
+            entries[name] = (int(addr, 16), int(size, 16))
+    return entries
+
+def test_perf_map_lists_emitted_symbols():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine, objects = jit_with_perf_map(tmpdir)
+        entries = read_perf_map(os.path.join(tmpdir, f"perf-{os.getpid()}.map"))
+    assert len(objects) == 1
+    sizes = function_symbols(objects[0])
+    assert {"main", "fib", "main.parallel0"} <= set(sizes)
+    # every function in the object is listed, and nothing else
+    assert set(entries) == {name for name in sizes if engine.get_function_address(name)}
+    for name, (addr, size) in entries.items():
+        assert addr == engine.get_function_address(name), name
+        assert size == sizes[name] > 0, name
+
+if __name__ == "__main__":
+    test_perf_map_lists_emitted_symbols()
+    print("ok")